@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Parser benchmark: DnstestParser.parse_line() against parse_line_pyparsing() on a synthetic change file
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+import optparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+from pydnstest.parser import DnstestParser  # noqa: E402
+from pydnstest.version import VERSION  # noqa: E402
+
+
+def time_parse(parse, lines, repeat):
+    """
+    Parse every line repeat times, returning the fastest pass's time per
+    line in microseconds
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for line in lines:
+            parse(line)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1000000.0 / len(lines)
+
+
+def parse_opts(argv=None):
+    p = optparse.OptionParser(usage='%prog [options]')
+    p.add_option('-n', '--lines', dest='lines', type='int', default=30000,
+                 help='number of synthetic input lines to parse (default 30000)')
+    p.add_option('-r', '--repeat', dest='repeat', type='int', default=3,
+                 help='number of passes over the lines per parser; the fastest is kept (default 3)')
+    p.add_option('-o', '--output', dest='output', help='write the JSON results to this file instead of stdout')
+    options, args = p.parse_args(argv)
+    return options
+
+
+def main(argv=None):
+    """
+    Time both parsers on the same lines and print (or write) the time per
+    line of each, and the speedup, as JSON
+    """
+    options = parse_opts(argv)
+    lines = synthetic.generate(options.lines)[0]
+    parser = DnstestParser()
+    # build the pyparsing grammar outside of the timed passes
+    parser.parse_line_pyparsing(lines[0])
+    results = {}
+    for name, parse in (('parse_line', parser.parse_line), ('parse_line_pyparsing', parser.parse_line_pyparsing)):
+        results[name] = round(time_parse(parse, lines, options.repeat), 3)
+        sys.stderr.write('%s: %s us/line\n' % (name, results[name]))
+    report = {'pydnstest': VERSION, 'python': sys.version.split()[0], 'lines': options.lines,
+              'repeat': options.repeat, 'us_per_line': results,
+              'speedup': round(results['parse_line_pyparsing'] / results['parse_line'], 1)}
+    if options.output:
+        with open(options.output, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
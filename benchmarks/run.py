@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the pydnstest pipeline: lines and queries per second, per-line latency and peak RSS
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+import synthetic  # noqa: E402
+from pydnstest.cassette import Cassette  # noqa: E402
+from pydnstest.checks import DNStestChecks  # noqa: E402
+from pydnstest.config import DnstestConfig  # noqa: E402
+from pydnstest.main import run_check_line, run_lines_concurrently, run_lines_async  # noqa: E402
+from pydnstest.parser import DnstestParser  # noqa: E402
+from pydnstest.snapshot import SnapshotSet  # noqa: E402
+from pydnstest.version import VERSION  # noqa: E402
+from pydnstest.zonefile import ZoneFileIndex  # noqa: E402
+
+"""
+backend -> (how lines are run, whether it needs the stand-in servers)
+
+server*: queries go over the network to a StandInServer per side
+snapshot: answered from zone snapshots transferred from the stand-in servers
+zonefile: answered from indexed zone files, no servers at all
+replay: answered from a cassette recorded in an (untimed) first pass
+"""
+BACKENDS = {'server': ('serial', True),
+            'server-threads': ('threads', True),
+            'server-async': ('async', True),
+            'snapshot': ('serial', True),
+            'zonefile': ('serial', False),
+            'replay': ('serial', True)}
+
+DEFAULT_SIZES = '1000,10000,100000'
+
+
+class CountingChecks(DNStestChecks):
+    """
+    DNStestChecks that counts the lookups (resolve_name / lookup_reverse
+    calls) its checks make, whichever backend answers them, and times each
+    check from its first lookup to its result.
+
+    pydnstest always queries port 53, which only root can listen on, so
+    each lookup is sent to the port in ``ports`` (server -> port) that its
+    server's stand-in listens on instead.
+    """
+
+    def __init__(self, config, ports):
+        DNStestChecks.__init__(self, config)
+        self.ports = ports
+        self.lookups = 0
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def steps(self, method, *args):
+        res, gen = DNStestChecks.steps(self, method, *args)
+        return res, self._count(gen)
+
+    def _count(self, gen):
+        start = time.time()
+        answers = None
+        while True:
+            try:
+                queries = gen.send(answers)
+            except StopIteration:
+                break
+            with self._lock:
+                self.lookups += len(queries)
+            # (method, name, server) -> (method, name, server, port)
+            answers = yield [q + (self.ports[q[2]],) for q in queries]
+        with self._lock:
+            self.latencies.append(time.time() - start)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return rss
+
+
+def make_checks(options, ports):
+    config = DnstestConfig()
+    config.server_test = options.test_addr
+    config.server_prod = options.prod_addr
+    config.default_domain = '.' + synthetic.ZONE
+    config.have_reverse_dns = True
+    return CountingChecks(config, dict(zip((options.test_addr, options.prod_addr), ports)))
+
+
+def pipeline(mode, lines, parser, chk, jobs):
+    if mode == 'threads':
+        return run_lines_concurrently(lines, parser, chk, jobs=jobs)
+    if mode == 'async':
+        return run_lines_async(lines, parser, chk, jobs=jobs)
+    return (run_check_line(line, parser, chk) for line in lines)
+
+
+def timed_run(mode, lines, chk, jobs):
+    """
+    Run lines through the pipeline, returning (seconds, sorted per-line
+    check latencies, passed, failed). A line's latency is the time its
+    check took, from its first lookup to its result (so not counting time
+    spent queued behind other lines with --jobs).
+    """
+    parser = DnstestParser()
+    chk.latencies = []
+    passed = failed = 0
+    start = time.time()
+    for r in pipeline(mode, lines, parser, chk, jobs):
+        if isinstance(r, dict) and r['result']:
+            passed += 1
+        else:
+            failed += 1
+    return time.time() - start, sorted(chk.latencies), passed, failed
+
+
+def run_case(backend, size, options):
+    """
+    Run one benchmark case in this process, returning its result dict
+    """
+    from pydnstest.testserver import StandInServer
+    mode, needs_servers = BACKENDS[backend]
+    lines, test, prod = synthetic.generate(size, seed=options.seed)
+    result = {'backend': backend, 'lines': size}
+    servers = []
+    # without servers (zonefile), any two ports tell the sides apart
+    ports = (options.test_port or 53, options.prod_port or 54)
+    workdir = tempfile.mkdtemp(prefix='pydnstest-bench-')
+    try:
+        if needs_servers:
+            for records, addr, port in ((test, options.test_addr, options.test_port),
+                                        (prod, options.prod_addr, options.prod_port)):
+                try:
+                    servers.append(StandInServer(records, host=addr, port=port).start())
+                except (OSError, IOError) as e:
+                    result['skipped'] = 'could not listen on %s port %d: %s' % (addr, port, e)
+                    return result
+            ports = tuple(s.port for s in servers)
+        chk = make_checks(options, ports)
+        if backend == 'snapshot':
+            chk.DNS.snapshots = SnapshotSet()
+            for addr, port in zip((options.test_addr, options.prod_addr), ports):
+                for zone in (synthetic.ZONE, synthetic.REVERSE_ZONE):
+                    chk.DNS.snapshots.load(zone, addr, port)
+        elif backend == 'zonefile':
+            chk.DNS.snapshots = SnapshotSet()
+            for records, addr, port, prefix in ((test, options.test_addr, ports[0], 'test'),
+                                                (prod, options.prod_addr, ports[1], 'prod')):
+                for path in synthetic.write_zone_files(records, workdir, prefix):
+                    chk.DNS.snapshots.add(addr, ZoneFileIndex(path), port)
+        elif backend == 'replay':
+            path = os.path.join(workdir, 'cassette')
+            chk.DNS.cassette = Cassette(path)
+            timed_run(mode, lines, chk, options.jobs)
+            chk.DNS.cassette.close()
+            chk = make_checks(options, ports)
+            chk.DNS.cassette = Cassette(path, replay=True)
+        before = sum(s.queries for s in servers)
+        seconds, latencies, passed, failed = timed_run(mode, lines, chk, options.jobs)
+        chk.DNS.close()
+        queries = sum(s.queries for s in servers) - before
+        result.update({
+            'jobs': options.jobs if mode != 'serial' else 1,
+            'seconds': round(seconds, 4),
+            'lines_per_sec': round(size / seconds, 1),
+            'lookups': chk.lookups,
+            'lookups_per_sec': round(chk.lookups / seconds, 1),
+            'queries': queries,
+            'queries_per_sec': round(queries / seconds, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'passed': passed,
+            'failed': failed,
+            'peak_rss_kb': peak_rss_kb(),
+        })
+        return result
+    finally:
+        for s in servers:
+            s.stop()
+        for f in os.listdir(workdir):
+            os.remove(os.path.join(workdir, f))
+        os.rmdir(workdir)
+
+
+def parse_opts(argv=None):
+    p = optparse.OptionParser(usage='%prog [options]')
+    p.add_option('--sizes', dest='sizes', default=DEFAULT_SIZES,
+                 help='comma-separated numbers of input lines (default %s)' % DEFAULT_SIZES)
+    p.add_option('--backends', dest='backends', default=','.join(sorted(BACKENDS)),
+                 help='comma-separated backends to run (default all: %s)' % ', '.join(sorted(BACKENDS)))
+    p.add_option('-j', '--jobs', dest='jobs', type='int', default=32,
+                 help='lines in flight at once for server-threads and server-async (default 32)')
+    p.add_option('--test-addr', dest='test_addr', default='127.0.0.2',
+                 help='loopback address for the TEST stand-in server (default 127.0.0.2)')
+    p.add_option('--prod-addr', dest='prod_addr', default='127.0.0.3',
+                 help='loopback address for the PROD stand-in server (default 127.0.0.3)')
+    p.add_option('--test-port', dest='test_port', type='int', default=0,
+                 help='port for the TEST stand-in server (default 0: any free port)')
+    p.add_option('--prod-port', dest='prod_port', type='int', default=0,
+                 help='port for the PROD stand-in server (default 0: any free port)')
+    p.add_option('--seed', dest='seed', type='int', default=1, help='random seed for the change files')
+    p.add_option('-o', '--output', dest='output', help='write the JSON results to this file instead of stdout')
+    p.add_option('--case', dest='case', nargs=2, metavar='BACKEND LINES', help=optparse.SUPPRESS_HELP)
+    options, args = p.parse_args(argv)
+    if options.test_addr == options.prod_addr:
+        # the checks tell the servers apart by address
+        p.error('--test-addr and --prod-addr must be different')
+    unknown = set(options.backends.split(',')) - set(BACKENDS)
+    if unknown:
+        p.error('unknown backend(s): %s' % ', '.join(sorted(unknown)))
+    return options
+
+
+def main(argv=None):
+    """
+    Run every (backend, size) case in its own process, so that each one's
+    peak RSS is its own, and print (or write) all of the results as JSON
+    """
+    options = parse_opts(argv)
+    if options.case:
+        print(json.dumps(run_case(options.case[0], int(options.case[1]), options)))
+        return
+    results = []
+    for size in [int(s) for s in options.sizes.split(',')]:
+        for backend in options.backends.split(','):
+            cmd = [sys.executable, os.path.abspath(__file__), '--case', backend, str(size),
+                   '--jobs', str(options.jobs), '--test-addr', options.test_addr,
+                   '--prod-addr', options.prod_addr, '--test-port', str(options.test_port),
+                   '--prod-port', str(options.prod_port), '--seed', str(options.seed)]
+            out = subprocess.check_output(cmd).decode('utf-8')
+            r = json.loads(out.strip().splitlines()[-1])
+            sys.stderr.write('%s\n' % json.dumps(r))
+            results.append(r)
+    report = {'pydnstest': VERSION, 'python': sys.version.split()[0], 'results': results}
+    if options.output:
+        with open(options.output, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
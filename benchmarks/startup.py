@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Startup benchmarks of the pydnstest command: import time and wall time of short runs
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+from pydnstest.version import VERSION  # noqa: E402
+
+SCRIPT = os.path.join(ROOT, 'bin', 'pydnstest')
+
+CONFIG = "[servers]\nprod: 127.0.0.3\ntest: 127.0.0.2\n[defaults]\nhave_reverse_dns: True\ndomain: .%s\nignore_ttl: False\n"
+
+"""
+case -> command line, relative to the interpreter; {dir} is the work directory
+
+python: the bare interpreter, for comparison
+import: importing pydnstest.main
+tiny-file: checking a 5-line file against zone files, with no network
+"""
+CASES = [
+    ('python', ['-c', 'pass']),
+    ('import', ['-c', 'import pydnstest.main']),
+    ('version', [SCRIPT, '--version']),
+    ('help', [SCRIPT, '--help']),
+    ('example-config', [SCRIPT, '--example-config']),
+    ('configprint', [SCRIPT, '-c', '{dir}/dnstest.ini', '--configprint']),
+    ('tiny-file', [SCRIPT, '-c', '{dir}/dnstest.ini', '-f', '{dir}/tiny.txt',
+                   '--test-zone-file', '{dir}/test.%s.zone' % synthetic.ZONE,
+                   '--test-zone-file', '{dir}/test.%s.zone' % synthetic.REVERSE_ZONE,
+                   '--prod-zone-file', '{dir}/prod.%s.zone' % synthetic.ZONE,
+                   '--prod-zone-file', '{dir}/prod.%s.zone' % synthetic.REVERSE_ZONE]),
+]
+
+
+def write_inputs(workdir):
+    """
+    Write the config, 5-line change file and zone files the cases use
+    """
+    lines, test, prod = synthetic.generate(5)
+    with open(os.path.join(workdir, 'dnstest.ini'), 'w') as fh:
+        fh.write(CONFIG % synthetic.ZONE)
+    with open(os.path.join(workdir, 'tiny.txt'), 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+    synthetic.write_zone_files(test, workdir, 'test')
+    synthetic.write_zone_files(prod, workdir, 'prod')
+
+
+def time_case(args, repeat, env, workdir):
+    """
+    Run the interpreter with args repeat times (in workdir, so that python -c
+    doesn't import pydnstest from the current directory), returning the
+    sorted wall times in ms
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for i in range(repeat):
+            start = time.time()
+            rc = subprocess.call([sys.executable] + args, stdout=devnull, stderr=devnull, env=env, cwd=workdir)
+            times.append((time.time() - start) * 1000.0)
+            if rc != 0:
+                raise RuntimeError('%s exited %d' % (' '.join(args), rc))
+    return sorted(times)
+
+
+def import_profile(env, workdir):
+    """
+    Return {module: cumulative ms} for the modules imported directly by
+    pydnstest.main, from python -X importtime (Python 3.7+), or None
+    """
+    if sys.version_info < (3, 7):
+        return None
+    p = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import pydnstest.main'],
+                         stderr=subprocess.PIPE, env=env, cwd=workdir)
+    err = p.communicate()[1].decode('utf-8')
+    # children are listed before their parent, one level deeper
+    children = {}
+    for line in err.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        if self_us.strip() == 'self [us]':
+            continue
+        depth = (len(name) - len(name.lstrip()) + 1) // 2
+        name = name.strip()
+        if depth == 1:
+            if name == 'pydnstest.main':
+                return children
+            children = {}
+        elif depth == 2:
+            children[name] = round(int(cumulative) / 1000.0, 3)
+    return None
+
+
+def parse_opts(argv=None):
+    p = optparse.OptionParser(usage='%prog [options]')
+    p.add_option('-r', '--repeat', dest='repeat', type='int', default=20,
+                 help='number of times to run each case (default 20)')
+    p.add_option('-o', '--output', dest='output', help='write the JSON results to this file instead of stdout')
+    options, args = p.parse_args(argv)
+    return options
+
+
+def main(argv=None):
+    """
+    Time each case and print (or write) the median and minimum wall times,
+    and the import time of each module pydnstest.main imports, as JSON
+    """
+    options = parse_opts(argv)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    workdir = tempfile.mkdtemp()
+    results = []
+    try:
+        write_inputs(workdir)
+        for name, args in CASES:
+            times = time_case([a.format(dir=workdir) for a in args], options.repeat, env, workdir)
+            r = {'case': name, 'median_ms': round(times[len(times) // 2], 3), 'min_ms': round(times[0], 3)}
+            sys.stderr.write('%s\n' % json.dumps(r))
+            results.append(r)
+        imports = import_profile(env, workdir)
+    finally:
+        shutil.rmtree(workdir)
+    report = {'pydnstest': VERSION, 'python': sys.version.split()[0], 'repeat': options.repeat,
+              'results': results, 'imports_ms': imports}
+    if options.output:
+        with open(options.output, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Synthetic change files and zone data for the pydnstest benchmarks
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import optparse
+import os
+import random
+
+ZONE = 'bench.example.com'
+REVERSE_ZONE = '10.in-addr.arpa'
+SOA = 'ns1.%s hostmaster.%s 1 3600 600 86400 60' % (ZONE, ZONE)
+
+# operation -> share of input lines, roughly what a typical change set looks like
+MIX = (('add', 0.35), ('change', 0.20), ('confirm', 0.20), ('remove', 0.15), ('rename', 0.10))
+
+
+def address(i):
+    return '10.%d.%d.%d' % ((i >> 16) & 255, (i >> 8) & 255, i & 255)
+
+
+def reverse(addr):
+    a = addr.split('.')
+    a.reverse()
+    return '.'.join(a) + '.in-addr.arpa'
+
+
+def host(i):
+    return 'host%d.%s' % (i, ZONE)
+
+
+def _records():
+    return {ZONE: [('SOA', SOA), ('NS', 'ns1.' + ZONE)],
+            'ns1.' + ZONE: [('A', '10.255.255.254')],
+            REVERSE_ZONE: [('SOA', SOA), ('NS', 'ns1.' + ZONE)]}
+
+
+def _a(records, name, addr):
+    records.setdefault(name, []).append(('A', addr))
+    records.setdefault(reverse(addr), []).append(('PTR', name))
+
+
+def generate(lines, seed=1):
+    """
+    Return (input lines, test records, prod records) for a synthetic change
+    set of the given number of lines, where records are dicts of name ->
+    list of (typename, data) as taken by pydnstest.testserver.StandInServer.
+    The servers' records are set up so that every line should pass.
+    """
+    rnd = random.Random(seed)
+    test = _records()
+    prod = _records()
+    out = []
+    n = 0
+    for i in range(lines):
+        r = rnd.random()
+        for op, share in MIX:
+            if r < share:
+                break
+            r -= share
+        name = host(n)
+        addr = address(n)
+        n += 1
+        if op == 'add':
+            if rnd.random() < 0.1:
+                # an alias for an existing name
+                test.setdefault(name, []).append(('CNAME', 'ns1.' + ZONE))
+                out.append('add %s with value ns1.%s' % (name, ZONE))
+            else:
+                _a(test, name, addr)
+                out.append('add record %s with address %s' % (name, addr))
+        elif op == 'change':
+            new = address(n)
+            n += 1
+            _a(prod, name, addr)
+            _a(test, name, new)
+            out.append('change %s to %s' % (name, new))
+        elif op == 'confirm':
+            _a(prod, name, addr)
+            _a(test, name, addr)
+            out.append('confirm %s' % name)
+        elif op == 'remove':
+            _a(prod, name, addr)
+            out.append('remove %s' % name)
+        else:
+            newname = host(n)
+            n += 1
+            _a(prod, name, addr)
+            _a(test, newname, addr)
+            out.append('rename %s with value %s to %s' % (name, addr, newname))
+    return out, test, prod
+
+
+def write_zone_files(records, directory, prefix):
+    """
+    Write records (as returned by generate()) as one BIND zone file per
+    zone, returning a list of their paths
+    """
+    paths = []
+    for zone in (ZONE, REVERSE_ZONE):
+        path = os.path.join(directory, '%s.%s.zone' % (prefix, zone))
+        with open(path, 'w') as fh:
+            fh.write('$ORIGIN %s.\n$TTL 300\n' % zone)
+            for name in sorted(records):
+                if name != zone and not name.endswith('.' + zone):
+                    continue
+                for typename, data in records[name]:
+                    if typename in ('CNAME', 'PTR', 'NS'):
+                        data += '.'
+                    elif typename == 'SOA':
+                        f = data.split()
+                        data = ' '.join([f[0] + '.', f[1] + '.'] + f[2:])
+                    fh.write('%s. %s %s\n' % (name, typename, data))
+        paths.append(path)
+    return paths
+
+
+def main():
+    p = optparse.OptionParser(usage='%prog [options] LINES')
+    p.add_option('-d', '--directory', dest='directory', default='.',
+                 help='where to write the change file and test/prod zone files')
+    p.add_option('--seed', dest='seed', type='int', default=1, help='random seed (default 1)')
+    options, args = p.parse_args()
+    if len(args) != 1 or not args[0].isdigit():
+        p.error('give the number of lines to generate')
+    lines, test, prod = generate(int(args[0]), seed=options.seed)
+    path = os.path.join(options.directory, 'changes-%s.txt' % args[0])
+    with open(path, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+    print(path)
+    for prefix, records in (('test', test), ('prod', prod)):
+        for zf in write_zone_files(records, options.directory, prefix):
+            print(zf)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+asyncio DNS lookup methods for pydnstest - non-blocking counterpart of dns.py
+
+This module uses async/await and requires Python 3.5+; nothing else in
+pydnstest imports it unless asked to (i.e. by the --async option).
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import time
+from collections import deque
+
+import DNS
+
+from pydnstest.dns import reverse_name
+from pydnstest.trace import HIT, MISS, REPLAY
+from pydnstest.transport import new_query_id, reply_id
+from pydnstest.wire import QueryEncoder, decode_reply
+
+try:
+    _running_loop = asyncio.get_running_loop
+except AttributeError:  # python < 3.7
+    _running_loop = asyncio.get_event_loop
+
+
+class _UDPClient(asyncio.DatagramProtocol):
+    """
+    A single non-blocking UDP socket to one (server, port), shared by all
+    queries to that server. Replies are matched to the waiting query by
+    transaction ID.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        fut = self.pending.pop(reply_id(data), None)
+        if fut is not None and not fut.done():
+            fut.set_result(data)
+
+    def error_received(self, exc):
+        # i.e. ICMP port unreachable; fail everything waiting on this socket
+        self._fail_pending(DNS.SocketError(exc))
+
+    def connection_lost(self, exc):
+        self._fail_pending(DNS.SocketError(exc or 'connection closed'))
+
+    def _fail_pending(self, exc):
+        for fut in self.pending.values():
+            if not fut.done():
+                fut.set_exception(exc)
+        self.pending.clear()
+
+
+class AsyncDNStestDNS(object):
+    """
+    Coroutine versions of the DNStestDNS lookup methods. Any number of
+    queries can be in flight at once from a single thread; they return
+    exactly the same dicts as their DNStestDNS counterparts.
+    """
+
+    def __init__(self, timeout=None, parallel_lookups=False, cache=None, rtt=None, limiter=None,
+                 snapshots=None, cassette=None, timings=None, metrics=None, trace=None):
+        """
+        @param timeout seconds to wait for each reply (default: pydns' default)
+        @param parallel_lookups if True, resolve_name sends its A and CNAME
+          queries at the same time instead of one after the other
+        @param cache optional pydnstest.cache.QueryCache to answer repeated
+          queries from; it may be shared with a DNStestDNS
+        @param rtt optional pydnstest.rtt.RTTEstimator; if given, its
+          per-server timeouts and retransmissions are used instead of timeout
+        @param limiter optional pydnstest.ratelimit.RateLimiter to pace the
+          queries sent to each server
+        @param snapshots optional pydnstest.snapshot.SnapshotSet to answer
+          names in its zones from, instead of querying the server
+        @param cassette optional pydnstest.cassette.Cassette to record every
+          query result to or, in replay mode, to answer every query from
+        @param timings optional pydnstest.timings.Timings to record the
+          queries sent to each server in
+        @param metrics optional pydnstest.metrics.QueryMetrics to record the
+          latency and outcome of each query sent in
+        @param trace optional pydnstest.trace.QueryTrace to log every query to
+        """
+        if timeout is None:
+            timeout = DNS.defaults['timeout']
+        self.timeout = timeout
+        self.rtt = rtt
+        self.limiter = limiter
+        self.snapshots = snapshots
+        self.cassette = cassette
+        self.timings = timings
+        self.metrics = metrics
+        self.trace = trace
+        self.parallel_lookups = parallel_lookups
+        self.cache = cache
+        self.coalesced = 0
+        # (server, port) -> Future of (transport, _UDPClient)
+        self._clients = {}
+        # (name, server, port, qtype) -> Task of the query in flight
+        self._inflight = {}
+        # everything runs on one thread, so one encoder will do
+        self._encoder = QueryEncoder()
+
+    def _client(self, server, port):
+        key = (server, port)
+        if key not in self._clients:
+            loop = _running_loop()
+            self._clients[key] = asyncio.ensure_future(
+                loop.create_datagram_endpoint(_UDPClient, remote_addr=(server, port)))
+        return self._clients[key]
+
+    async def query(self, name, to_server, qtype, to_port=53):
+        """
+        Send a single query (unless it's cached, or the same query is already
+        in flight), returning the pydns DnsResult
+        """
+        key = (name, to_server, to_port, qtype)
+        if self.trace is not None:
+            return await self._traced_query(key)
+        if self.cassette is not None and self.cassette.replay:
+            return self.cassette.get(key)
+        if self.cache is not None:
+            a = self.cache.get(key)
+            if a is not None:
+                return a
+        return await self._query_server(key)
+
+    async def _traced_query(self, key):
+        """
+        query() for a (name, server, port, qtype) key, logging it to self.trace
+        """
+        start = time.time()
+        a = None
+        cache = MISS
+        try:
+            if self.cassette is not None and self.cassette.replay:
+                cache = REPLAY
+                a = self.cassette.get(key)
+            else:
+                if self.cache is not None:
+                    a = self.cache.get(key)
+                if a is not None:
+                    cache = HIT
+                else:
+                    a = await self._query_server(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.trace.query(key, start, None, cache, e)
+            raise
+        self.trace.query(key, start, a, cache)
+        return a
+
+    async def _query_server(self, key):
+        """
+        Send the query for a (name, server, port, qtype) key, or wait for the
+        same query already in flight
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._send(key))
+            task.add_done_callback(lambda t: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # one waiter being cancelled mustn't cancel the query for the others
+        return await asyncio.shield(task)
+
+    async def _send(self, key):
+        """
+        Send the query for a (name, server, port, qtype) key, caching the result
+        """
+        name, to_server, to_port, qtype = key
+        if self.limiter is not None:
+            delay = self.limiter.delay(to_server, to_port)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        transport, client = await self._client(to_server, to_port)
+        tid = new_query_id(client.pending)
+        fut = _running_loop().create_future()
+        client.pending[tid] = fut
+        if self.rtt is None:
+            timeout, retries = self.timeout, 0
+        else:
+            timeout, retries = self.rtt.rto(to_server, to_port), self.rtt.retries
+        start = time.time()
+        attempt = 0
+        try:
+            while True:
+                # same ID each time, so that a late reply to the first send still counts
+                transport.sendto(self._encoder.encode(tid, name, qtype))
+                try:
+                    reply = await asyncio.wait_for(asyncio.shield(fut), timeout)
+                    break
+                except asyncio.TimeoutError:
+                    if attempt >= retries:
+                        raise DNS.TimeoutError('Timeout')
+                    attempt += 1
+                    timeout = self.rtt.backoff(timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.failed(to_server, qtype, e)
+            raise
+        finally:
+            client.pending.pop(tid, None)
+        if attempt == 0 and self.rtt is not None:
+            self.rtt.sample(to_server, to_port, time.time() - start)
+        elapsed = time.time() - start
+        if self.timings is not None:
+            self.timings.sent(to_server, elapsed)
+        args = {'name': name, 'qtype': qtype, 'server': to_server, 'port': to_port,
+                'elapsed': elapsed * 1000}
+        a = decode_reply(reply, args)
+        if self.metrics is not None:
+            self.metrics.observe(to_server, qtype, elapsed, a.header['status'])
+        if self.cache is not None:
+            self.cache.put(key, a)
+        if self.cassette is not None:
+            self.cassette.put(key, a)
+        return a
+
+    async def resolve_name(self, query, to_server, to_port=53):
+        """
+        Resolves a single name against the given server
+        """
+        if self.snapshots is not None:
+            r = self.snapshots.resolve_name(query, to_server, to_port)
+            if r is not None:
+                return r
+
+        if self.parallel_lookups:
+            a, c = await asyncio.gather(self.query(query, to_server, 'A', to_port),
+                                        self.query(query, to_server, 'CNAME', to_port))
+            if len(a.answers) > 0:
+                return {'answer': a.answers[0]}
+            if len(c.answers) > 0:
+                return {'answer': c.answers[0]}
+            return {'status': c.header['status']}
+
+        # first try an A record
+        a = await self.query(query, to_server, 'A', to_port)
+        if len(a.answers) > 0:
+            return {'answer': a.answers[0]}
+
+        # if that didnt work, try a CNAME
+        a = await self.query(query, to_server, 'CNAME', to_port)
+        if len(a.answers) > 0:
+            return {'answer': a.answers[0]}
+        return {'status': a.header['status']}
+
+    async def lookup_reverse(self, name, to_server, to_port=53):
+        """
+        convenience routine for doing a reverse lookup of an address
+        """
+        if self.snapshots is not None:
+            r = self.snapshots.lookup_reverse(name, to_server, to_port)
+            if r is not None:
+                return r
+        a = await self.query(reverse_name(name), to_server, 'PTR', to_port)
+        if len(a.answers) > 0:
+            return {'answer': a.answers[0]}
+        return {'status': a.header['status']}
+
+    def close(self):
+        """
+        Close all of the sockets opened by this instance, cancelling any
+        queries still in flight
+        """
+        for task in list(self._inflight.values()):
+            task.cancel()
+        self._inflight = {}
+        for fut in self._clients.values():
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                fut.result()[0].close()
+        self._clients = {}
+
+
+async def run_check(chk, adns, method, *args):
+    """
+    Run the named DNStestChecks method (see DNStestChecks.steps()),
+    answering its queries with an AsyncDNStestDNS. Queries that the check
+    yields together (i.e. the same name against TEST and PROD) are sent
+    concurrently.
+
+    @param chk DNStestChecks instance
+    @param adns AsyncDNStestDNS instance
+    @param method name of the check or verify method, i.e. 'confirm_name'
+    """
+    res, gen = chk.steps(method, *args)
+    try:
+        queries = next(gen)
+        while True:
+            answers = await asyncio.gather(*[getattr(adns, q[0])(*q[1:]) for q in queries])
+            queries = gen.send(list(answers))
+    except StopIteration:
+        pass
+    return res
+
+
+def run_checks_async(calls, chk, jobs=1, sleep_secs=None, timeout=None):
+    """
+    Generator that runs an iterable of DNStestChecks calls on a private
+    asyncio event loop, with up to ``jobs`` of them in flight at once, and
+    yields their result dicts in the same order as ``calls``.
+
+    @param calls iterable of (method name, args tuple); a None item is
+      passed through as a None result
+    @param chk DNStestChecks instance; its configuration, query cache
+      (chk.DNS.cache), RTT estimates (chk.DNS.rtt), rate limiter
+      (chk.DNS.limiter), zone snapshots (chk.DNS.snapshots), cassette
+      (chk.DNS.cassette), timings (chk.DNS.timings), metrics
+      (chk.DNS.metrics) and trace (chk.DNS.trace) are used
+    @param jobs maximum number of calls in flight at once
+    @param sleep_secs optional number of seconds each call waits after finishing
+    @param timeout seconds to wait for each DNS reply (default: pydns' default)
+    """
+    loop = asyncio.new_event_loop()
+    adns = AsyncDNStestDNS(timeout=timeout, parallel_lookups=chk.config.parallel_lookups,
+                           cache=chk.DNS.cache, rtt=chk.DNS.rtt, limiter=chk.DNS.limiter,
+                           snapshots=chk.DNS.snapshots, cassette=chk.DNS.cassette,
+                           timings=chk.DNS.timings, metrics=chk.DNS.metrics, trace=chk.DNS.trace)
+
+    async def one(method, args):
+        res = await run_check(chk, adns, method, *args)
+        if sleep_secs is not None and sleep_secs > 0.0:
+            await asyncio.sleep(sleep_secs)
+        return res
+
+    pending = deque()
+    try:
+        for call in calls:
+            if call is None:
+                fut = loop.create_future()
+                fut.set_result(None)
+            else:
+                fut = loop.create_task(one(*call))
+            pending.append(fut)
+            # awaiting the oldest call lets all the others make progress too
+            if len(pending) >= jobs:
+                yield loop.run_until_complete(pending.popleft())
+        while pending:
+            yield loop.run_until_complete(pending.popleft())
+    finally:
+        for fut in pending:
+            fut.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        adns.close()
+        # let the transports finish closing
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
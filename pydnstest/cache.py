@@ -0,0 +1,186 @@
+"""
+Per-run caches of DNS query results and parsed input lines for pydnstest
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict
+
+# the whitespace the parser skips between tokens (pyparsing's default);
+# any other whitespace is significant, so it must stay in ParseCache keys
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]+')
+
+
+def result_ttl(result):
+    """
+    Return the number of seconds a query result may be cached for, going by
+    the TTLs in the result, or None if it shouldn't be cached at all.
+
+    Answers are cached for the lowest TTL among them; negative answers for
+    the SOA minimum / SOA TTL in the authority section (RFC 2308), if any.
+    """
+    if len(result.answers) > 0:
+        return min(a['ttl'] for a in result.answers)
+    for a in getattr(result, 'authority', []):
+        if a['typename'] == 'SOA':
+            # pydns SOA data: (mname, rname, ('serial', n), ..., ('minimum', n, str))
+            return min(a['ttl'], a['data'][6][1])
+    return None
+
+
+class QueryCache(object):
+    """
+    Thread-safe, size-bounded LRU cache of query results, keyed by
+    (name, server, port, qtype).
+    """
+
+    def __init__(self, maxsize=10000, honor_ttl=False):
+        """
+        @param maxsize maximum number of results to keep; least recently used
+          results are evicted first
+        @param honor_ttl if True, results expire according to their TTLs
+          (see result_ttl()); otherwise they are kept for the rest of the run
+        """
+        self.maxsize = maxsize
+        self.honor_ttl = honor_ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry time or None, result)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """
+        Return the cached result for key, or None
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or (entry[0] is not None and entry[0] <= time.time()):
+                self.misses += 1
+                return None
+            # re-insert as most recently used
+            self._data[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, result):
+        """
+        Store result for key
+        """
+        expires = None
+        if self.honor_ttl:
+            ttl = result_ttl(result)
+            if ttl is None or ttl <= 0:
+                return
+            expires = time.time() + ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, result)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats_string(self):
+        """
+        Return a one-line summary of cache hits and misses
+        """
+        total = self.hits + self.misses
+        rate = 0.0
+        if total > 0:
+            rate = 100.0 * self.hits / total
+        return "query cache: %d hits / %d misses (%.1f%% hit rate)" % (self.hits, self.misses, rate)
+
+
+class ParseCache(object):
+    """
+    Thread-safe, size-bounded LRU cache in front of a parser's
+    parse_record(), keyed by the line with its runs of spaces, tabs, CRs and
+    LFs collapsed to single spaces and stripped from the ends (which
+    doesn't change how it parses), so that repeated input lines are only
+    parsed once. The cached ChangeRecords are immutable, so they're
+    returned as-is; parse_line() returns a new dict from one.
+    Lines that fail to parse are not cached.
+    """
+
+    def __init__(self, parser, maxsize=10000):
+        """
+        @param parser DnstestParser (or anything with a parse_record() method)
+        @param maxsize maximum number of parsed lines to keep; least
+          recently used lines are evicted first
+        """
+        self.parser = parser
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def parse_record(self, line):
+        key = _WHITESPACE_RE.sub(' ', line).strip(' ')
+        with self._lock:
+            r = self._data.pop(key, None)
+            if r is not None:
+                self._data[key] = r
+                self.hits += 1
+                return r
+            self.misses += 1
+        r = self.parser.parse_record(line)
+        with self._lock:
+            self._data[key] = r
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return r
+
+    def parse_line(self, line):
+        return self.parse_record(line).to_dict()
+
+    def stats_string(self):
+        """
+        Return a one-line summary of cache hits and misses
+        """
+        total = self.hits + self.misses
+        rate = 0.0
+        if total > 0:
+            rate = 100.0 * self.hits / total
+        return "parse cache: %d hits / %d misses (%.1f%% hit rate)" % (self.hits, self.misses, rate)
@@ -0,0 +1,188 @@
+"""
+Record and replay of DNS query results (cassettes) for pydnstest
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import base64
+import json
+import threading
+
+import DNS
+from DNS import Type, Class, Opcode, Status
+
+from pydnstest.wire import Reply
+
+# order of the numeric header fields stored for each reply
+_HEADER_FIELDS = ('id', 'qr', 'opcode', 'aa', 'tc', 'rd', 'ra', 'z', 'rcode',
+                  'qdcount', 'ancount', 'nscount', 'arcount')
+
+
+def _pack_data(data):
+    """
+    Make record data JSON-serializable; tuples (i.e. pydns SOA data) become
+    lists and raw bytes a {'b64': ...} dict
+    """
+    if isinstance(data, bytes):
+        return {'b64': base64.b64encode(data).decode('ascii')}
+    if isinstance(data, (list, tuple)):
+        return [_pack_data(d) for d in data]
+    return data
+
+
+def _unpack_data(data):
+    """
+    Reverse _pack_data(). pydns returns tuples everywhere it returns
+    sequences for the record types pydnstest queries.
+    """
+    if isinstance(data, dict):
+        return base64.b64decode(data['b64'])
+    if isinstance(data, list):
+        return tuple(_unpack_data(d) for d in data)
+    return data
+
+
+def _pack_rr(rr):
+    return [rr['name'], rr['type'], rr['class'], rr['ttl'], rr['rdlength'], _pack_data(rr['data'])]
+
+
+def _unpack_rr(r):
+    name, rtype, rclass, ttl, rdlength, data = r
+    return {'name': name, 'type': rtype, 'class': rclass, 'ttl': ttl, 'rdlength': rdlength,
+            'typename': Type.typestr(rtype), 'classstr': Class.classstr(rclass), 'data': _unpack_data(data)}
+
+
+class Cassette(object):
+    """
+    An append-only file of DNS query results, keyed on (name, server, port,
+    qtype). In record mode every result put() is appended as one JSON line;
+    in replay mode the file is read into an in-memory index and get()
+    returns the results (as pydnstest.wire.Reply objects, with the same
+    contents as the pydns DnsResults they were recorded from) without
+    sending any queries.
+
+    Recording to an existing file appends to it; when a query was recorded
+    more than once, replay uses the last result.
+    """
+
+    def __init__(self, path, replay=False):
+        """
+        @param path the cassette file
+        @param replay if True, read the file for get(); otherwise open it to
+          record to with put()
+        """
+        self.path = path
+        self.replay = replay
+        self.hits = 0
+        # key -> recorded entry (replay), or the last line written for it (record)
+        self._lines = {}
+        # key -> decoded Reply (replay)
+        self._replies = {}
+        self._lock = threading.Lock()
+        self._fh = None
+        if replay:
+            self._load()
+        else:
+            self._fh = open(path, 'a')
+
+    def _load(self):
+        try:
+            fh = open(self.path)
+        except (IOError, OSError) as e:
+            raise DNS.DNSError('could not read cassette %s: %s' % (self.path, e))
+        with fh:
+            for lineno, line in enumerate(fh, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    key = tuple(entry[:4])
+                except (ValueError, TypeError):
+                    raise DNS.DNSError('%s:%d: invalid cassette entry' % (self.path, lineno))
+                # only decode the entries that are asked for; index the raw entry
+                self._lines[key] = entry
+
+    def get(self, key):
+        """
+        Return the recorded result for a (name, server, port, qtype) key.
+        Raises DNS.DNSError if there isn't one, since a replay must never
+        fall back to querying the server.
+        """
+        a = self._replies.get(key)
+        if a is None:
+            entry = self._lines.get(key)
+            if entry is None:
+                raise DNS.DNSError('no recorded answer for %s %s from %s port %d in %s' % (
+                    key[0], key[3], key[1], key[2], self.path))
+            a = self._replies[key] = self._reply(entry)
+        self.hits += 1
+        return a
+
+    def _reply(self, entry):
+        name, server, port, qtype, header, answers, authority, additional = entry
+        h = dict(zip(_HEADER_FIELDS, header))
+        h['opcodestr'] = Opcode.opcodestr(h['opcode'])
+        h['status'] = Status.statusstr(h['rcode'])
+        qt = getattr(Type, qtype)
+        questions = [{'qname': name, 'qtype': qt, 'qtypestr': qtype, 'qclass': Class.IN, 'qclassstr': 'IN'}]
+        args = {'name': name, 'qtype': qtype, 'server': server, 'port': port, 'elapsed': 0.0}
+        return Reply(h, questions, [_unpack_rr(r) for r in answers], [_unpack_rr(r) for r in authority],
+                     [_unpack_rr(r) for r in additional], args)
+
+    def put(self, key, result):
+        """
+        Record the result (a pydns DnsResult, or anything with the same
+        attributes) for a (name, server, port, qtype) key
+        """
+        name, server, port, qtype = key
+        line = json.dumps([name, server, port, qtype,
+                           [result.header[f] for f in _HEADER_FIELDS],
+                           [_pack_rr(rr) for rr in result.answers],
+                           [_pack_rr(rr) for rr in result.authority],
+                           [_pack_rr(rr) for rr in result.additional]], separators=(',', ':'))
+        with self._lock:
+            if self._lines.get(key) == line:
+                return
+            self._lines[key] = line
+            self._fh.write(line + '\n')
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __len__(self):
+        return len(self._lines)
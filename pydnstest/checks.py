@@ -38,10 +38,23 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import re
+from pydnstest.cache import QueryCache
 from pydnstest.dns import DNStestDNS
+from pydnstest.ratelimit import RateLimiter
+from pydnstest.rtt import RTTEstimator
 from pydnstest.util import dns_dict_to_string
 
 
+def _fwd(name, server):
+    """ a forward lookup (DNStestDNS.resolve_name) for a check to yield """
+    return ('resolve_name', name, server)
+
+
+def _rev(addr, server):
+    """ a reverse lookup (DNStestDNS.lookup_reverse) for a check to yield """
+    return ('lookup_reverse', addr, server)
+
+
 class DNStestChecks:
     """
     Methods for checking actual DNS against the desired state.
@@ -52,6 +65,10 @@ class DNStestChecks:
     - secondary: list of strings, describing sub-test steps
     - warnings: list of strings, of any non-critical warnings generated
     {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+
+    The logic of each method lives in a generator of the same name with a
+    leading underscore, which yields the DNS queries it needs instead of
+    making them itself; see steps().
     """
 
     config = None
@@ -62,16 +79,62 @@ class DNStestChecks:
         init method for DNStestChecks - class for all DNS check and verify methods
         """
         self.config = config
-        self.DNS = DNStestDNS()
+        cache = None
+        if config.query_cache:
+            cache = QueryCache(maxsize=config.cache_size, honor_ttl=config.cache_honor_ttl)
+        rtt = None
+        if config.adaptive_timeout:
+            rtt = RTTEstimator(retries=config.retries)
+        limiter = None
+        if config.max_qps is not None:
+            limiter = RateLimiter(config.max_qps)
+        self.DNS = DNStestDNS(parallel_lookups=config.parallel_lookups, cache=cache,
+                              socket_pool=config.socket_pool, rtt=rtt, limiter=limiter)
         self.ip_regex = re.compile(r"^((([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}(1[0-9]{2}|2[0-4][0-9]|25[0-5]|[1-9][0-9]|[0-9]))$")
 
+    def steps(self, method, *args):
+        """
+        Return a (result dict, generator) pair for the named check or
+        verify method, for callers that answer its DNS queries themselves
+        (i.e. pydnstest.asyncdns).
+
+        Each value the generator yields is a list of queries that may be run
+        in parallel, as (DNStestDNS method name, name, server) tuples; send()
+        it back a list of the corresponding answer dicts. The result dict is
+        complete once the generator is exhausted. If self.DNS has timings,
+        the generator is timed by them.
+
+        @param method name of the check or verify method, i.e. 'confirm_name'
+        """
+        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        gen = getattr(self, '_' + method)(res, *args)
+        if self.DNS.timings is not None:
+            gen = self.DNS.timings.check(gen)
+        return (res, gen)
+
+    def _run(self, method, *args):
+        """
+        Run the named check or verify method to completion, answering its
+        queries one at a time with self.DNS, and return its result dict.
+        """
+        res, gen = self.steps(method, *args)
+        try:
+            queries = next(gen)
+            while True:
+                queries = gen.send([getattr(self.DNS, q[0])(*q[1:]) for q in queries])
+        except StopIteration:
+            pass
+        return res
+
     def check_removed_name(self, n):
         """
         Test a removed name
 
         @param n name that should be removed
         """
-        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        return self._run('check_removed_name', n)
+
+    def _check_removed_name(self, res, n):
         name = n
         # make sure we have a FQDN
         if name.find('.') == -1:
@@ -83,16 +146,14 @@ class DNStestChecks:
 
         # resolve with both test and prod
         if is_ip:
-            qt = self.DNS.lookup_reverse(name, self.config.server_test)
-            qp = self.DNS.lookup_reverse(name, self.config.server_prod)
+            qt, qp = yield [_rev(name, self.config.server_test), _rev(name, self.config.server_prod)]
         else:
-            qt = self.DNS.resolve_name(name, self.config.server_test)
-            qp = self.DNS.resolve_name(name, self.config.server_prod)
+            qt, qp = yield [_fwd(name, self.config.server_test), _fwd(name, self.config.server_prod)]
 
         if 'status' in qp:
             res['result'] = False
             res['message'] = "%s got status %s from PROD - cannot remove a name that doesn't exist (PROD)" % (n, qp['status'])
-            return res
+            return
         # else we got an answer, it's there, just look for removal
 
         if 'status' in qt and qt['status'] == "NXDOMAIN":
@@ -101,7 +162,7 @@ class DNStestChecks:
             res['secondary'].append("PROD value was %s (PROD)" % qp['answer']['data'])
             # check for any leftover reverse lookups
             if is_ip is False:
-                rev = self.DNS.lookup_reverse(qp['answer']['data'], self.config.server_test)
+                [rev] = yield [_rev(qp['answer']['data'], self.config.server_test)]
                 if 'answer' in rev:
                     if rev['answer']['data'] == name:
                         res['warnings'].append("REVERSE NG: %s appears to still have reverse DNS set to %s (TEST)" % (qp['answer']['data'], rev['answer']['data']))
@@ -113,7 +174,6 @@ class DNStestChecks:
         else:
             res['result'] = False
             res['message'] = "%s returned valid answer of '%s', not removed (TEST)" % (n, qt['answer']['data'])
-        return res
 
     def verify_removed_name(self, n):
         """
@@ -121,7 +181,9 @@ class DNStestChecks:
 
         @param n name that was removed
         """
-        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        return self._run('verify_removed_name', n)
+
+    def _verify_removed_name(self, res, n):
         name = n
         # make sure we have a FQDN
         if name.find('.') == -1:
@@ -133,11 +195,9 @@ class DNStestChecks:
 
         # resolve with both test and prod
         if is_ip:
-            qt = self.DNS.lookup_reverse(name, self.config.server_test)
-            qp = self.DNS.lookup_reverse(name, self.config.server_prod)
+            qt, qp = yield [_rev(name, self.config.server_test), _rev(name, self.config.server_prod)]
         else:
-            qt = self.DNS.resolve_name(name, self.config.server_test)
-            qp = self.DNS.resolve_name(name, self.config.server_prod)
+            qt, qp = yield [_fwd(name, self.config.server_test), _fwd(name, self.config.server_prod)]
 
         if 'status' in qp and qp['status'] == "NXDOMAIN":
             res['result'] = True
@@ -150,7 +210,6 @@ class DNStestChecks:
         else:
             res['result'] = False
             res['message'] = "%s returned valid answer of '%s', not removed (PROD)" % (n, qp['answer']['data'])
-        return res
 
     def check_renamed_name(self, n, newn, value):
         """
@@ -160,7 +219,9 @@ class DNStestChecks:
         @param newn new name
         @param value the record value (should be unchanged)
         """
-        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        return self._run('check_renamed_name', n, newn, value)
+
+    def _check_renamed_name(self, res, n, newn, value):
         name = n
         newname = newn
         newval = value
@@ -173,25 +234,24 @@ class DNStestChecks:
             newval = newval + self.config.default_domain
 
         # make sure the old name is gone
-        qt_old = self.DNS.resolve_name(name, self.config.server_test)
+        [qt_old] = yield [_fwd(name, self.config.server_test)]
         if 'answer' in qt_old:
             res['message'] = "%s got answer from TEST (%s), old name is still active (TEST)" % (n, qt_old['answer']['data'])
             res['result'] = False
-            return res
+            return
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(newname, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        qt, qp = yield [_fwd(newname, self.config.server_test), _fwd(name, self.config.server_prod)]
         if 'status' in qp:
             res['result'] = False
             res['message'] = "%s got status %s from PROD - cannot change a name that doesn't exist (PROD)" % (n, qp['status'])
-            return res
+            return
         # else we got an answer, it's there, check that it's right
 
         if 'status' in qt:
             res['result'] = False
             res['message'] = "%s got status %s (TEST)" % (newn, qt['status'])
-            return res
+            return
 
         # got valid answers for both, check them
         if qt['answer']['data'] != qp['answer']['data']:
@@ -206,7 +266,7 @@ class DNStestChecks:
             res['message'] = "rename %s => %s (TEST)" % (n, newn)
             # check for any leftover reverse lookups
             if qt['answer']['typename'] == 'A' or qp['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(qt['answer']['data'], self.config.server_test)
+                [rev] = yield [_rev(qt['answer']['data'], self.config.server_test)]
                 if 'answer' in rev:
                     if rev['answer']['data'] == newn or rev['answer']['data'] == newname:
                         res['secondary'].append("REVERSE OK: reverse DNS is set correctly for %s (TEST)" % qt['answer']['data'])
@@ -214,7 +274,6 @@ class DNStestChecks:
                         res['warnings'].append("REVERSE NG: %s appears to still have reverse DNS set to %s (TEST)" % (qt['answer']['data'], rev['answer']['data']))
                 else:
                     res['warnings'].append("REVERSE NG: no reverse DNS appears to be set for %s (TEST)" % qt['answer']['data'])
-        return res
 
     def verify_renamed_name(self, n, newn, value):
         """
@@ -224,7 +283,9 @@ class DNStestChecks:
         @param newn new name
         @param value the record value (should be unchanged)
         """
-        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        return self._run('verify_renamed_name', n, newn, value)
+
+    def _verify_renamed_name(self, res, n, newn, value):
         name = n
         newname = newn
         newval = value
@@ -237,17 +298,17 @@ class DNStestChecks:
             newval = newval + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(newname, self.config.server_test)
-        qp = self.DNS.resolve_name(newname, self.config.server_prod)
-        qp_old = self.DNS.resolve_name(name, self.config.server_prod)
+        qt, qp, qp_old = yield [_fwd(newname, self.config.server_test),
+                                _fwd(newname, self.config.server_prod),
+                                _fwd(name, self.config.server_prod)]
         if 'status' in qp:
             res['result'] = False
             res['message'] = "%s got status %s (PROD)" % (newn, qp['status'])
-            return res
+            return
         if 'answer' in qp_old:
             res['result'] = False
             res['message'] = "%s got answer from PROD (%s), old name is still active (PROD)" % (n, qp_old['answer']['data'])
-            return res
+            return
         # else we got an answer, it's there, check that it's right
 
         # got valid answers for both, check them
@@ -260,7 +321,7 @@ class DNStestChecks:
             res['message'] = "rename %s => %s (PROD)" % (n, newn)
             # check for any leftover reverse lookups
             if qp['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(qp['answer']['data'], self.config.server_prod)
+                [rev] = yield [_rev(qp['answer']['data'], self.config.server_prod)]
                 if 'answer' in rev:
                     if rev['answer']['data'] == newn or rev['answer']['data'] == newname:
                         res['secondary'].append("REVERSE OK: reverse DNS is set correctly for %s (PROD)" % qp['answer']['data'])
@@ -268,7 +329,6 @@ class DNStestChecks:
                         res['warnings'].append("REVERSE NG: %s appears to still have reverse DNS set to %s (PROD)" % (qp['answer']['data'], rev['answer']['data']))
                 else:
                     res['warnings'].append("REVERSE NG: no reverse DNS appears to be set for %s (PROD)" % qp['answer']['data'])
-        return res
 
     def check_added_name(self, n, value):
         """
@@ -277,7 +337,9 @@ class DNStestChecks:
         @param n name
         @param value record value
         """
-        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        return self._run('check_added_name', n, value)
+
+    def _check_added_name(self, res, n, value):
         name = n
         # make sure we have a FQDN
         if name.find('.') == -1:
@@ -288,18 +350,17 @@ class DNStestChecks:
             target = target + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(name, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        qt, qp = yield [_fwd(name, self.config.server_test), _fwd(name, self.config.server_prod)]
         # make sure PROD returns NXDOMAIN, since it's a new record
         if 'status' in qp:
             if qp['status'] != 'NXDOMAIN':
                 res['result'] = False
                 res['message'] = "prod server returned status %s for name %s (PROD)" % (qp['status'], n)
-                return res
+                return
         else:
             res['result'] = False
             res['message'] = "new name %s returned valid result from prod server (PROD)" % n
-            return res
+            return
 
         # check the answer we got back from TEST
         if 'answer' in qt:
@@ -313,7 +374,7 @@ class DNStestChecks:
                 res['secondary'].append("PROD server returns NXDOMAIN for %s (PROD)" % n)
             # check reverse DNS if we say to
             if self.config.have_reverse_dns and qt['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(value, self.config.server_test)
+                [rev] = yield [_rev(value, self.config.server_test)]
                 if 'status' in rev:
                     res['warnings'].append("REVERSE NG: got status %s for name %s (TEST)" % (rev['status'], value))
                 elif rev['answer']['data'] == n or rev['answer']['data'] == name:
@@ -323,7 +384,6 @@ class DNStestChecks:
         else:
             res['result'] = False
             res['message'] = "status %s for name %s (TEST)" % (qt['status'], n)
-        return res
 
     def verify_added_name(self, n, value):
         """
@@ -332,7 +392,9 @@ class DNStestChecks:
         @param n name
         @param value record value
         """
-        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        return self._run('verify_added_name', n, value)
+
+    def _verify_added_name(self, res, n, value):
         name = n
         # make sure we have a FQDN
         if name.find('.') == -1:
@@ -343,7 +405,7 @@ class DNStestChecks:
             target = target + self.config.default_domain
 
         # resolve with both test and prod
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        [qp] = yield [_fwd(name, self.config.server_prod)]
 
         # check the answer we got back from PROD
         if 'answer' in qp:
@@ -355,7 +417,7 @@ class DNStestChecks:
                 res['message'] = "%s resolves to %s instead of %s (PROD)" % (n, qp['answer']['data'], value)
             # check reverse DNS if we say to
             if self.config.have_reverse_dns and qp['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(value, self.config.server_prod)
+                [rev] = yield [_rev(value, self.config.server_prod)]
                 if 'status' in rev:
                     res['warnings'].append("REVERSE NG: got status %s for name %s (PROD)" % (rev['status'], value))
                 elif rev['answer']['data'] == n or rev['answer']['data'] == name:
@@ -365,7 +427,6 @@ class DNStestChecks:
         else:
             res['result'] = False
             res['message'] = "status %s for name %s (PROD)" % (qp['status'], n)
-        return res
 
     def check_changed_name(self, n, val):
         """
@@ -374,7 +435,9 @@ class DNStestChecks:
         @param n name to change
         @param val new value
         """
-        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        return self._run('check_changed_name', n, val)
+
+    def _check_changed_name(self, res, n, val):
         name = n
         newval = val
         # make sure we have a FQDN
@@ -384,18 +447,17 @@ class DNStestChecks:
             newval = newval + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(name, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        qt, qp = yield [_fwd(name, self.config.server_test), _fwd(name, self.config.server_prod)]
         if 'status' in qp:
             res['result'] = False
             res['message'] = "%s got status %s from PROD - cannot change a name that doesn't exist (PROD)" % (n, qp['status'])
-            return res
+            return
         # else we got an answer, it's there, check that it's right
 
         if 'status' in qt:
             res['result'] = False
             res['message'] = "%s got status %s (TEST)" % (n, qt['status'])
-            return res
+            return
 
         # got valid answers for both, check them
         if qt['answer']['data'] == qp['answer']['data']:
@@ -410,7 +472,7 @@ class DNStestChecks:
             res['message'] = "change %s from '%s' to '%s' (TEST)" % (n, qp['answer']['data'], qt['answer']['data'])
             # check for any leftover reverse lookups
             if qt['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(qt['answer']['data'], self.config.server_test)
+                [rev] = yield [_rev(qt['answer']['data'], self.config.server_test)]
                 if 'answer' in rev:
                     if rev['answer']['data'] == name or rev['answer']['data'] == n:
                         res['secondary'].append("REVERSE OK: %s => %s (TEST)" % (qt['answer']['data'], rev['answer']['data']))
@@ -418,7 +480,6 @@ class DNStestChecks:
                         res['warnings'].append("REVERSE NG: %s appears to still have reverse DNS set to %s (TEST)" % (qt['answer']['data'], rev['answer']['data']))
                 else:
                     res['warnings'].append("REVERSE NG: no reverse DNS appears to be set for %s (TEST)" % qt['answer']['data'])
-        return res
 
     def verify_changed_name(self, n, val):
         """
@@ -429,7 +490,9 @@ class DNStestChecks:
         @param n name to change
         @param val new value
         """
-        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        return self._run('verify_changed_name', n, val)
+
+    def _verify_changed_name(self, res, n, val):
         name = n
         newval = val
         # make sure we have a FQDN
@@ -439,18 +502,17 @@ class DNStestChecks:
             newval = newval + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(name, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        qt, qp = yield [_fwd(name, self.config.server_test), _fwd(name, self.config.server_prod)]
         if 'status' in qp:
             res['result'] = False
             res['message'] = "%s got status %s from PROD (PROD)" % (n, qp['status'])
-            return res
+            return
         # else we got an answer, it's there, check that it's right
 
         if 'status' in qt:
             res['result'] = False
             res['message'] = "%s got status %s (TEST)" % (n, qt['status'])
-            return res
+            return
 
         # got valid answers for both, check them
         if qp['answer']['data'] == val or qp['answer']['data'] == newval:
@@ -459,7 +521,7 @@ class DNStestChecks:
             res['message'] = "change %s value to '%s' (PROD)" % (n, qp['answer']['data'])
             # check for bad reverse DNS
             if qp['answer']['typename'] == 'A':
-                rev = self.DNS.lookup_reverse(qp['answer']['data'], self.config.server_prod)
+                [rev] = yield [_rev(qp['answer']['data'], self.config.server_prod)]
                 if 'answer' in rev:
                     if rev['answer']['data'] == n or rev['answer']['data'] == name:
                         res['secondary'].append("REVERSE OK: %s => %s (PROD)" % (qp['answer']['data'], rev['answer']['data']))
@@ -470,7 +532,6 @@ class DNStestChecks:
         else:
             res['result'] = False
             res['message'] = "%s resolves to %s instead of %s (PROD)" % (n, qp['answer']['data'], val)
-        return res
 
     def confirm_name(self, n):
         """
@@ -479,35 +540,39 @@ class DNStestChecks:
 
         @param n name
         """
-        res = {'result': None, 'message': None, 'secondary': [], 'warnings': []}
+        return self._run('confirm_name', n)
+
+    def _confirm_name(self, res, n):
         name = n
         # make sure we have a FQDN
         if name.find('.') == -1:
             name = name + self.config.default_domain
 
         # resolve with both test and prod
-        qt = self.DNS.resolve_name(name, self.config.server_test)
-        qp = self.DNS.resolve_name(name, self.config.server_prod)
+        qt, qp = yield [_fwd(name, self.config.server_test), _fwd(name, self.config.server_prod)]
         if 'status' in qt:
             if 'status' not in qp:
                 res['message'] = "test server returned status %s for name %s, but prod returned valid answer of %s" % (qt['status'], n, qp['answer']['data'])
                 res['result'] = False
-                return res
+                return
             if qp['status'] == qt['status']:
                 res['message'] = "both test and prod returned status %s for name %s" % (qt['status'], n)
                 res['result'] = True
-                return res
+                return
             # else both have different statuses
             res['message'] = "test server returned status %s for name %s, but prod returned status %s" % (qt['status'], n, qp['status'])
             res['result'] = False
-            return res
+            return
         if 'status' in qp and 'status' not in qt:
             res['message'] = "prod server returned status %s for name %s, but test returned valid answer of %s" % (qp['status'], n, qt['answer']['data'])
             res['result'] = False
-            return res
+            return
 
         # remove ttl if we want to ignore it
+        # (from copies - the answer dicts may be shared with the query cache)
         if self.config.ignore_ttl:
+            qp['answer'] = dict(qp['answer'])
+            qt['answer'] = dict(qt['answer'])
             qp['answer'].pop('ttl', None)
             qt['answer'].pop('ttl', None)
 
@@ -531,8 +596,7 @@ class DNStestChecks:
         if same_res is False:
             res['message'] = "prod and test servers return different responses for '%s'" % n
             res['result'] = False
-            return res
+            return
         res['message'] = "prod and test servers return same response for '%s'" % n
         res['secondary'].append("response: %s" % dns_dict_to_string(qp['answer']))
         res['result'] = True
-        return res
@@ -59,6 +59,21 @@ class DnstestConfig():
     ignore_ttl = False
     sleep = 0.0
 
+    # set from command-line options only; not stored in the config file
+    parallel_lookups = False
+    socket_pool = False
+    adaptive_timeout = False
+    retries = 2
+    max_qps = None
+    snapshot_zones = []
+    test_zone_files = []
+    prod_zone_files = []
+    record_file = None
+    replay_file = None
+    query_cache = True
+    cache_size = 10000
+    cache_honor_ttl = False
+
     ipaddr_re = None
     bool_t_re = None
     bool_f_re = None
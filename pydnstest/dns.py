@@ -38,25 +38,248 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 
+import time
+
 import DNS
 
+from pydnstest.singleflight import SingleFlight
+from pydnstest.trace import HIT, MISS, REPLAY
+from pydnstest.transport import UDPTransport, PooledTransport
+
+
+def reverse_name(addr):
+    """
+    Return the in-addr.arpa name to query for a reverse lookup of addr
+    """
+    a = addr.split('.')
+    a.reverse()
+    return '.'.join(a) + '.in-addr.arpa'
+
 
 class DNStestDNS:
 
+    def __init__(self, parallel_lookups=False, cache=None, socket_pool=False, rtt=None, limiter=None,
+                 snapshots=None, cassette=None, timings=None, metrics=None, trace=None):
+        """
+        @param parallel_lookups if True, resolve_name sends its A and CNAME
+          queries at the same time instead of one after the other
+        @param cache optional pydnstest.cache.QueryCache to answer repeated
+          queries from
+        @param socket_pool if True, send all queries over sockets kept open
+          per server (see pydnstest.transport.SocketPool) instead of a new
+          DNS.Request and socket for each query
+        @param rtt optional pydnstest.rtt.RTTEstimator to derive per-server
+          timeouts and retransmissions from, instead of pydns' fixed timeout
+        @param limiter optional pydnstest.ratelimit.RateLimiter to pace the
+          queries sent to each server
+        @param snapshots optional pydnstest.snapshot.SnapshotSet to answer
+          names in its zones from, instead of querying the server
+        @param cassette optional pydnstest.cassette.Cassette to record every
+          query result to or, in replay mode, to answer every query from
+        @param timings optional pydnstest.timings.Timings to record the
+          queries sent to each server in
+        @param metrics optional pydnstest.metrics.QueryMetrics to record the
+          latency and outcome of each query sent in
+        @param trace optional pydnstest.trace.QueryTrace to log every query to
+        """
+        self.parallel_lookups = parallel_lookups
+        self.cache = cache
+        self.socket_pool = socket_pool
+        self.rtt = rtt
+        self.limiter = limiter
+        self.snapshots = snapshots
+        self.cassette = cassette
+        self.timings = timings
+        self.metrics = metrics
+        self.trace = trace
+        if socket_pool:
+            self.transport = PooledTransport(rtt=rtt)
+        else:
+            self.transport = UDPTransport(rtt=rtt)
+        # identical queries from concurrent threads share one request
+        self.inflight = SingleFlight()
+
+    def query(self, name, to_server, qtype, to_port=53):
+        """
+        Sends a single query (unless it's cached, or the same query is
+        already in flight), returning the pydns DnsResult
+        """
+        key = (name, to_server, to_port, qtype)
+        if self.trace is not None:
+            return self._traced_query(key)
+        if self.cassette is not None and self.cassette.replay:
+            return self.cassette.get(key)
+        if self.cache is not None:
+            a = self.cache.get(key)
+            if a is not None:
+                return a
+        return self.inflight.do(key, self._send, key)
+
+    def _traced_query(self, key):
+        """
+        query() for a (name, server, port, qtype) key, logging it to self.trace
+        """
+        start = time.time()
+        a = None
+        cache = MISS
+        try:
+            if self.cassette is not None and self.cassette.replay:
+                cache = REPLAY
+                a = self.cassette.get(key)
+            else:
+                if self.cache is not None:
+                    a = self.cache.get(key)
+                if a is not None:
+                    cache = HIT
+                else:
+                    a = self.inflight.do(key, self._send, key)
+        except Exception as e:
+            self.trace.query(key, start, None, cache, e)
+            raise
+        self.trace.query(key, start, a, cache)
+        return a
+
+    def _send(self, key):
+        """
+        Sends the query for a (name, server, port, qtype) key, caching the result
+        """
+        name, to_server, to_port, qtype = key
+        if self.limiter is not None:
+            self.limiter.wait(to_server, to_port)
+        start = time.time()
+        try:
+            if self.socket_pool:
+                a = self.transport.query(name, to_server, qtype, to_port)
+            elif self.rtt is not None:
+                a = self._request_adaptive(name, to_server, qtype, to_port)
+            else:
+                s = DNS.Request(name=name, server=to_server, qtype=qtype, port=to_port)
+                a = s.req()
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.failed(to_server, qtype, e)
+            raise
+        elapsed = time.time() - start
+        if self.timings is not None:
+            self.timings.sent(to_server, elapsed)
+        if self.metrics is not None:
+            self.metrics.observe(to_server, qtype, elapsed, a.header['status'])
+        if self.cache is not None:
+            self.cache.put(key, a)
+        if self.cassette is not None:
+            self.cassette.put(key, a)
+        return a
+
+    def _request_adaptive(self, name, to_server, qtype, to_port):
+        """
+        Sends a query with DNS.Request using the RTTEstimator's timeout for
+        the server, retrying with exponential backoff on timeouts
+        """
+        timeout = self.rtt.rto(to_server, to_port)
+        attempt = 0
+        while True:
+            start = time.time()
+            try:
+                s = DNS.Request(name=name, server=to_server, qtype=qtype, port=to_port, timeout=timeout)
+                a = s.req()
+            except DNS.TimeoutError:
+                if attempt >= self.rtt.retries:
+                    raise
+                attempt += 1
+                timeout = self.rtt.backoff(timeout)
+                continue
+            if attempt == 0:
+                self.rtt.sample(to_server, to_port, time.time() - start)
+            return a
+
+    def _send_many(self, keys):
+        """
+        Sends the queries for a list of keys (all to the same server and
+        port) at the same time, caching the results
+        """
+        if self.limiter is not None:
+            self.limiter.wait(keys[0][1], keys[0][2], len(keys))
+        start = time.time()
+        try:
+            replies = self.transport.query_many([(k[0], k[3]) for k in keys], keys[0][1], keys[0][2])
+        except Exception as e:
+            if self.metrics is not None:
+                for k in keys:
+                    self.metrics.failed(k[1], k[3], e)
+            raise
+        elapsed = time.time() - start
+        if self.timings is not None:
+            self.timings.sent(keys[0][1], elapsed, len(keys))
+        for k, a in zip(keys, replies):
+            # sent together, so each is counted as taking as long as the slowest
+            if self.metrics is not None:
+                self.metrics.observe(k[1], k[3], elapsed, a.header['status'])
+            if self.cache is not None:
+                self.cache.put(k, a)
+            if self.cassette is not None:
+                self.cassette.put(k, a)
+        return replies
+
+    def query_many(self, questions, to_server, to_port=53):
+        """
+        Sends queries for each (name, qtype) in questions at the same time
+        (except any that are cached), returning a list of the pydns
+        DnsResults in the same order. Questions that are already in flight
+        from another thread wait for that query's result instead.
+        """
+        if self.cassette is not None and self.cassette.replay:
+            if self.trace is None:
+                return [self.cassette.get((name, to_server, to_port, qtype)) for name, qtype in questions]
+            return [self._traced_query((name, to_server, to_port, qtype)) for name, qtype in questions]
+        start = time.time()
+        results = [None] * len(questions)
+        send = []
+        for i, (name, qtype) in enumerate(questions):
+            if self.cache is not None:
+                results[i] = self.cache.get((name, to_server, to_port, qtype))
+            if results[i] is None:
+                send.append(i)
+            elif self.trace is not None:
+                self.trace.query((name, to_server, to_port, qtype), start, results[i], HIT)
+        if send:
+            keys = [(questions[i][0], to_server, to_port, questions[i][1]) for i in send]
+            try:
+                replies = self.inflight.do_many(keys, self._send_many)
+            except Exception as e:
+                if self.trace is not None:
+                    for k in keys:
+                        self.trace.query(k, start, None, MISS, e)
+                raise
+            for i, k, a in zip(send, keys, replies):
+                results[i] = a
+                if self.trace is not None:
+                    self.trace.query(k, start, a, MISS)
+        return results
+
     def resolve_name(self, query, to_server, to_port=53):
         """
         Resolves a single name against the given server
         """
+        if self.snapshots is not None:
+            r = self.snapshots.resolve_name(query, to_server, to_port)
+            if r is not None:
+                return r
+
+        if self.parallel_lookups:
+            a, c = self.query_many([(query, 'A'), (query, 'CNAME')], to_server, to_port)
+            if len(a.answers) > 0:
+                return {'answer': a.answers[0]}
+            if len(c.answers) > 0:
+                return {'answer': c.answers[0]}
+            return {'status': c.header['status']}
 
         # first try an A record
-        s = DNS.Request(name=query, server=to_server, qtype='A', port=to_port)
-        a = s.req()
+        a = self.query(query, to_server, 'A', to_port)
         if len(a.answers) > 0:
             return {'answer': a.answers[0]}
 
         # if that didnt work, try a CNAME
-        s = DNS.Request(name=query, server=to_server, qtype='CNAME', port=to_port)
-        a = s.req()
+        a = self.query(query, to_server, 'CNAME', to_port)
         if len(a.answers) > 0:
             return {'answer': a.answers[0]}
         return {'status': a.header['status']}
@@ -65,12 +288,18 @@ class DNStestDNS:
         """
         convenience routine for doing a reverse lookup of an address
         """
-        a = name.split('.')
-        a.reverse()
-        b = '.'.join(a) + '.in-addr.arpa'
-
-        s = DNS.Request(name=b, server=to_server, qtype='PTR', port=to_port)
-        a = s.req()
+        if self.snapshots is not None:
+            r = self.snapshots.lookup_reverse(name, to_server, to_port)
+            if r is not None:
+                return r
+        a = self.query(reverse_name(name), to_server, 'PTR', to_port)
         if len(a.answers) > 0:
             return {'answer': a.answers[0]}
         return {'status': a.header['status']}
+
+    def close(self):
+        """
+        Close any sockets kept open for reuse
+        """
+        if self.socket_pool:
+            self.transport.pool.close()
@@ -0,0 +1,170 @@
+"""
+Persisted zone snapshots and line results, for incremental re-runs of dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+import os
+
+from pydnstest.dns import reverse_name
+from pydnstest.snapshot import ZoneSnapshot
+
+
+def query_name(q):
+    """
+    Return the (lower-case) name that a DNStestChecks query tuple looks up
+    """
+    if q[0] == 'lookup_reverse':
+        return reverse_name(q[1])
+    return q[1].lower().rstrip('.')
+
+
+def traced_run(chk, method, *args):
+    """
+    Like DNStestChecks._run(), but return a (result dict, set of
+    (name, server) pairs it looked up) tuple.
+    """
+    res, gen = chk.steps(method, *args)
+    looked_up = set()
+    try:
+        queries = next(gen)
+        while True:
+            for q in queries:
+                looked_up.add((query_name(q), q[2]))
+            queries = gen.send([getattr(chk.DNS, q[0])(*q[1:]) for q in queries])
+    except StopIteration:
+        pass
+    return res, looked_up
+
+
+def config_fingerprint(config):
+    """
+    Return a string that changes whenever the configuration that check
+    results depend on does
+    """
+    d = config.asDict()
+    d['snapshot_zones'] = sorted(config.snapshot_zones)
+    d['test_zone_files'] = sorted(config.test_zone_files)
+    d['prod_zone_files'] = sorted(config.prod_zone_files)
+    return json.dumps(d, sort_keys=True)
+
+
+def serial_key(zone, server, port=53):
+    return '%s %d %s' % (server, port, zone)
+
+
+def snapshot_serials(snapshots):
+    """
+    Return a dict of serial_key() to SOA serial for each snapshot in a
+    SnapshotSet
+    """
+    serials = {}
+    for (server, port), zones in snapshots.servers.items():
+        for z in zones:
+            serials[serial_key(z.zone, server, port)] = z.serial
+    return serials
+
+
+class SnapshotStore(object):
+    """
+    Keeps zone snapshots, and the results of each input line checked
+    against them, in a directory between runs.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, fname):
+        return os.path.join(self.directory, fname)
+
+    def _zone_file(self, zone, server, port):
+        return self._path('zone_%s_%d_%s.json' % (server.replace(':', '_'), port, zone))
+
+    def _read(self, path):
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write(self, path, data):
+        # write then rename, so an interrupted run can't leave a partial file
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(data, fh)
+        os.rename(tmp, path)
+
+    def load_zone(self, zone, server, port=53):
+        """
+        Return the stored ZoneSnapshot of zone from server, or None
+        """
+        d = self._read(self._zone_file(zone.lower().rstrip('.'), server, port))
+        if d is None:
+            return None
+        try:
+            return ZoneSnapshot.from_dict(d)
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    def load_results(self, serials, fingerprint):
+        """
+        Return the stored line results, as a dict of line key to
+        {'result': result dict, 'names': names it looked up}, if they were
+        saved with the same configuration fingerprint and zone serials
+        (see snapshot_serials(); including those of any zone files) as
+        given; otherwise an empty dict.
+        """
+        d = self._read(self._path('results.json'))
+        if d is None or d.get('fingerprint') != fingerprint or d.get('serials') != serials:
+            return {}
+        return d.get('lines', {})
+
+    def save(self, snapshots, fingerprint, results):
+        """
+        Store the snapshots, and the line results checked against them
+        """
+        for (server, port), zones in snapshots.servers.items():
+            for z in zones:
+                if not isinstance(z, ZoneSnapshot):
+                    # i.e. a pydnstest.zonefile.ZoneFileIndex
+                    continue
+                self._write(self._zone_file(z.zone, server, port), z.to_dict())
+        self._write(self._path('results.json'), {'fingerprint': fingerprint,
+                                                 'serials': snapshot_serials(snapshots),
+                                                 'lines': results})
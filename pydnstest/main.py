@@ -48,39 +48,55 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 import sys
 import optparse
 import os.path
-from pyparsing import ParseException
+import threading
+from collections import deque
+from operator import itemgetter
 from time import sleep
 
-from pydnstest.checks import DNStestChecks
+# pydns, pyparsing and the modules for optional features are imported where
+# they're first needed, so that --help, --version and the config options
+# (and small input files) don't pay for importing them
+from pydnstest.cache import ParseCache
 from pydnstest.config import DnstestConfig
-from pydnstest.parser import DnstestParser
+from pydnstest.parser import DnstestParser, parse_exception, ADD, REMOVE, RENAME, CHANGE, CONFIRM
+from pydnstest.pipeline import read_lines, imap_bounded, format_result, consume, ChunkedParser, TextSink, LineError
+from pydnstest.timings import Timings, TimedParser
+from pydnstest.trace import QueryTrace, current_line, set_line
 from pydnstest.version import VERSION
 
 
+PARSE_ERROR = "ERROR: could not parse input line, SKIPPING: %s"
+UNKNOWN_OPERATION = "ERROR: unknown input operation"
+
+# while check_lines() runs a line, the list that report_line_error()
+# appends to (per thread)
+_line_errors = threading.local()
+
+
+def report_line_error(message):
+    """
+    Print the error message for an input line that could not be checked;
+    or, while check_lines() is running the line, leave it for check_lines()
+    to yield as a LineError
+    """
+    errors = getattr(_line_errors, 'errors', None)
+    if errors is None:
+        print(message)
+    else:
+        errors.append(message)
+
+
 def run_check_line(line, parser, chk):
     """
     Parses a raw input line, runs the tests for that line,
     and returns the result of the tests.
     """
     try:
-        d = parser.parse_line(line)
-    except ParseException:
-        print("ERROR: could not parse input line, SKIPPING: %s" % line)
-        return False
-
-    if d['operation'] == 'add':
-        return chk.check_added_name(d['hostname'], d['value'])
-    elif d['operation'] == 'remove':
-        return chk.check_removed_name(d['hostname'])
-    elif d['operation'] == 'change':
-        return chk.check_changed_name(d['hostname'], d['value'])
-    elif d['operation'] == 'rename':
-        return chk.check_renamed_name(d['hostname'], d['newname'], d['value'])
-    elif d['operation'] == 'confirm':
-        return chk.confirm_name(d['hostname'])
-    else:
-        print("ERROR: unknown input operation")
+        r = parser.parse_record(line)
+    except parse_exception():
+        report_line_error(PARSE_ERROR % line)
         return False
+    return check_parsed_line(r, chk)
 
 
 def run_verify_line(line, parser, chk):
@@ -90,38 +106,322 @@ def run_verify_line(line, parser, chk):
     and returns the result of the tests.
     """
     try:
-        d = parser.parse_line(line)
-    except ParseException:
-        print("ERROR: could not parse input line, SKIPPING: %s" % line)
+        r = parser.parse_record(line)
+    except parse_exception():
+        report_line_error(PARSE_ERROR % line)
         return False
+    return verify_parsed_line(r, chk)
 
-    if d['operation'] == 'add':
-        return chk.verify_added_name(d['hostname'], d['value'])
-    elif d['operation'] == 'remove':
-        return chk.verify_removed_name(d['hostname'])
-    elif d['operation'] == 'change':
-        return chk.verify_changed_name(d['hostname'], d['value'])
-    elif d['operation'] == 'rename':
-        return chk.verify_renamed_name(d['hostname'], d['newname'], d['value'])
-    elif d['operation'] == 'confirm':
-        return chk.confirm_name(d['hostname'])
-    else:
-        print("ERROR: unknown input operation")
+
+# operation code -> (check method, verify method, function returning the
+# method's arguments from the line's ChangeRecord, which is a tuple of
+# (op, hostname, value, newname))
+LINE_METHODS = {
+    ADD: ('check_added_name', 'verify_added_name', itemgetter(slice(1, 3))),
+    REMOVE: ('check_removed_name', 'verify_removed_name', itemgetter(slice(1, 2))),
+    RENAME: ('check_renamed_name', 'verify_renamed_name', itemgetter(1, 3, 2)),
+    CHANGE: ('check_changed_name', 'verify_changed_name', itemgetter(slice(1, 3))),
+    CONFIRM: ('confirm_name', 'confirm_name', itemgetter(slice(1, 2))),
+}
+
+
+def line_method(r, verify=False):
+    """
+    Return a (DNStestChecks method name, args tuple) pair for an
+    already-parsed input line (the ChangeRecord returned by
+    DnstestParser.parse_record), or (None, None) for an unknown operation.
+    """
+    m = LINE_METHODS.get(r.op)
+    if m is None:
+        return (None, None)
+    if verify:
+        return (m[1], m[2](r))
+    return (m[0], m[2](r))
+
+
+def check_parsed_line(r, chk):
+    """
+    Runs the tests for an already-parsed input line (the ChangeRecord
+    returned by DnstestParser.parse_record) and returns the result.
+    """
+    method, args = line_method(r)
+    if method is None:
+        report_line_error(UNKNOWN_OPERATION)
         return False
+    return getattr(chk, method)(*args)
+
+
+def verify_parsed_line(r, chk):
+    """
+    Runs the verify tests (against the PROD server) for an
+    already-parsed input line and returns the result.
+    """
+    method, args = line_method(r, verify=True)
+    if method is None:
+        report_line_error(UNKNOWN_OPERATION)
+        return False
+    return getattr(chk, method)(*args)
+
+
+def run_lines_concurrently(lines, parser, chk, verify=False, jobs=2, sleep_secs=None):
+    """
+    Generator that runs the tests for an iterable of raw input lines on a
+    pool of ``jobs`` worker threads, yielding each result (or a LineError
+    for a line that could not be checked) in the same order as the input
+    lines.
+
+    Parsing happens in a single thread ahead of the workers; the workers
+    only run the DNStestChecks methods, which spend nearly all of their
+    time waiting on the network. The workers carry on each line's traced
+    line number (see
+    pydnstest.trace.set_line()). Lines are only read a few ahead of the
+    result being yielded, so any number of them run in constant memory.
+    """
+    from multiprocessing.pool import ThreadPool
+    dispatch = verify_parsed_line if verify else check_parsed_line
+
+    def parsed():
+        for line in lines:
+            n = current_line()
+            try:
+                rec = parser.parse_record(line)
+            except parse_exception():
+                yield (LineError(PARSE_ERROR % line), n)
+                continue
+            if line_method(rec)[0] is None:
+                yield (LineError(UNKNOWN_OPERATION), n)
+            else:
+                yield (rec, n)
+
+    def work(item):
+        rec, n = item
+        set_line(n)
+        if isinstance(rec, LineError):
+            return rec
+        r = dispatch(rec, chk)
+        if sleep_secs is not None and sleep_secs > 0.0:
+            sleep(sleep_secs)
+        return r
+
+    pool = ThreadPool(jobs)
+    try:
+        for r in imap_bounded(pool, work, parsed(), 2 * jobs):
+            yield r
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def run_lines_async(lines, parser, chk, verify=False, jobs=1, sleep_secs=None):
+    """
+    Generator like run_lines_concurrently(), but running the checks on an
+    asyncio event loop with pydnstest.asyncdns (Python 3.5+ only), with up
+    to ``jobs`` lines in flight at once from a single thread.
+    """
+    from pydnstest.asyncdns import run_checks_async
+
+    # one entry per line, in input order: its LineError, or None
+    errors = deque()
+
+    def calls():
+        for line in lines:
+            try:
+                r = parser.parse_record(line)
+            except parse_exception():
+                errors.append(LineError(PARSE_ERROR % line))
+                yield None
+                continue
+            method, args = line_method(r, verify=verify)
+            if method is None:
+                errors.append(LineError(UNKNOWN_OPERATION))
+                yield None
+                continue
+            errors.append(None)
+            yield (method, args)
+
+    for r in run_checks_async(calls(), chk, jobs=jobs, sleep_secs=sleep_secs):
+        err = errors.popleft()
+        yield r if err is None else err
+
+
+def load_snapshots(config, store=None):
+    """
+    Transfer each of config.snapshot_zones from the test and prod servers,
+    returning a SnapshotSet of them. Exits on any failure.
+
+    If store (a pydnstest.incremental.SnapshotStore) has a snapshot of a
+    zone from an earlier run, it is brought up to date with an incremental
+    transfer instead. Returns a (SnapshotSet, changed, serials) tuple, where
+    changed is the set of names changed since the stored snapshots (or None
+    if any zone had to be transferred in full, or changed in a zone with
+    wildcards) and serials are the stored
+    snapshots' serials (see pydnstest.incremental.snapshot_serials()).
+    """
+    import DNS
+    from pydnstest.incremental import serial_key
+    from pydnstest.snapshot import SnapshotSet
+    snaps = SnapshotSet()
+    changed = set()
+    serials = {}
+    for zone in config.snapshot_zones:
+        for server in sorted(set([config.server_test, config.server_prod])):
+            old = None
+            if store is not None:
+                old = store.load_zone(zone, server)
+            try:
+                if old is None:
+                    s = snaps.load(zone, server)
+                    changed = None
+                else:
+                    serials[serial_key(old.zone, server)] = old.serial
+                    names = snaps.refresh(old, server)
+                    if names is None:
+                        # the zone has wildcards; any name may answer differently
+                        changed = None
+                        print("Note - updated zone %s from %s to serial %d (has wildcards; re-checking all names)" % (
+                            old.zone, server, old.serial))
+                        continue
+                    if changed is not None:
+                        changed.update(names)
+                    print("Note - updated zone %s from %s to serial %d (%d names changed)" % (
+                        old.zone, server, old.serial, len(names)))
+                    continue
+            except DNS.DNSError as e:
+                print("ERROR: could not transfer zone %s from %s: %s" % (zone, server, e))
+                raise SystemExit(1)
+            print("Note - loaded %d records in zone %s from %s (serial %d)" % (len(s), s.zone, server, s.serial))
+    return snaps, changed, serials
+
+
+def load_zone_files(config, snapshots):
+    """
+    Index each of config.test_zone_files and config.prod_zone_files
+    ("FILE" or "ZONE=FILE") and add them to snapshots for the test or prod
+    server, so that names in them are answered from the files instead of
+    the server. Exits on any failure.
+
+    Returns a dict of serial_key() to SOA serial for each file (see
+    pydnstest.incremental.snapshot_serials()), so that stored results are
+    only reused while the files keep the serials they were checked with.
+    """
+    from pydnstest.incremental import serial_key
+    from pydnstest.zonefile import ZoneFileIndex, ZoneFileError
+    serials = {}
+    for server, files, side in ((config.server_test, config.test_zone_files, 'TEST'),
+                                (config.server_prod, config.prod_zone_files, 'PROD')):
+        for spec in files:
+            zone = None
+            path = spec
+            if '=' in spec and not os.path.exists(spec):
+                zone, path = spec.split('=', 1)
+            try:
+                z = ZoneFileIndex(path, zone=zone)
+            except ZoneFileError as e:
+                print("ERROR: %s" % e)
+                raise SystemExit(1)
+            snapshots.add(server, z)
+            serials[serial_key(z.zone, server)] = z.serial
+            print("Note - answering zone %s for %s from %s (%d records, serial %d)" % (
+                z.zone, side, path, len(z), z.serial))
+    return serials
+
+
+def traced_run(chk, method, *args):
+    """
+    Calls pydnstest.incremental.traced_run()
+    """
+    from pydnstest.incremental import traced_run
+    return traced_run(chk, method, *args)
+
+
+def run_lines_incremental(lines, parser, chk, previous, changed, results, verify=False, sleep_secs=None):
+    """
+    Generator that runs each input line like run_check_line() or
+    run_verify_line(), except that lines whose result is in previous and
+    none of whose names are in changed reuse that result instead of being
+    checked again.
+
+    @param previous dict of line results from an earlier run, as returned
+      by SnapshotStore.load_results()
+    @param changed set of names changed since then, or None to check every line
+    @param results dict to store this run's line results in, for
+      SnapshotStore.save(); only lines that were answered entirely from
+      zone snapshots are stored
+    @param sleep_secs optional number of seconds to sleep after each line
+    """
+    for line in lines:
+        key = ('verify ' if verify else 'check ') + line
+        prev = previous.get(key)
+        if prev is not None and changed is not None and changed.isdisjoint(prev['names']):
+            results[key] = prev
+            yield prev['result']
+            if sleep_secs is not None and sleep_secs > 0.0:
+                sleep(sleep_secs)
+            continue
+        try:
+            r = parser.parse_record(line)
+        except parse_exception():
+            yield LineError(PARSE_ERROR % line)
+            continue
+        method, args = line_method(r, verify=verify)
+        if method is None:
+            yield LineError(UNKNOWN_OPERATION)
+            continue
+        res, looked_up = traced_run(chk, method, *args)
+        if all(chk.DNS.snapshots.find(name, server) is not None for name, server in looked_up):
+            results[key] = {'result': res, 'names': sorted(set(name for name, server in looked_up))}
+        yield res
+        if sleep_secs is not None and sleep_secs > 0.0:
+            sleep(sleep_secs)
+
+
+def check_lines(lines, parser, chk, verify=False, jobs=1, use_async=False, sleep_secs=None):
+    """
+    Check stage: generator that runs the tests (or with verify, the
+    verifications) for an iterable of input lines (see
+    pydnstest.pipeline.read_lines()), yielding each result dict, or a
+    pydnstest.pipeline.LineError for a line that could not be checked, in
+    input order.
+
+    @param jobs number of lines to run at once, on a pool of threads (or
+      with use_async, on an asyncio event loop)
+    @param sleep_secs optional number of seconds to sleep after each line
+    """
+    if use_async:
+        for r in run_lines_async(lines, parser, chk, verify=verify, jobs=jobs, sleep_secs=sleep_secs):
+            yield r
+        return
+    if jobs > 1:
+        for r in run_lines_concurrently(lines, parser, chk, verify=verify, jobs=jobs, sleep_secs=sleep_secs):
+            yield r
+        return
+    for line in lines:
+        # the error reported for the line (see report_line_error()), if any,
+        # is yielded instead of being printed
+        errors = _line_errors.errors = []
+        try:
+            if verify:
+                r = run_verify_line(line, parser, chk)
+            else:
+                r = run_check_line(line, parser, chk)
+        finally:
+            _line_errors.errors = None
+        if errors:
+            yield LineError(errors[-1])
+            continue
+        yield r
+        # sleep once the result has been handled, before the next line
+        if r is not False and sleep_secs is not None and sleep_secs > 0.0:
+            sleep(sleep_secs)
 
 
 def format_test_output(res):
     """
     Prints test output in a nice textual format
     """
-    if res['result']:
-        print("OK: %s" % res['message'])
-    else:
-        print("**NG: %s" % res['message'])
-    for m in res['secondary']:
-        print("\t%s" % m)
-    for w in res['warnings']:
-        print("\t%s" % w)
+    for line in format_result(res):
+        print(line)
 
 
 def main(options):
@@ -154,18 +454,152 @@ def main(options):
     if options.ignorettl:
         config.ignore_ttl = True
 
+    if options.parallel_lookups:
+        config.parallel_lookups = True
+
+    if options.socket_pool:
+        config.socket_pool = True
+
+    if options.adaptive_timeout:
+        config.adaptive_timeout = True
+    if options.retries is not None:
+        if options.retries < 0:
+            print("ERROR: --retries must not be negative.")
+            raise SystemExit(1)
+        config.retries = options.retries
+
+    if options.max_qps is not None:
+        if options.max_qps <= 0:
+            print("ERROR: --max-qps must be greater than 0.")
+            raise SystemExit(1)
+        config.max_qps = options.max_qps
+
+    if options.snapshot_zones:
+        config.snapshot_zones = options.snapshot_zones
+    if options.test_zone_files:
+        config.test_zone_files = options.test_zone_files
+    if options.prod_zone_files:
+        config.prod_zone_files = options.prod_zone_files
+
+    if options.record_file and options.replay_file:
+        print("ERROR: --record and --replay cannot be used together.")
+        raise SystemExit(1)
+    config.record_file = options.record_file
+    config.replay_file = options.replay_file
+
+    if options.no_cache:
+        config.query_cache = False
+    if options.cache_size is not None:
+        if options.cache_size < 1:
+            print("ERROR: --cache-size must be at least 1.")
+            raise SystemExit(1)
+        config.cache_size = options.cache_size
+    if options.cache_honor_ttl:
+        config.cache_honor_ttl = True
+    if options.parse_cache_size is not None and options.parse_cache_size < 0:
+        print("ERROR: --parse-cache-size must not be negative.")
+        raise SystemExit(1)
+    if options.parse_processes is not None:
+        if options.parse_processes < 1:
+            print("ERROR: --parse-processes must be at least 1.")
+            raise SystemExit(1)
+        if not options.testfile:
+            print("ERROR: --parse-processes requires -f / --file.")
+            raise SystemExit(1)
+
     if options.configprint:
         print("# {fname}".format(fname=config.conf_file))
         print(config.to_string())
         raise SystemExit(0)
 
+    from pydnstest.checks import DNStestChecks
     parser = DnstestParser()
     chk = DNStestChecks(config)
 
+    chunked = None
+    parse_cache = None
+    if options.parse_processes is not None:
+        # lines are parsed ahead in the worker processes, so there's nothing to cache
+        chunked = parser = ChunkedParser(options.testfile, processes=options.parse_processes,
+                                         trace=bool(options.trace_file))
+    elif options.parse_cache_size is None:
+        parse_cache = parser = ParseCache(parser)
+    elif options.parse_cache_size > 0:
+        parse_cache = parser = ParseCache(parser, maxsize=options.parse_cache_size)
+
+    timings = None
+    if options.timings or options.timings_file:
+        timings = chk.DNS.timings = Timings()
+        parser = TimedParser(parser, timings)
+
+    metrics_server = None
+    if options.metrics_file or options.metrics_port is not None:
+        from pydnstest.metrics import QueryMetrics, MetricsServer
+        chk.DNS.metrics = QueryMetrics()
+
     if options.sleep:
         config.sleep = options.sleep
         print("Note - will sleep %g seconds between lines" % options.sleep)
 
+    if config.max_qps is not None:
+        print("Note - will send at most %g queries per second to each server" % config.max_qps)
+
+    store = None
+    if options.snapshot_dir:
+        if not config.snapshot_zones:
+            print("ERROR: --snapshot-dir requires at least one --snapshot-zone.")
+            raise SystemExit(1)
+        if options.jobs > 1 or options.use_async:
+            print("ERROR: --snapshot-dir cannot be used with --jobs or --async.")
+            raise SystemExit(1)
+        from pydnstest.incremental import SnapshotStore, config_fingerprint
+        store = SnapshotStore(options.snapshot_dir)
+    if config.snapshot_zones:
+        chk.DNS.snapshots, changed, serials = load_snapshots(config, store)
+    if config.test_zone_files or config.prod_zone_files:
+        if config.server_test == config.server_prod:
+            print("ERROR: --test-zone-file and --prod-zone-file require different test and prod servers.")
+            raise SystemExit(1)
+        if chk.DNS.snapshots is None:
+            from pydnstest.snapshot import SnapshotSet
+            chk.DNS.snapshots = SnapshotSet()
+        zone_file_serials = load_zone_files(config, chk.DNS.snapshots)
+        if store is not None:
+            serials.update(zone_file_serials)
+
+    if config.record_file or config.replay_file:
+        import DNS
+        from pydnstest.cassette import Cassette
+        try:
+            chk.DNS.cassette = Cassette(config.replay_file or config.record_file,
+                                        replay=bool(config.replay_file))
+        except (IOError, OSError, DNS.DNSError) as e:
+            print("ERROR: %s" % e)
+            raise SystemExit(1)
+
+    if options.trace_file:
+        try:
+            chk.DNS.trace = QueryTrace(options.trace_file)
+        except (IOError, OSError) as e:
+            print("ERROR: %s" % e)
+            raise SystemExit(1)
+
+    if options.jobs < 1:
+        print("ERROR: --jobs must be at least 1.")
+        raise SystemExit(1)
+
+    if options.use_async and sys.version_info < (3, 5):
+        print("ERROR: --async requires Python 3.5 or newer.")
+        raise SystemExit(1)
+
+    if options.metrics_port is not None:
+        try:
+            metrics_server = MetricsServer(chk.DNS.metrics, options.metrics_port, host=options.metrics_host)
+        except (IOError, OSError) as e:
+            print("ERROR: could not serve metrics on %s port %d: %s" % (options.metrics_host, options.metrics_port, e))
+            raise SystemExit(1)
+        print("Note - serving query metrics on port %d" % metrics_server.port)
+
     # if no other options, read from stdin
     if options.testfile:
         if not os.path.exists(options.testfile):
@@ -178,27 +612,59 @@ def main(options):
         fh = sys.stdin
 
     # read input line by line, handle each line as we're given it
-    passed = 0
-    failed = 0
-    for line in fh:
-        line = line.strip()
-        if not line:
-            continue
-        if line[:1] == "#":
-            continue
-        if options.verify:
-            r = run_verify_line(line, parser, chk)
-        else:
-            r = run_check_line(line, parser, chk)
-        if r is False:
-            continue
-        elif r['result']:
-            passed = passed + 1
+    if chunked is not None:
+        lines = chunked
+    else:
+        lines = read_lines(fh, trace=chk.DNS.trace is not None)
+    if store is not None:
+        fingerprint = config_fingerprint(config)
+        previous = store.load_results(serials, fingerprint)
+        line_results = {}
+        results = run_lines_incremental(lines, parser, chk, previous, changed, line_results,
+                                        verify=options.verify, sleep_secs=config.sleep)
+    else:
+        results = check_lines(lines, parser, chk, verify=options.verify, jobs=options.jobs,
+                              use_async=options.use_async, sleep_secs=config.sleep)
+    passed, failed = consume(results, TextSink(), timings=timings)
+    chk.DNS.close()
+
+    cassette = chk.DNS.cassette
+    if cassette is not None:
+        cassette.close()
+        if cassette.replay:
+            print("Note - replayed %d query results from %s" % (cassette.hits, cassette.path))
         else:
-            failed = failed + 1
-        format_test_output(r)
-        if config.sleep is not None and config.sleep > 0.0:
-            sleep(config.sleep)
+            print("Note - recorded %d query results to %s" % (len(cassette), cassette.path))
+
+    if store is not None:
+        store.save(chk.DNS.snapshots, fingerprint, line_results)
+        reused = len([k for k in line_results if line_results[k] is previous.get(k)])
+        print("Note - re-checked %d of %d lines; the rest were unchanged since the last run" % (
+            passed + failed - reused, passed + failed))
+
+    cache = chk.DNS.cache
+    if cache is not None and cache.hits + cache.misses > 0:
+        print("Note - %s" % cache.stats_string())
+    # only worth mentioning if some lines were repeated
+    if parse_cache is not None and parse_cache.hits > 0:
+        print("Note - %s" % parse_cache.stats_string())
+
+    if chk.DNS.trace is not None:
+        chk.DNS.trace.close()
+        print("Note - traced %d queries to %s" % (chk.DNS.trace.count, chk.DNS.trace.path))
+
+    if options.metrics_file:
+        chk.DNS.metrics.write(options.metrics_file)
+    if metrics_server is not None:
+        metrics_server.close()
+
+    if timings is not None:
+        timings.finish()
+        if options.timings:
+            for line in timings.report():
+                print("Note - %s" % line)
+        if options.timings_file:
+            timings.write(options.timings_file)
 
     msg = ""
     if failed == 0:
@@ -216,12 +682,11 @@ def parse_opts():
     """
     Runs OptionParser and calls main() with the resulting options.
     """
-    usage = "%prog [-h|--help] [--version] [-c|--config path_to_config] [-f|--file path_to_test_file] [-V|--verify]"
+    usage = "%prog [-h|--help] [--version] [-c|--config path_to_config] [-f|--file path_to_test_file] [-V|--verify] [-j|--jobs N]"
     usage += "\n\npydnstest %s - <https://github.com/jantman/pydnstest/>" % VERSION
     usage += "\nlicensed under the GNU Affero General Public License - see LICENSE.txt"
     usage += "\nGrammar:\n\n"
-    parser = DnstestParser()
-    for s in parser.get_grammar():
+    for s in DnstestParser.grammar_strings:
         usage += "{s}\n".format(s=s)
     p = optparse.OptionParser(usage=usage, version="pydnstest %s" % VERSION)
     p.add_option('-c', '--config', dest='config_file',
@@ -236,6 +701,94 @@ def parse_opts():
     p.add_option('-s', '--sleep', dest='sleep', action='store', type='float',
                  help='optionally, a decimal number of seconds to sleep between queries')
 
+    p.add_option('--max-qps', dest='max_qps', action='store', type='float',
+                 help='send at most this many queries per second to each DNS server; '
+                 'unlike --sleep, this paces queries rather than lines')
+
+    p.add_option('-j', '--jobs', dest='jobs', action='store', type='int', default=1,
+                 help='number of input lines to test concurrently (default 1); output is '
+                 'still printed in input order')
+
+    p.add_option('--async', dest='use_async', default=False, action='store_true',
+                 help='send queries from a single thread with the asyncio resolver '
+                 '(Python 3.5+); use --jobs to set how many lines are in flight at once')
+
+    p.add_option('--parallel-lookups', dest='parallel_lookups', default=False, action='store_true',
+                 help='send the A and CNAME queries for a name at the same time, rather '
+                 'than only querying CNAME after A returns no answer')
+
+    p.add_option('--socket-pool', dest='socket_pool', default=False, action='store_true',
+                 help='keep sockets to each DNS server open and reuse them for all queries, '
+                 'instead of opening a new socket per query')
+
+    p.add_option('--adaptive-timeout', dest='adaptive_timeout', default=False, action='store_true',
+                 help='time out and retransmit queries based on each server\'s measured '
+                 'round-trip time, instead of a fixed timeout')
+
+    p.add_option('--retries', dest='retries', action='store', type='int',
+                 help='with --adaptive-timeout, how many times to retransmit an unanswered '
+                 'query (default 2)')
+
+    p.add_option('--snapshot-zone', dest='snapshot_zones', action='append', metavar='ZONE',
+                 help='transfer (AXFR) ZONE from the test and prod servers once, and answer '
+                 'all queries for names in it from those copies; may be given more than once')
+
+    p.add_option('--snapshot-dir', dest='snapshot_dir', action='store', metavar='DIR',
+                 help='keep --snapshot-zone snapshots and results in DIR between runs; refresh them '
+                 'with incremental zone transfers and only re-check lines whose names changed '
+                 '(not with --jobs or --async)')
+    p.add_option('--test-zone-file', dest='test_zone_files', action='append', metavar='[ZONE=]FILE',
+                 help='answer queries to the TEST server for names in a zone from the BIND zone file '
+                 'FILE instead (i.e. before it is deployed); ZONE defaults to the file\'s $ORIGIN or SOA '
+                 'name. May be given more than once')
+
+    p.add_option('--prod-zone-file', dest='prod_zone_files', action='append', metavar='[ZONE=]FILE',
+                 help='like --test-zone-file, for the PROD server')
+
+    p.add_option('--record', dest='record_file', action='store', metavar='FILE',
+                 help='append every DNS query result to the cassette FILE, for --replay')
+
+    p.add_option('--replay', dest='replay_file', action='store', metavar='FILE',
+                 help='answer every DNS query from the cassette FILE written by --record, '
+                 'without any network access (give the same other options as when recording)')
+
+    p.add_option('--no-cache', dest='no_cache', default=False, action='store_true',
+                 help='do not cache query results for the rest of the run')
+
+    p.add_option('--cache-size', dest='cache_size', action='store', type='int',
+                 help='maximum number of query results to cache (default 10000)')
+
+    p.add_option('--cache-honor-ttl', dest='cache_honor_ttl', default=False, action='store_true',
+                 help='expire cached query results according to their TTLs')
+
+    p.add_option('--parse-cache-size', dest='parse_cache_size', action='store', type='int',
+                 help='maximum number of distinct parsed input lines to cache, so that repeated '
+                 'lines are only parsed once (default 10000; 0 to disable)')
+
+    p.add_option('--parse-processes', dest='parse_processes', action='store', type='int', metavar='N',
+                 help='parse the test file (-f) in chunks on N worker processes, ahead of checking it')
+
+    p.add_option('--timings', dest='timings', default=False, action='store_true',
+                 help='print the time spent parsing lines, waiting on queries, evaluating '
+                 'and printing results, and the queries made to each server')
+    p.add_option('--timings-file', dest='timings_file', action='store', metavar='FILE',
+                 help='write the same timings to FILE as JSON')
+
+    p.add_option('--trace', dest='trace_file', action='store', metavar='FILE',
+                 help='write a JSON line to FILE for every DNS query made, with its input line '
+                 'number, server, name, type, start time, RTT, response code, answer count and '
+                 'whether it was answered from the query cache')
+
+    p.add_option('--metrics-file', dest='metrics_file', action='store', metavar='FILE',
+                 help='at the end of the run, write per-server query latency histograms and '
+                 'response counts to FILE in OpenMetrics text format')
+
+    p.add_option('--metrics-port', dest='metrics_port', action='store', type='int', metavar='PORT',
+                 help='serve the same metrics over HTTP on PORT while the run is in progress')
+
+    p.add_option('--metrics-host', dest='metrics_host', action='store', default='127.0.0.1', metavar='ADDRESS',
+                 help='address to serve --metrics-port on (default: 127.0.0.1; use 0.0.0.0 for all interfaces)')
+
     p.add_option('-t', '--ignore-ttl', dest='ignorettl', default=False, action='store_true',
                  help='when comparing responses, ignore the TTL value')
 
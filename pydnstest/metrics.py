@@ -0,0 +1,275 @@
+"""
+Per-server DNS query latency histograms and outcome counts, in OpenMetrics format
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import os
+import threading
+from bisect import bisect_left
+
+import DNS
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+# sub-buckets per power of two in LatencyHistogram; 2 ** (SUB_BITS - 1) is
+# the minimum, so values are kept to within 1/64 (~1.6%) of what was recorded
+SUB_BITS = 7
+HALF = 1 << (SUB_BITS - 1)
+
+#: upper bounds (seconds) of the OpenMetrics histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#: quantiles exported from each LatencyHistogram
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+#: the outcome counted for a query that timed out
+TIMEOUT = 'timeout'
+
+#: the outcome counted for a query that failed for any other reason
+ERROR = 'error'
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def _index(v):
+    """
+    Return the LatencyHistogram bucket index of v (an int >= 0)
+    """
+    if v < 2 * HALF:
+        return v
+    shift = v.bit_length() - SUB_BITS
+    return HALF * shift + (v >> shift)
+
+
+def _bounds(i):
+    """
+    Return the (lowest, highest) values counted in bucket i
+    """
+    if i < 2 * HALF:
+        return i, i
+    shift = i // HALF - 1
+    m = i - HALF * shift
+    return m << shift, ((m + 1) << shift) - 1
+
+
+class LatencyHistogram(object):
+    """
+    HDR-style (log-linear) histogram of latencies, recorded in whole
+    microseconds: each power of two is split into 64 equal buckets, so any
+    value from a microsecond to hours is kept to within ~1.6% in a few
+    hundred counters at most.
+
+    Not thread-safe on its own; QueryMetrics serializes access.
+    """
+
+    def __init__(self):
+        # bucket index -> count
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        """
+        Record one latency, in seconds
+        """
+        us = max(0, int(seconds * 1000000))
+        i = _index(us)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or us < self.min:
+            self.min = us
+        if self.max is None or us > self.max:
+            self.max = us
+
+    def quantile(self, q):
+        """
+        Return the latency (in seconds) that a fraction q of the recorded
+        latencies are at or below, or None if nothing was recorded
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                low, high = _bounds(i)
+                return min(max((low + high) // 2, self.min), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(**kwargs):
+    return ','.join('%s="%s"' % (k, _label(kwargs[k])) for k in sorted(kwargs))
+
+
+def _num(f):
+    return repr(float(f))
+
+
+class QueryMetrics(object):
+    """
+    Thread-safe per-(server, qtype) LatencyHistograms of the round-trip time
+    of the DNS queries a resolver sends, with counts of their outcomes (the
+    response status, i.e. NOERROR / NXDOMAIN / SERVFAIL, or TIMEOUT or
+    ERROR), exported in the OpenMetrics text format.
+    """
+
+    def __init__(self):
+        # (server, qtype) -> [LatencyHistogram, counts per BUCKETS bound]
+        self.latency = {}
+        # (server, qtype, outcome) -> count
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def _count(self, server, qtype, outcome):
+        key = (server, qtype, outcome)
+        self.outcomes[key] = self.outcomes.get(key, 0) + 1
+
+    def observe(self, server, qtype, seconds, status):
+        """
+        Record a qtype query to server that got a response with status
+        (i.e. 'NOERROR') after seconds
+        """
+        with self._lock:
+            self._count(server, qtype, status)
+            h = self.latency.get((server, qtype))
+            if h is None:
+                h = self.latency[(server, qtype)] = [LatencyHistogram(), [0] * len(BUCKETS)]
+            h[0].record(seconds)
+            i = bisect_left(BUCKETS, seconds)
+            if i < len(BUCKETS):
+                h[1][i] += 1
+
+    def failed(self, server, qtype, exc):
+        """
+        Count a qtype query to server that raised exc instead of getting a
+        response: as TIMEOUT for a DNS.TimeoutError, otherwise as ERROR.
+        Its latency is not recorded.
+        """
+        with self._lock:
+            self._count(server, qtype, TIMEOUT if isinstance(exc, DNS.TimeoutError) else ERROR)
+
+    def to_openmetrics(self):
+        """
+        Return the metrics as an OpenMetrics text exposition
+        """
+        name = 'pydnstest_query_duration_seconds'
+        lines = ['# TYPE %s histogram' % name, '# UNIT %s seconds' % name,
+                 '# HELP %s Round-trip time of DNS queries sent.' % name]
+        qname = 'pydnstest_query_duration_quantiles_seconds'
+        quantiles = ['# TYPE %s summary' % qname, '# UNIT %s seconds' % qname,
+                     '# HELP %s Quantiles of the round-trip time of DNS queries sent.' % qname]
+        with self._lock:
+            for server, qtype in sorted(self.latency):
+                h, buckets = self.latency[(server, qtype)]
+                labels = _labels(server=server, qtype=qtype)
+                seen = 0
+                for bound, n in zip(BUCKETS, buckets):
+                    seen += n
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, _num(bound), seen))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, h.count))
+                lines.append('%s_count{%s} %d' % (name, labels, h.count))
+                lines.append('%s_sum{%s} %s' % (name, labels, _num(h.total)))
+                for q in QUANTILES:
+                    quantiles.append('%s{%s,quantile="%s"} %s' % (qname, labels, _num(q), _num(h.quantile(q))))
+                quantiles.append('%s_count{%s} %d' % (qname, labels, h.count))
+                quantiles.append('%s_sum{%s} %s' % (qname, labels, _num(h.total)))
+            lines.extend(quantiles)
+            lines.extend(['# TYPE pydnstest_queries counter',
+                          '# HELP pydnstest_queries DNS queries sent, by outcome.'])
+            for server, qtype, outcome in sorted(self.outcomes):
+                lines.append('pydnstest_queries_total{%s} %d' % (
+                    _labels(server=server, qtype=qtype, outcome=outcome),
+                    self.outcomes[(server, qtype, outcome)]))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Write the metrics to path, replacing it atomically (so that i.e. the
+        node_exporter textfile collector never sees a partial file)
+        """
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'w') as fh:
+            fh.write(self.to_openmetrics())
+        os.rename(tmp, path)
+
+
+class MetricsServer(object):
+    """
+    Serves a QueryMetrics' current metrics over HTTP (at any path) from a
+    daemon thread, for scraping while a long run is in progress
+    """
+
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        """
+        @param metrics QueryMetrics to serve
+        @param port TCP port to listen on (0 for any free port)
+        @param host address to listen on (default: localhost only)
+        """
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_openmetrics().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer((host, port), Handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
@@ -37,19 +37,229 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 """
 
-from pyparsing import Word, alphas, alphanums, Suppress, Optional, Or, Regex, Literal, Keyword, MatchFirst, And, NotAny, ParseResults
+import re
+import string
+from collections import namedtuple
 
+try:
+    from sys import intern
+except ImportError:  # python 2; intern is a builtin
+    pass
 
-class DnstestParser:
+# the same patterns as the fqdn and ipaddr grammar elements (see _grammar())
+FQDN_RE = re.compile(r"(([a-zA-Z0-9_\-]{0,62}[a-zA-Z0-9])(\.([a-zA-Z0-9_\-]{0,62}[a-zA-Z0-9]))*)")
+IPADDR_RE = re.compile(r"((([0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.){3}(1[0-9]{2}|2[0-4][0-9]|25[0-5]|[1-9][0-9]|[0-9]))")
+
+# pyparsing's default whitespace, and the characters a Keyword may not touch
+WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+WORD_RE = re.compile(r"[a-zA-Z0-9_$]*")
+IDENT_CHARS = frozenset(string.ascii_letters + string.digits + "_$")
+
+#: ChangeRecord operation codes
+ADD, REMOVE, RENAME, CHANGE, CONFIRM = range(5)
+
+#: operation names (as in parse_line() dicts), indexed by operation code
+OPERATIONS = ('add', 'remove', 'rename', 'change', 'confirm')
+
+#: operation name -> operation code
+OP_CODES = dict((name, code) for code, name in enumerate(OPERATIONS))
+
+
+class ChangeRecord(namedtuple('ChangeRecord', ['op', 'hostname', 'value', 'newname'])):
     """
-    Parses natural-language-like grammar describing DNS changes
+    Compact, immutable form of a parsed input line (see
+    DnstestParser.parse_record()), for holding whole change sets in
+    memory: an operation code (ADD, REMOVE, ...) and interned hostname,
+    value and newname strings (None for fields the operation doesn't have).
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, op, hostname, value=None, newname=None):
+        if value is not None:
+            value = intern(value)
+        if newname is not None:
+            newname = intern(newname)
+        return super(ChangeRecord, cls).__new__(cls, op, intern(hostname), value, newname)
+
+    @property
+    def operation(self):
+        """
+        the operation name, i.e. 'add'
+        """
+        return OPERATIONS[self.op]
+
+    def to_dict(self):
+        """
+        Return the dict DnstestParser.parse_line() returns for the same line
+        """
+        d = {'operation': OPERATIONS[self.op], 'hostname': self.hostname}
+        if self.value is not None:
+            d['value'] = self.value
+        if self.newname is not None:
+            d['newname'] = self.newname
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Return the ChangeRecord for a DnstestParser.parse_line() dict;
+        raises KeyError for an unknown operation
+        """
+        return cls(OP_CODES[d['operation']], d['hostname'], d.get('value'), d.get('newname'))
+
+
+# pyparsing's ParseException, imported by parse_exception() the first time
+# it's needed
+_ParseException = None
+
+
+def parse_exception():
+    """
+    Return pyparsing's ParseException. As an ``except`` clause's expression
+    is only evaluated once something has been raised, pyparsing is still
+    only imported when a line fails to parse.
+    """
+    global _ParseException
+    if _ParseException is None:
+        from pyparsing import ParseException
+        _ParseException = ParseException
+    return _ParseException
+
+
+REC_WORDS = ("record", "entry", "name")
+VAL_WORDS = ("value", "address", "target")
+
+
+def _error(line, pos, msg):
+    """
+    Return a pyparsing ParseException to raise; pyparsing is only imported
+    here, so that lines that parse never need it
+    """
+    return parse_exception()(line, pos, msg)
+
+
+def _skip(line, pos):
+    return WHITESPACE_RE.match(line, pos).end()
+
+
+def _keyword(line, pos, words):
+    """
+    Return the position after whichever of words is at pos (after
+    whitespace) as a whole word, like pyparsing.Keyword, or None
+    """
+    pos = _skip(line, pos)
+    for w in words:
+        if line.startswith(w, pos):
+            end = pos + len(w)
+            if (end == len(line) or line[end] not in IDENT_CHARS) and (pos == 0 or line[pos - 1] not in IDENT_CHARS):
+                return end
+    return None
+
+
+def _name(line, pos, allow_ip):
+    """
+    Match the hostname_fqdn_or_ip grammar element (or, if not allow_ip,
+    hostname_or_fqdn) at pos, returning a (string, end position) pair
+    """
+    pos = _skip(line, pos)
+    ip = IPADDR_RE.match(line, pos)
+    if ip is not None:
+        if not allow_ip:
+            raise _error(line, pos, "Found unwanted token, IP address")
+        return ip.group(0), ip.end()
+    # the hostname grammar element is always matched by fqdn too
+    m = FQDN_RE.match(line, pos)
+    if m is None:
+        raise _error(line, pos, "Expected hostname, FQDN or IP address")
+    return m.group(0), m.end()
+
+
+def _expect(line, pos, words):
+    end = _keyword(line, pos, words)
+    if end is None:
+        raise _error(line, _skip(line, pos), "Expected %s" % " or ".join('"%s"' % w for w in words))
+    return end
+
+
+def _optional(line, pos, words):
+    end = _keyword(line, pos, words)
+    if end is None:
+        return pos
+    return end
+
+
+def _val_op(line, pos):
+    """
+    Match the val_op grammar element at pos, returning the end position or None
     """
+    end = _keyword(line, _optional(line, pos, ("with",)), VAL_WORDS)
+    return end
+
+
+def _match_add(line, pos):
+    pos = _optional(line, pos, REC_WORDS)
+    hostname, pos = _name(line, pos, False)
+    end = _val_op(line, pos)
+    if end is None:
+        raise _error(line, _skip(line, pos), "Expected value, address or target")
+    value, pos = _name(line, end, True)
+    return (ADD, hostname, value, None), pos
+
+
+def _match_remove(line, pos):
+    pos = _optional(line, pos, REC_WORDS)
+    hostname, pos = _name(line, pos, True)
+    return (REMOVE, hostname, None, None), pos
+
 
-    grammar_strings = []
+def _match_rename(line, pos):
+    pos = _optional(line, pos, REC_WORDS)
+    hostname, pos = _name(line, pos, False)
+    end = _val_op(line, pos)
+    if end is not None:
+        pos = end
+    value, pos = _name(line, pos, True)
+    pos = _expect(line, pos, ("to",))
+    newname, pos = _name(line, pos, False)
+    return (RENAME, hostname, value, newname), pos
+
+
+def _match_change(line, pos):
+    pos = _optional(line, pos, REC_WORDS)
+    hostname, pos = _name(line, pos, False)
+    pos = _expect(line, pos, ("to",))
+    value, pos = _name(line, pos, True)
+    return (CHANGE, hostname, value, None), pos
+
+
+def _match_confirm(line, pos):
+    pos = _optional(line, pos, REC_WORDS)
+    hostname, pos = _name(line, pos, False)
+    return (CONFIRM, hostname, None, None), pos
+
+
+# first token of a line -> function matching the rest of it, which returns
+# (ChangeRecord fields, end position)
+MATCHERS = {'add': _match_add, 'remove': _match_remove, 'rename': _match_rename,
+            'change': _match_change, 'confirm': _match_confirm}
+
+
+# the pyparsing grammar, built by _grammar() the first time it's needed
+_GRAMMAR = None
+
+
+def _grammar():
+    """
+    Return a (commands, line_parser) pair: a dict of the pyparsing grammar
+    for each command, keyed by its first word, and the grammar for any line
+    """
+    global _GRAMMAR
+    if _GRAMMAR is not None:
+        return _GRAMMAR
+    from pyparsing import Suppress, Optional, Or, Regex, Keyword, MatchFirst, And, NotAny
 
     # implement my grammar
-    word = Word(alphas)
-    value = Word(alphanums).setResultsName("value")
     add_op = Keyword("add").setResultsName("operation")
     rm_op = Keyword("remove").setResultsName("operation")
     rename_op = Keyword("rename").setResultsName("operation")
@@ -64,33 +274,95 @@ class DnstestParser:
     hostname_or_fqdn = And([NotAny(ipaddr), MatchFirst([fqdn, hostname])])
     hostname_fqdn_or_ip = MatchFirst([ipaddr, fqdn, hostname])
 
-    grammar_strings.append('add (record|name|entry)? <hostname_or_fqdn> (with ?)(value|address|target)? <hostname_fqdn_or_ip>')
     cmd_add = add_op + Optional(rec_op) + hostname_or_fqdn.setResultsName("hostname") + Suppress(val_op) + hostname_fqdn_or_ip.setResultsName('value')
-
-    grammar_strings.append('remove (record|name|entry)? <hostname_or_fqdn>')
     cmd_remove = rm_op + Optional(rec_op) + hostname_fqdn_or_ip.setResultsName("hostname")
-
-    grammar_strings.append('rename (record|name|entry)? <hostname_or_fqdn> (with ?)(value ?) <value> to <hostname_or_fqdn>')
     cmd_rename = rename_op + Suppress(Optional(rec_op)) + hostname_or_fqdn.setResultsName("hostname") + Suppress(Optional(val_op)) + hostname_fqdn_or_ip.setResultsName('value') + Suppress(Keyword("to")) + hostname_or_fqdn.setResultsName('newname')
-
-    grammar_strings.append('change (record|name|entry)? <hostname_or_fqdn> to <hostname_fqdn_or_ip>')
     cmd_change = change_op + Suppress(Optional(rec_op)) + hostname_or_fqdn.setResultsName("hostname") + Suppress(Keyword("to")) + hostname_fqdn_or_ip.setResultsName('value')
-
-    grammar_strings.append('confirm (record|name|entry)? <hostname_or_fqdn>')
     cmd_confirm = confirm_op + Suppress(Optional(rec_op)) + hostname_or_fqdn.setResultsName("hostname")
 
     line_parser = Or([cmd_confirm, cmd_add, cmd_remove, cmd_rename, cmd_change])
 
+    # every command starts with its own keyword, so that decides which grammar applies
+    commands = {'add': cmd_add, 'remove': cmd_remove, 'rename': cmd_rename, 'change': cmd_change,
+                'confirm': cmd_confirm}
+    _GRAMMAR = (commands, line_parser)
+    return _GRAMMAR
+
+
+class DnstestParser:
+    """
+    Parses natural-language-like grammar describing DNS changes
+    """
+
+    grammar_strings = [
+        'add (record|name|entry)? <hostname_or_fqdn> (with ?)(value|address|target)? <hostname_fqdn_or_ip>',
+        'remove (record|name|entry)? <hostname_or_fqdn>',
+        'rename (record|name|entry)? <hostname_or_fqdn> (with ?)(value ?) <value> to <hostname_or_fqdn>',
+        'change (record|name|entry)? <hostname_or_fqdn> to <hostname_fqdn_or_ip>',
+        'confirm (record|name|entry)? <hostname_or_fqdn>',
+    ]
+
     def __init__(self):
         pass
 
     def parse_line(self, line):
-        res = self.line_parser.parseString(line, parseAll=True)
+        """
+        Parse an input line, returning a dict with 'operation',
+        'hostname' and (depending on the operation) 'value' and 'newname'
+        keys; raises ParseException if it doesn't match the grammar.
+
+        Matches the grammar by hand: the first word picks the command, and
+        the rest is matched with the same regular expressions and keyword
+        rules as the pyparsing grammar (see parse_line_pyparsing()), with
+        the same results, without trying the other four commands.
+        """
+        op, hostname, value, newname = self.parse_fields(line)
+        d = {'operation': OPERATIONS[op], 'hostname': hostname}
+        if value is not None:
+            d['value'] = value
+        if newname is not None:
+            d['newname'] = newname
+        return d
+
+    def parse_record(self, line):
+        """
+        Parse an input line like parse_line(), but return a ChangeRecord
+        """
+        return ChangeRecord(*self.parse_fields(line))
+
+    def parse_fields(self, line):
+        """
+        Parse an input line like parse_record(), but return the
+        ChangeRecord's fields as a plain (op, hostname, value, newname)
+        tuple
+        """
+        pos = _skip(line, 0)
+        word = WORD_RE.match(line, pos).group(0)
+        matcher = MATCHERS.get(word)
+        if matcher is None:
+            raise _error(line, pos, "Expected one of: %s" % ", ".join(sorted(MATCHERS)))
+        fields, pos = matcher(line, pos + len(word))
+        pos = _skip(line, pos)
+        if pos != len(line):
+            raise _error(line, pos, "Expected end of text")
+        return fields
+
+    def parse_line_pyparsing(self, line):
+        """
+        Parse an input line with the pyparsing grammar for its first word
+        (or for any command, if that isn't one), returning the same dict
+        as parse_line(). The grammar is built the first time this is called.
+        """
+        from pyparsing import ParseResults
+        commands, line_parser = _grammar()
+        words = line.split(None, 1)
+        grammar = commands.get(words[0] if words else None, line_parser)
+        res = grammar.parseString(line, parseAll=True)
         d = res.asDict()
         # hostname_or_fqdn using And and NotAny now returns a ParseResults object instead of a string,
-        # we need to convert that to a string to just take the first value
+        # (or, with newer pyparsing, a list) we need to convert that to a string to just take the first value
         for i in d:
-            if isinstance(d[i], ParseResults):
+            if isinstance(d[i], (ParseResults, list)):
                 d[i] = d[i][0]
         return d
 
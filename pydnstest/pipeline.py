@@ -0,0 +1,292 @@
+"""
+Streaming stages for running pydnstest input: sources, result formatting and sinks
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import io
+import os
+import sys
+import time
+from collections import deque, namedtuple
+
+from pydnstest.parser import DnstestParser, ChangeRecord, parse_exception
+from pydnstest.trace import set_line
+
+#: default size in bytes of the chunks parse_file() splits files into
+CHUNK_SIZE = 1024 * 1024
+
+# the parser each parse_file() worker process uses
+_parser = DnstestParser()
+
+
+def read_lines(source, trace=False):
+    """
+    Source stage: generator of the stripped, non-blank, non-comment lines
+    of source (a file, or any iterable of strings). If trace is True, each
+    line's number in source is set for pydnstest.trace as it is read.
+    """
+    for n, line in enumerate(source, 1):
+        line = line.strip()
+        if line and line[:1] != "#":
+            if trace:
+                set_line(n)
+            yield line
+
+
+def imap_bounded(pool, func, items, size):
+    """
+    Like pool.imap(func, items), but with at most size items handed to the
+    pool and not yet yielded, so that items are only read from as fast as
+    results are consumed (Pool.imap() reads all of them up front).
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= size:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def chunk_ranges(path, chunk_size=CHUNK_SIZE):
+    """
+    Return a list of (start, end) byte ranges covering the file at path,
+    each about chunk_size bytes long and ending at the end of a line
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as fh:
+        while start < size:
+            if start + chunk_size >= size:
+                end = size
+            else:
+                fh.seek(start + chunk_size - 1)
+                fh.readline()
+                end = fh.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_chunk(args):
+    """
+    Parse the lines in a (path, start, end) byte range of a file, in a
+    parse_file() worker process. Returns the number of lines in the range,
+    and for each line read_lines() would give, a tuple of its line number
+    within the range and its ChangeRecord fields, or None, position and
+    message of the ParseException. (Plain tuples are much quicker to send
+    back than ChangeRecords and lines; the main process reads the lines
+    itself.)
+    """
+    path, start, end = args
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    results = []
+    n = 0
+    # decoded and split into lines as open(path, 'r') would
+    for n, line in enumerate(io.TextIOWrapper(io.BytesIO(data)), 1):
+        line = line.strip()
+        if not line or line[:1] == "#":
+            continue
+        try:
+            results.append((n,) + _parser.parse_fields(line))
+        except parse_exception() as e:
+            results.append((n, None, e.loc, e.msg))
+    return n, results
+
+
+def parse_file(path, processes=None, chunk_size=CHUNK_SIZE):
+    """
+    Parse stage: generator that splits the file at path into chunks of
+    about chunk_size bytes (on line boundaries), parses them in a pool of
+    processes (default: one per CPU) and yields a (line number, line,
+    result) tuple for each stripped, non-blank, non-comment line, in input
+    order. result is the line's ChangeRecord (see
+    DnstestParser.parse_record(); its strings are shared between the lines
+    of each chunk, rather than interned), or the ParseException it raised.
+
+    Only a couple of chunks per process are parsed ahead of the lines
+    being consumed.
+    """
+    from multiprocessing import Pool, cpu_count
+    if processes is None:
+        processes = cpu_count()
+    chunks = [(path, start, end) for start, end in chunk_ranges(path, chunk_size)]
+    make = ChangeRecord._make
+    pool = Pool(processes)
+    try:
+        with open(path, 'r') as fh:
+            lines = enumerate(fh, 1)
+            offset = 0
+            for count, results in imap_bounded(pool, _parse_chunk, chunks, 2 * processes):
+                for r in results:
+                    # the line itself is read here
+                    n = offset + r[0]
+                    for i, line in lines:
+                        if i == n:
+                            break
+                    line = line.strip()
+                    if r[1] is None:
+                        yield (n, line, parse_exception()(line, r[2], r[3]))
+                    else:
+                        yield (n, line, make(r[1:]))
+                offset += count
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class ChunkedParser:
+    """
+    Source stage and parser in one, for running the lines of a file parsed
+    by parse_file(): iterating over it gives the lines, as read_lines()
+    does, and parse_record() then returns (or raises) what
+    DnstestParser.parse_record() would for each of them, from the results
+    parsed ahead in the pool of processes.
+    """
+
+    def __init__(self, path, processes=None, chunk_size=CHUNK_SIZE, trace=False):
+        """
+        @param trace if True, each line's number in the file is set for
+          pydnstest.trace as it is read
+        """
+        self.path = path
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.trace = trace
+        # (line, result) for lines read but not parsed yet
+        self._pending = deque()
+
+    def __iter__(self):
+        for n, line, r in parse_file(self.path, processes=self.processes, chunk_size=self.chunk_size):
+            self._pending.append((line, r))
+            if self.trace:
+                set_line(n)
+            yield line
+
+    def parse_record(self, line):
+        # lines that were read but never parsed (i.e. whose earlier result
+        # was reused) are dropped
+        while self._pending:
+            pending, r = self._pending.popleft()
+            if pending == line:
+                if isinstance(r, ChangeRecord):
+                    return r
+                raise r
+        return _parser.parse_record(line)
+
+    def parse_line(self, line):
+        return self.parse_record(line).to_dict()
+
+    def get_grammar(self):
+        return _parser.get_grammar()
+
+
+class LineError(namedtuple('LineError', ['message'])):
+    """
+    Check stage result for an input line that could not be checked (it
+    didn't parse, or has an unknown operation): the error message to
+    report for it in place of a result dict
+    """
+    __slots__ = ()
+
+
+def format_result(res):
+    """
+    Return the output lines for a check result dict
+    """
+    if res['result']:
+        lines = ["OK: %s" % res['message']]
+    else:
+        lines = ["**NG: %s" % res['message']]
+    for m in res['secondary']:
+        lines.append("\t%s" % m)
+    for w in res['warnings']:
+        lines.append("\t%s" % w)
+    return lines
+
+
+class TextSink:
+    """
+    Sink stage writing each result (or LineError's message) in the same
+    format as pydnstest.main's output to a file-like object (sys.stdout by
+    default)
+    """
+
+    def __init__(self, out=None):
+        self.out = out
+
+    def __call__(self, res):
+        out = self.out if self.out is not None else sys.stdout
+        if isinstance(res, LineError):
+            out.write(res.message + "\n")
+            return
+        for line in format_result(res):
+            out.write(line + "\n")
+
+
+def consume(results, sink, timings=None):
+    """
+    Pass each result dict or LineError in results (an iterable of results,
+    which may also have False for lines that could not be checked and
+    have been reported already) to sink, a callable taking either. Returns
+    a (passed, failed) tuple, of the result dicts only.
+
+    @param timings optional pydnstest.timings.Timings to record the time
+      spent in sink in, as the 'format' phase
+    """
+    passed = 0
+    failed = 0
+    for r in results:
+        if r is False:
+            continue
+        elif isinstance(r, LineError):
+            pass
+        elif r['result']:
+            passed = passed + 1
+        else:
+            failed = failed + 1
+        if timings is None:
+            sink(r)
+        else:
+            start = time.time()
+            sink(r)
+            timings.add('format', time.time() - start)
+    return (passed, failed)
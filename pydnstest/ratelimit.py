@@ -0,0 +1,113 @@
+"""
+Per-server query rate limiting for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import threading
+import time
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket: tokens are added at ``rate`` per second, up
+    to ``burst``, and each query takes one.
+    """
+
+    def __init__(self, rate, burst=1.0):
+        """
+        @param rate tokens added per second
+        @param burst maximum number of tokens that can accumulate while idle
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.last = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self, n=1):
+        """
+        Take n tokens, and return how many seconds the caller must wait
+        before using them. Tokens can be taken ahead of time, so concurrent
+        callers are given successively later slots.
+        """
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= n
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter(object):
+    """
+    Limits queries to each (server, port) to a maximum rate, with a
+    TokenBucket per server.
+    """
+
+    def __init__(self, max_qps, burst=1.0):
+        """
+        @param max_qps maximum queries per second to any one server
+        @param burst how many queries may be sent back-to-back after an
+          idle period
+        """
+        self.max_qps = max_qps
+        self.burst = burst
+        # (server, port) -> TokenBucket
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def delay(self, server, port=53, n=1):
+        """
+        Reserve n queries to server, returning the number of seconds to wait
+        before sending them
+        """
+        key = (server, port)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.max_qps, self.burst)
+        return bucket.reserve(n)
+
+    def wait(self, server, port=53, n=1):
+        """
+        Block until n queries may be sent to server
+        """
+        d = self.delay(server, port, n)
+        if d > 0:
+            time.sleep(d)
@@ -0,0 +1,116 @@
+"""
+Per-server round-trip time tracking and retransmit timeouts for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import threading
+
+import DNS
+
+
+class RTTEstimator(object):
+    """
+    Thread-safe smoothed round-trip time (SRTT) and RTT variance per
+    (server, port), used to derive each query's retransmit timeout (RTO)
+    the way TCP does (RFC 6298).
+    """
+
+    # gains for the SRTT and RTTVAR moving averages
+    alpha = 0.125
+    beta = 0.25
+
+    def __init__(self, retries=2, initial_rto=1.0, min_rto=0.05, max_rto=None):
+        """
+        @param retries how many times to retransmit an unanswered query
+          before giving up
+        @param initial_rto timeout for the first query to a server
+        @param min_rto lower bound for the timeout
+        @param max_rto upper bound for the timeout, including backoff
+          (default: pydns' default timeout)
+        """
+        if max_rto is None:
+            max_rto = DNS.defaults['timeout']
+        self.retries = retries
+        self.initial_rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        # (server, port) -> [srtt, rttvar]
+        self._servers = {}
+        self._lock = threading.Lock()
+
+    def rto(self, server, port=53):
+        """
+        Return the retransmit timeout in seconds for a new query to server
+        """
+        with self._lock:
+            s = self._servers.get((server, port))
+            if s is None:
+                rto = self.initial_rto
+            else:
+                rto = s[0] + 4 * s[1]
+        return min(max(rto, self.min_rto), self.max_rto)
+
+    def backoff(self, rto):
+        """
+        Return the timeout to use for the next retransmission after one
+        that timed out after rto seconds
+        """
+        return min(rto * 2, self.max_rto)
+
+    def sample(self, server, port, rtt):
+        """
+        Record the round-trip time of a query that was answered without
+        being retransmitted (replies to retransmitted queries are ambiguous,
+        so they are not sampled; Karn's algorithm)
+        """
+        with self._lock:
+            s = self._servers.get((server, port))
+            if s is None:
+                self._servers[(server, port)] = [rtt, rtt / 2.0]
+                return
+            s[1] = (1 - self.beta) * s[1] + self.beta * abs(s[0] - rtt)
+            s[0] = (1 - self.alpha) * s[0] + self.alpha * rtt
+
+    def srtt(self, server, port=53):
+        """
+        Return the smoothed RTT for server, or None if it has no samples
+        """
+        with self._lock:
+            s = self._servers.get((server, port))
+        if s is None:
+            return None
+        return s[0]
@@ -0,0 +1,112 @@
+"""
+Single-flight coalescing of identical in-flight DNS queries for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import threading
+
+
+class _Call(object):
+    """
+    One in-flight call that other threads may be waiting on
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls across threads: while a call for a
+    given key is in progress, other callers for that key wait for it and get
+    the same result (or exception) instead of making their own call.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        # key -> _Call
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        """
+        Return func(*args), unless a call for key is already in flight, in
+        which case wait for and return its result.
+        """
+        return self.do_many([key], lambda keys: [func(*args)])[0]
+
+    def do_many(self, keys, func):
+        """
+        Like do() for several keys at once. func is called (at most once)
+        with the list of keys that aren't already in flight, and must return
+        a list of results in the same order. Returns a list of results for
+        all of keys.
+        """
+        calls = []
+        lead = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    lead.append(i)
+                else:
+                    self.coalesced += 1
+                calls.append(call)
+        if lead:
+            try:
+                for i, r in zip(lead, func([keys[i] for i in lead])):
+                    calls[i].result = r
+            except Exception as ex:
+                for i in lead:
+                    calls[i].error = ex
+                raise
+            finally:
+                with self._lock:
+                    for i in lead:
+                        del self._calls[keys[i]]
+                for i in lead:
+                    calls[i].event.set()
+        results = []
+        for call in calls:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            results.append(call.result)
+        return results
@@ -0,0 +1,388 @@
+"""
+In-memory zone snapshots (via zone transfer) for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+from pydnstest.dns import reverse_name
+from pydnstest.transport import zone_transfer
+
+
+def _zone_of(name):
+    return name.lower().rstrip('.')
+
+
+def _data_key(data):
+    """
+    Return a string identifying a record's data; used to match records
+    deleted by an IXFR, and to store record data of types that the checks
+    never look at
+    """
+    if isinstance(data, str):
+        return data
+    return repr(data)
+
+
+def _soa_from_json(soa):
+    """
+    Turn the lists in a SOA record dict loaded from JSON back into tuples
+    """
+    soa = dict(soa)
+    soa['data'] = tuple(tuple(x) if isinstance(x, list) else x for x in soa['data'])
+    return soa
+
+
+def ptr_address(name):
+    """
+    Return the IPv4 address for an in-addr.arpa name, or None
+    """
+    name = _zone_of(name)
+    if not name.endswith('.in-addr.arpa'):
+        return None
+    a = name[:-len('.in-addr.arpa')].split('.')
+    if len(a) != 4:
+        return None
+    a.reverse()
+    return '.'.join(a)
+
+
+class ZoneSnapshot(object):
+    """
+    A copy of one zone from one server, indexed by name (-> type -> RRset)
+    and by address (-> PTR records).
+
+    Lookups follow RFC 4592: a name with no records of its own but with
+    names below it (an empty non-terminal) exists, and a name that doesn't
+    exist is answered from the wildcard ('*.') name of its closest existing
+    ancestor, if there is one. Delegations within the zone are not followed.
+    """
+
+    def __init__(self, zone, records):
+        """
+        @param zone the zone's origin, i.e. 'example.com'
+        @param records list of record dicts, as returned by
+          pydnstest.transport.zone_transfer()
+        """
+        self.zone = _zone_of(zone)
+        self._load(records)
+
+    def _load(self, records):
+        self.soa = records[0]
+        self.serial = records[0]['data'][2][1]
+        # name -> typename -> list of record dicts
+        self.names = {}
+        # IPv4 address -> list of PTR record dicts
+        self.ptrs = {}
+        # names with other names below them; built by _parent_names()
+        self._parents = None
+        # the transfer ends with a second copy of the SOA
+        for rr in records[:-1]:
+            self.add(rr)
+
+    def add(self, rr):
+        """
+        Add a record dict to the indexes
+        """
+        name = _zone_of(rr['name'])
+        if name not in self.names:
+            self._parents = None
+        self.names.setdefault(name, {}).setdefault(rr['typename'], []).append(rr)
+        if rr['typename'] == 'PTR':
+            addr = ptr_address(name)
+            if addr is not None:
+                self.ptrs.setdefault(addr, []).append(rr)
+
+    def remove(self, rr):
+        """
+        Remove the record matching a record dict (by name, type and data)
+        from the indexes
+        """
+        name = _zone_of(rr['name'])
+        types = self.names.get(name)
+        if types is None:
+            return
+        key = _data_key(rr['data'])
+        rrs = [r for r in types.get(rr['typename'], []) if _data_key(r['data']) != key]
+        if rrs:
+            types[rr['typename']] = rrs
+        else:
+            types.pop(rr['typename'], None)
+            if not types:
+                del self.names[name]
+                self._parents = None
+        if rr['typename'] == 'PTR':
+            addr = ptr_address(name)
+            ptrs = [r for r in self.ptrs.get(addr, []) if _data_key(r['data']) != key]
+            if ptrs:
+                self.ptrs[addr] = ptrs
+            else:
+                self.ptrs.pop(addr, None)
+
+    def _rrsets(self, name):
+        types = self.names.get(name, {})
+        return dict((t, sorted(_data_key(r['data']) for r in rrs)) for t, rrs in types.items() if t != 'SOA')
+
+    def _parent_names(self):
+        """
+        Return the set of names in the zone that have names below them
+        """
+        if self._parents is None:
+            parents = set()
+            for name in self.names:
+                while name != self.zone and '.' in name:
+                    name = name.split('.', 1)[1]
+                    if name in parents:
+                        break
+                    parents.add(name)
+            self._parents = parents
+        return self._parents
+
+    def _has_wildcards(self):
+        return any(n.startswith('*.') for n in self.names)
+
+    def _affected(self, changed, wildcards):
+        """
+        Return the set of names whose answers may differ after the records
+        of the names in changed did: those names and their ancestors (which
+        may have become, or stopped being, empty non-terminals). If the zone
+        has (or had) any wildcards, a change can alter the answer for names
+        that aren't in it at all, so return None for "any name".
+        """
+        if not changed:
+            return changed
+        if wildcards or self._has_wildcards():
+            return None
+        affected = set(changed)
+        for name in changed:
+            name = name.split('.', 1)[-1]
+            while name.endswith('.' + self.zone):
+                affected.add(name)
+                name = name.split('.', 1)[1]
+        return affected
+
+    def apply_transfer(self, records):
+        """
+        Update the snapshot from the records of an incremental transfer
+        (see pydnstest.transport.zone_transfer()), and return the set of
+        (lower-case) names whose answers may have changed, or None if that
+        could be any name (see _affected()).
+        """
+        changed = set()
+        if len(records) == 1:
+            # no changes
+            return changed
+        wildcards = self._has_wildcards()
+        if records[1]['typename'] != 'SOA':
+            # the server sent the whole zone instead
+            old = dict((n, self._rrsets(n)) for n in self.names)
+            self._load(records)
+            for n in set(old) | set(self.names):
+                if old.get(n, {}) != self._rrsets(n):
+                    changed.add(n)
+            return self._affected(changed, wildcards)
+        i = 1
+        end = len(records) - 1
+        while i < end:
+            # old SOA, deletions, new SOA, additions
+            i += 1
+            while records[i]['typename'] != 'SOA':
+                self.remove(records[i])
+                changed.add(_zone_of(records[i]['name']))
+                i += 1
+            i += 1
+            while i < end and records[i]['typename'] != 'SOA':
+                self.add(records[i])
+                changed.add(_zone_of(records[i]['name']))
+                i += 1
+        self.soa = records[0]
+        self.serial = records[0]['data'][2][1]
+        self.names.setdefault(self.zone, {})['SOA'] = [records[0]]
+        return self._affected(changed, wildcards)
+
+    def to_dict(self):
+        """
+        Return the snapshot as a JSON-serializable dict (see from_dict())
+        """
+        records = []
+        for types in self.names.values():
+            for t, rrs in types.items():
+                if t == 'SOA':
+                    continue
+                for rr in rrs:
+                    rr = dict(rr)
+                    rr['data'] = _data_key(rr['data'])
+                    records.append(rr)
+        return {'zone': self.zone, 'soa': self.soa, 'records': records}
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Return a ZoneSnapshot from a dict returned by to_dict()
+        """
+        soa = _soa_from_json(d['soa'])
+        return cls(d['zone'], [soa] + d['records'] + [soa])
+
+    def lookup(self, name):
+        """
+        Return a dict of typename -> list of record dicts for a name, or
+        None if it doesn't exist. An empty non-terminal returns an empty
+        dict, and a name matching a wildcard returns copies of the
+        wildcard's records, with the name asked about as their name.
+        """
+        key = _zone_of(name)
+        types = self.names.get(key)
+        if types is not None:
+            return types
+        parents = self._parent_names()
+        if key in parents:
+            return {}
+        # the closest encloser is the nearest ancestor that exists
+        while key != self.zone and '.' in key:
+            key = key.split('.', 1)[1]
+            if key in self.names or key in parents:
+                wild = self.names.get('*.' + key)
+                if wild is None:
+                    return None
+                name = name.rstrip('.')
+                return dict((t, [dict(r, name=name) for r in rrs]) for t, rrs in wild.items())
+        return None
+
+    def ptr_records(self, addr):
+        """
+        Return the PTR record dicts for an IPv4 address
+        """
+        return self.ptrs.get(addr, [])
+
+    def covers(self, name):
+        """
+        Whether name is in this zone
+        """
+        name = _zone_of(name)
+        return name == self.zone or name.endswith('.' + self.zone)
+
+    def __len__(self):
+        return sum(len(rrs) for types in self.names.values() for rrs in types.values())
+
+
+class SnapshotSet(object):
+    """
+    Zone snapshots for any number of (server, port)s. resolve_name() and
+    lookup_reverse() answer exactly as DNStestDNS would from a server
+    authoritative for the zones, or return None for names outside of them.
+
+    Anything with the zone, covers(), lookup() and ptr_records() of a
+    ZoneSnapshot can be added, i.e. a pydnstest.zonefile.ZoneFileIndex.
+    """
+
+    def __init__(self):
+        # (server, port) -> list of ZoneSnapshot
+        self.servers = {}
+
+    def add(self, server, snapshot, port=53):
+        """
+        Add (or replace) the snapshot of a zone for a server
+        """
+        zones = [z for z in self.servers.get((server, port), []) if z.zone != snapshot.zone]
+        zones.append(snapshot)
+        # most specific zone first, so that delegated subzones win
+        zones.sort(key=lambda z: -len(z.zone))
+        self.servers[(server, port)] = zones
+
+    def load(self, zone, server, port=53, timeout=None):
+        """
+        Transfer zone from server and add its snapshot, returning it
+        """
+        snap = ZoneSnapshot(zone, zone_transfer(zone, server, port=port, timeout=timeout))
+        self.add(server, snap, port)
+        return snap
+
+    def refresh(self, snapshot, server, port=53, timeout=None):
+        """
+        Bring a snapshot from an earlier run up to date with an incremental
+        transfer (IXFR) from server, and add it. Returns the set of names
+        whose answers may have changed, or None if that could be any name.
+        """
+        changed = snapshot.apply_transfer(zone_transfer(snapshot.zone, server, port=port, timeout=timeout,
+                                                        soa=snapshot.soa))
+        self.add(server, snapshot, port)
+        return changed
+
+    def find(self, name, server, port=53):
+        """
+        Return the snapshot that name is in for server, or None
+        """
+        for z in self.servers.get((server, port), []):
+            if z.covers(name):
+                return z
+        return None
+
+    def resolve_name(self, query, to_server, to_port=53):
+        """
+        Resolve a name from the snapshots: the first A record, else the
+        first CNAME record (as an A query for a CNAME returns the CNAME
+        first), else the status. Returns None if the name isn't in any
+        snapshot for the server.
+        """
+        z = self.find(query, to_server, to_port)
+        if z is None:
+            return None
+        types = z.lookup(query)
+        if types is None:
+            return {'status': 'NXDOMAIN'}
+        for t in ('A', 'CNAME'):
+            if t in types:
+                return {'answer': types[t][0]}
+        return {'status': 'NOERROR'}
+
+    def lookup_reverse(self, name, to_server, to_port=53):
+        """
+        Reverse lookup of an address from the snapshots, or None if its
+        in-addr.arpa name isn't in any snapshot for the server
+        """
+        rname = reverse_name(name)
+        z = self.find(rname, to_server, to_port)
+        if z is None:
+            return None
+        ptrs = z.ptr_records(name)
+        if ptrs:
+            return {'answer': ptrs[0]}
+        types = z.lookup(rname)
+        if types is None:
+            return {'status': 'NXDOMAIN'}
+        if 'PTR' in types:
+            # i.e. from a wildcard
+            return {'answer': types['PTR'][0]}
+        return {'status': 'NOERROR'}
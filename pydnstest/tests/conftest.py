@@ -0,0 +1,80 @@
+"""
+pytest configuration for the pydnstest tests
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import sys
+
+import pytest
+
+collect_ignore = []
+if sys.version_info < (3, 5):
+    # uses async/await syntax, which can't even be compiled before 3.5
+    collect_ignore.append('dnstest_asyncdns_test.py')
+
+SOA = 'ns1.%s hostmaster.%s 2017010101 3600 600 86400 60'
+
+"""
+records served by the dns_server fixture; queries for drop.example.com
+are never answered, the first UDP query for lossy.example.com is ignored
+and UDP replies for trunc.example.com are truncated
+"""
+DNS_SERVER_RECORDS = {'example.com': [('SOA', SOA % ('example.com', 'example.com'))],
+                      '1.in-addr.arpa': [('SOA', SOA % ('example.com', 'example.com'))],
+                      'foo.example.com': [('A', '1.2.3.4')],
+                      'lossy.example.com': [('A', '1.2.3.5')],
+                      'trunc.example.com': [('A', '5.6.7.8')],
+                      'bar.example.com': [('CNAME', 'foo.example.com')],
+                      '4.3.2.1.in-addr.arpa': [('PTR', 'foo.example.com')]}
+
+
+@pytest.fixture
+def dns_server(request):
+    """
+    A pydnstest.testserver.StandInServer on localhost, serving
+    DNS_SERVER_RECORDS and logging the queries it gets
+    """
+    if sys.version_info < (3, 5):
+        pytest.skip("stand-in server requires python 3.5+")
+    from pydnstest.testserver import StandInServer
+    s = StandInServer(DNS_SERVER_RECORDS, ttl=360, log_queries=True)
+    s.drop.add('drop.example.com')
+    s.lose['lossy.example.com'] = 1
+    s.force_truncate.add('trunc.example.com')
+    s.start()
+    request.addfinalizer(s.stop)
+    return s
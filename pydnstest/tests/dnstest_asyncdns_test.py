@@ -0,0 +1,234 @@
+"""
+tests for the asyncio resolver backend - asyncdns.py / AsyncDNStestDNS
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import pytest
+import sys
+
+import DNS
+
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+
+
+class TestAsyncDNS:
+    """
+    tests for asyncdns.py / AsyncDNStestDNS, against a StandInServer
+    """
+
+    def run(self, adns, func):
+        """
+        run the awaitable returned by func on a new event loop, then close adns
+        """
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(func())
+        finally:
+            adns.close()
+            loop.run_until_complete(asyncio.sleep(0))
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def test_resolve_name_A(self, dns_server):
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        adns = AsyncDNStestDNS(timeout=2)
+        foo = self.run(adns, lambda: adns.resolve_name('foo.example.com', '127.0.0.1', dns_server.port))
+        assert foo == {'answer': {'class': 1, 'classstr': 'IN', 'data': '1.2.3.4', 'name': 'foo.example.com', 'rdlength': 4, 'ttl': 360, 'type': 1, 'typename': 'A'}}
+        assert dns_server.udp_log == [('foo.example.com', 'A')]
+
+    def test_resolve_name_CNAME(self, dns_server):
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        adns = AsyncDNStestDNS(timeout=2)
+        foo = self.run(adns, lambda: adns.resolve_name('bar.example.com', '127.0.0.1', dns_server.port))
+        assert foo['answer']['typename'] == 'CNAME'
+        assert foo['answer']['data'] == 'foo.example.com'
+        # the A query gets the CNAME, so there's no CNAME query
+        assert dns_server.udp_log == [('bar.example.com', 'A')]
+
+    def test_resolve_name_CNAME_parallel(self, dns_server):
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        adns = AsyncDNStestDNS(timeout=2, parallel_lookups=True)
+        foo = self.run(adns, lambda: adns.resolve_name('bar.example.com', '127.0.0.1', dns_server.port))
+        assert foo['answer']['typename'] == 'CNAME'
+        assert sorted(dns_server.udp_log) == [('bar.example.com', 'A'), ('bar.example.com', 'CNAME')]
+
+    def test_resolve_name_nxdomain(self, dns_server):
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        adns = AsyncDNStestDNS(timeout=2)
+        foo = self.run(adns, lambda: adns.resolve_name('notaname.example.com', '127.0.0.1', dns_server.port))
+        assert foo == {'status': 'NXDOMAIN'}
+
+    def test_lookup_reverse(self, dns_server):
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        adns = AsyncDNStestDNS(timeout=2)
+        foo = self.run(adns, lambda: adns.lookup_reverse('1.2.3.4', '127.0.0.1', dns_server.port))
+        assert foo['answer']['data'] == 'foo.example.com'
+        assert dns_server.udp_log == [('4.3.2.1.in-addr.arpa', 'PTR')]
+
+    def test_timeout(self, dns_server):
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        adns = AsyncDNStestDNS(timeout=0.1)
+        with pytest.raises(DNS.TimeoutError):
+            self.run(adns, lambda: adns.resolve_name('drop.example.com', '127.0.0.1', dns_server.port))
+
+    def test_many_in_flight(self, dns_server):
+        import asyncio
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        adns = AsyncDNStestDNS(timeout=2)
+        names = ['foo.example.com', 'bar.example.com', 'baz.example.com'] * 20
+        foo = self.run(adns, lambda: asyncio.gather(*[adns.resolve_name(n, '127.0.0.1', dns_server.port) for n in names]))
+        assert [r.get('answer', {}).get('typename') for r in foo] == ['A', 'CNAME', None] * 20
+
+    def test_retransmit(self, dns_server):
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        from pydnstest.rtt import RTTEstimator
+        adns = AsyncDNStestDNS(timeout=30, rtt=RTTEstimator(retries=1, initial_rto=0.1))
+        foo = self.run(adns, lambda: adns.resolve_name('lossy.example.com', '127.0.0.1', dns_server.port))
+        assert foo['answer']['data'] == '1.2.3.5'
+        assert dns_server.udp_log == [('lossy.example.com', 'A')] * 2
+        assert adns.rtt.srtt('127.0.0.1', dns_server.port) is None
+
+    def test_snapshot(self, dns_server):
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        from pydnstest.snapshot import SnapshotSet
+        snaps = SnapshotSet()
+        snaps.load('example.com', '127.0.0.1', port=dns_server.port, timeout=2)
+        adns = AsyncDNStestDNS(timeout=2, snapshots=snaps)
+        foo = self.run(adns, lambda: adns.resolve_name('foo.example.com', '127.0.0.1', dns_server.port))
+        assert foo['answer']['data'] == '1.2.3.4'
+        assert dns_server.udp_log == []
+
+    def test_cassette(self, dns_server, tmpdir):
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        from pydnstest.cassette import Cassette
+        path = str(tmpdir.join('cassette'))
+        cassette = Cassette(path)
+        adns = AsyncDNStestDNS(timeout=2, cassette=cassette)
+        foo = self.run(adns, lambda: adns.resolve_name('bar.example.com', '127.0.0.1', dns_server.port))
+        cassette.close()
+        adns = AsyncDNStestDNS(timeout=2, cassette=Cassette(path, replay=True))
+        assert self.run(adns, lambda: adns.resolve_name('bar.example.com', '127.0.0.1', dns_server.port)) == foo
+        assert dns_server.udp_log == [('bar.example.com', 'A')]
+
+    @pytest.mark.skipif(sys.version_info < (3, 7), reason="per-task line numbers require contextvars")
+    def test_trace(self, dns_server, tmpdir):
+        import asyncio
+        import json
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        from pydnstest.cache import QueryCache
+        from pydnstest.trace import QueryTrace, set_line
+        trace = QueryTrace(str(tmpdir.join('trace')))
+        adns = AsyncDNStestDNS(timeout=2, cache=QueryCache(), trace=trace)
+
+        async def line(n, name):
+            set_line(n)
+            await asyncio.sleep(0)
+            return await adns.resolve_name(name, '127.0.0.1', dns_server.port)
+
+        async def run():
+            await asyncio.gather(line(1, 'bar.example.com'), line(2, 'nx.example.com'))
+            return await line(3, 'bar.example.com')
+
+        self.run(adns, run)
+        trace.close()
+        entries = sorted((e['line'], e['qname'], e['qtype'], e['rcode'], e['cache'])
+                         for e in map(json.loads, open(trace.path)))
+        assert entries == [(1, 'bar.example.com', 'A', 'NOERROR', 'miss'),
+                           (2, 'nx.example.com', 'A', 'NXDOMAIN', 'miss'),
+                           (2, 'nx.example.com', 'CNAME', 'NXDOMAIN', 'miss'),
+                           (3, 'bar.example.com', 'A', 'NOERROR', 'hit')]
+
+    def test_coalesce(self, dns_server):
+        import asyncio
+        from pydnstest.asyncdns import AsyncDNStestDNS
+        adns = AsyncDNStestDNS(timeout=2)
+        foo = self.run(adns, lambda: asyncio.gather(*[adns.resolve_name('foo.example.com', '127.0.0.1', dns_server.port)
+                                                      for i in range(10)]))
+        assert [r['answer']['data'] for r in foo] == ['1.2.3.4'] * 10
+        assert dns_server.udp_log == [('foo.example.com', 'A')]
+        assert adns.coalesced == 9
+        assert adns._inflight == {}
+
+    def test_run_checks_async_order(self, monkeypatch):
+        """
+        results come back in input order, even when earlier lines are slower
+        """
+        import asyncio
+        import pydnstest.asyncdns
+
+        class StubDNS(object):
+            def __init__(self, timeout=None, parallel_lookups=False, cache=None, rtt=None, limiter=None, snapshots=None,
+                         cassette=None, timings=None, metrics=None, trace=None):
+                pass
+
+            def resolve_name(self, query, to_server, to_port=53):
+                # slowest for the first names
+                delay = 0.05 if query.startswith('slow') else 0.0
+                if to_server == 'prod':
+                    return asyncio.sleep(delay, result={'status': 'NXDOMAIN'})
+                return asyncio.sleep(delay, result={'answer': {'name': query, 'data': '1.2.3.4', 'typename': 'A'}})
+
+            def lookup_reverse(self, name, to_server, to_port=53):
+                return asyncio.sleep(0, result={'status': 'NXDOMAIN'})
+
+            def close(self):
+                pass
+
+        monkeypatch.setattr(pydnstest.asyncdns, 'AsyncDNStestDNS', StubDNS)
+        config = DnstestConfig()
+        config.server_test = "test"
+        config.server_prod = "prod"
+        config.default_domain = ".example.com"
+        config.have_reverse_dns = False
+        chk = DNStestChecks(config)
+        calls = [('check_added_name', ('slow1', '1.2.3.4')), None,
+                 ('check_added_name', ('fast2', '1.2.3.4')), ('check_removed_name', ('fast3',))]
+        res = list(pydnstest.asyncdns.run_checks_async(iter(calls), chk, jobs=10))
+        assert res[0]['message'] == 'slow1 => 1.2.3.4 (TEST)'
+        assert res[1] is None
+        assert res[2]['message'] == 'fast2 => 1.2.3.4 (TEST)'
+        assert res[3]['message'] == "fast3 got status NXDOMAIN from PROD - cannot remove a name that doesn't exist (PROD)"
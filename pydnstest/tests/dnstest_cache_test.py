@@ -0,0 +1,206 @@
+"""
+tests for cache.py / QueryCache
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import pytest
+from pyparsing import ParseException
+
+from pydnstest.cache import QueryCache, ParseCache, result_ttl
+from pydnstest.parser import DnstestParser
+import pydnstest.cache
+
+
+class ResultObject(object):
+    """
+    mock pydns DnsResult
+    """
+
+    def __init__(self, answers=None, authority=None, status='NOERROR'):
+        self.answers = answers or []
+        self.authority = authority or []
+        self.header = {'status': status}
+
+
+def a_result(ttl=300):
+    return ResultObject(answers=[{'name': 'foo.example.com', 'typename': 'A', 'data': '1.2.3.4', 'ttl': ttl}])
+
+
+def nx_result(soa_ttl=600, minimum=60):
+    soa = {'typename': 'SOA', 'ttl': soa_ttl,
+           'data': ('ns1.example.com', 'hostmaster.example.com', ('serial', 1), ('refresh ', 3600, '1 hours'),
+                    ('retry', 600, '10 minutes'), ('expire', 86400, '1 days'), ('minimum', minimum, '1 minutes'))}
+    return ResultObject(authority=[soa], status='NXDOMAIN')
+
+
+class TestQueryCache:
+
+    def test_result_ttl(self):
+        r = ResultObject(answers=[{'ttl': 300}, {'ttl': 30}])
+        assert result_ttl(r) == 30
+        assert result_ttl(nx_result()) == 60
+        assert result_ttl(nx_result(soa_ttl=10)) == 10
+        assert result_ttl(ResultObject(status='SERVFAIL')) is None
+
+    def test_hit_miss(self):
+        c = QueryCache()
+        r = a_result()
+        assert c.get(('foo', 'test', 53, 'A')) is None
+        c.put(('foo', 'test', 53, 'A'), r)
+        assert c.get(('foo', 'test', 53, 'A')) is r
+        assert c.get(('foo', 'prod', 53, 'A')) is None
+        assert c.hits == 1
+        assert c.misses == 2
+        assert c.stats_string() == "query cache: 1 hits / 2 misses (33.3% hit rate)"
+
+    def test_lru_eviction(self):
+        c = QueryCache(maxsize=2)
+        c.put('a', a_result())
+        c.put('b', a_result())
+        # touch 'a' so that 'b' is least recently used
+        c.get('a')
+        c.put('c', a_result())
+        assert len(c) == 2
+        assert c.get('b') is None
+        assert c.get('a') is not None
+        assert c.get('c') is not None
+
+    def test_ignore_ttl(self, monkeypatch):
+        c = QueryCache()
+        c.put('a', a_result(ttl=0))
+        monkeypatch.setattr(pydnstest.cache.time, 'time', lambda: 1e12)
+        assert c.get('a') is not None
+
+    def test_honor_ttl(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(pydnstest.cache.time, 'time', lambda: now[0])
+        c = QueryCache(honor_ttl=True)
+        c.put('a', a_result(ttl=300))
+        c.put('nx', nx_result())
+        c.put('zero', a_result(ttl=0))
+        c.put('servfail', ResultObject(status='SERVFAIL'))
+        assert len(c) == 2
+        now[0] = 1059.0
+        assert c.get('a') is not None
+        assert c.get('nx') is not None
+        now[0] = 1061.0
+        assert c.get('nx') is None
+        assert c.get('a') is not None
+        now[0] = 1300.0
+        assert c.get('a') is None
+
+    def test_stats_empty(self):
+        assert QueryCache().stats_string() == "query cache: 0 hits / 0 misses (0.0% hit rate)"
+
+
+class CountingParser(DnstestParser):
+
+    def __init__(self):
+        self.parsed = []
+
+    def parse_record(self, line):
+        self.parsed.append(line)
+        return DnstestParser.parse_record(self, line)
+
+
+class TestParseCache:
+
+    def test_hit_miss(self):
+        p = CountingParser()
+        c = ParseCache(p)
+        d = c.parse_line('add foo value 1.2.3.4')
+        assert d == {'operation': 'add', 'hostname': 'foo', 'value': '1.2.3.4'}
+        # whitespace is normalized
+        assert c.parse_line('  add  foo\tvalue 1.2.3.4 ') == d
+        assert p.parsed == ['add foo value 1.2.3.4']
+        assert (c.hits, c.misses) == (1, 1)
+        assert c.stats_string() == "parse cache: 1 hits / 1 misses (50.0% hit rate)"
+
+    def test_other_whitespace(self):
+        c = ParseCache(DnstestParser())
+        c.parse_line('confirm foo')
+        # the parser only skips spaces, tabs, CRs and LFs
+        for line in ('confirm\x0cfoo', 'confirm\x0bfoo', 'confirm\xa0foo', 'confirm foo\x0c', '\u2003confirm foo'):
+            with pytest.raises(ParseException):
+                c.parse_line(line)
+        assert c.parse_line('\r\nconfirm\t foo\n') == {'operation': 'confirm', 'hostname': 'foo'}
+        assert (c.hits, c.misses) == (1, 6)
+
+    def test_copies(self):
+        c = ParseCache(DnstestParser())
+        d = c.parse_line('confirm foo')
+        d['hostname'] = 'bar'
+        assert c.parse_line('confirm foo') == {'operation': 'confirm', 'hostname': 'foo'}
+        assert c.parse_line('confirm foo') is not c.parse_line('confirm foo')
+
+    def test_parse_record(self):
+        p = CountingParser()
+        c = ParseCache(p)
+        r = c.parse_record('rename foo value 1.2.3.4 to bar')
+        assert r == p.parse_record('rename foo value 1.2.3.4 to bar')
+        # records are immutable, so the cached one is returned
+        assert c.parse_record('rename  foo value 1.2.3.4 to bar') is r
+        assert (c.hits, c.misses) == (1, 1)
+
+    def test_lru_eviction(self):
+        p = CountingParser()
+        c = ParseCache(p, maxsize=2)
+        c.parse_line('confirm a')
+        c.parse_line('confirm b')
+        c.parse_line('confirm a')
+        c.parse_line('confirm c')
+        assert len(c) == 2
+        c.parse_line('confirm a')
+        c.parse_line('confirm b')
+        assert p.parsed == ['confirm a', 'confirm b', 'confirm c', 'confirm b']
+
+    def test_parse_error(self):
+        p = CountingParser()
+        c = ParseCache(p)
+        for i in range(2):
+            with pytest.raises(ParseException):
+                c.parse_line('foo bar baz')
+        assert len(p.parsed) == 2
+        assert len(c) == 0
+        assert (c.hits, c.misses) == (0, 2)
@@ -0,0 +1,134 @@
+"""
+tests for cassette.py
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import pytest
+
+import DNS
+
+from pydnstest.cassette import Cassette
+from pydnstest.dns import DNStestDNS
+from pydnstest.wire import Reply
+
+SOA = {'name': 'example.com', 'type': 6, 'class': 1, 'ttl': 3600, 'rdlength': 50, 'typename': 'SOA', 'classstr': 'IN',
+       'data': ('ns1.example.com', 'hostmaster.example.com', ('serial', 5), ('refresh ', 3600, '1 hours'),
+                ('retry', 600, '10 minutes'), ('expire', 86400, '1 days'), ('minimum', 60, '1 minutes'))}
+
+HEADER = {'id': 1234, 'qr': 1, 'opcode': 0, 'aa': 1, 'tc': 0, 'rd': 1, 'ra': 0, 'z': 0, 'rcode': 3,
+          'qdcount': 1, 'ancount': 0, 'nscount': 1, 'arcount': 1, 'opcodestr': 'QUERY', 'status': 'NXDOMAIN'}
+
+
+def nxdomain():
+    other = {'name': 'x.example.com', 'type': 99, 'class': 1, 'ttl': 60, 'rdlength': 3, 'typename': 'SPF',
+             'classstr': 'IN', 'data': b'\x00\xff\x01'}
+    return Reply(dict(HEADER), [], [], [SOA], [other], {})
+
+
+class TestCassette:
+
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join('cassette'))
+        c = Cassette(path)
+        c.put(('nx.example.com', 'test', 53, 'A'), nxdomain())
+        c.put(('nx.example.com', 'test', 53, 'A'), nxdomain())
+        assert len(c) == 1
+        c.close()
+        assert len(open(path).readlines()) == 1
+        r = Cassette(path, replay=True)
+        a = r.get(('nx.example.com', 'test', 53, 'A'))
+        assert a.header == HEADER
+        assert a.answers == []
+        assert a.authority == [SOA]
+        assert a.additional[0]['data'] == b'\x00\xff\x01'
+        assert a.questions == [{'qname': 'nx.example.com', 'qtype': 1, 'qtypestr': 'A', 'qclass': 1,
+                                'qclassstr': 'IN'}]
+        assert a.args['server'] == 'test'
+        # decoded once
+        assert r.get(('nx.example.com', 'test', 53, 'A')) is a
+        assert r.hits == 2
+        with pytest.raises(DNS.DNSError) as excinfo:
+            r.get(('nx.example.com', 'prod', 53, 'A'))
+        assert str(excinfo.value) == 'no recorded answer for nx.example.com A from prod port 53 in %s' % path
+
+    def test_append(self, tmpdir):
+        path = str(tmpdir.join('cassette'))
+        c = Cassette(path)
+        c.put(('nx.example.com', 'test', 53, 'A'), nxdomain())
+        c.close()
+        found = nxdomain()
+        found.header['rcode'] = 0
+        c = Cassette(path)
+        c.put(('nx.example.com', 'test', 53, 'A'), found)
+        c.close()
+        # the last result recorded for a query wins
+        assert Cassette(path, replay=True).get(('nx.example.com', 'test', 53, 'A')).header['status'] == 'NOERROR'
+
+    def test_bad_file(self, tmpdir):
+        with pytest.raises(DNS.DNSError):
+            Cassette(str(tmpdir.join('missing')), replay=True)
+        tmpdir.join('bad').write('[1, 2\n')
+        with pytest.raises(DNS.DNSError) as excinfo:
+            Cassette(str(tmpdir.join('bad')), replay=True)
+        assert ':1: invalid cassette entry' in str(excinfo.value)
+
+    @pytest.mark.parametrize('kwargs', [{}, {'parallel_lookups': True}, {'socket_pool': True}])
+    def test_record_replay(self, dns_server, tmpdir, kwargs):
+        path = str(tmpdir.join('cassette'))
+        d = DNStestDNS(cassette=Cassette(path), **kwargs)
+        recorded = [d.resolve_name('foo.example.com', '127.0.0.1', dns_server.port),
+                    d.resolve_name('bar.example.com', '127.0.0.1', dns_server.port),
+                    d.resolve_name('nx.example.com', '127.0.0.1', dns_server.port),
+                    d.lookup_reverse('1.2.3.4', '127.0.0.1', dns_server.port)]
+        d.close()
+        d.cassette.close()
+        n = len(dns_server.udp_log) + len(dns_server.tcp_log)
+        d = DNStestDNS(cassette=Cassette(path, replay=True), **kwargs)
+        assert [d.resolve_name('foo.example.com', '127.0.0.1', dns_server.port),
+                d.resolve_name('bar.example.com', '127.0.0.1', dns_server.port),
+                d.resolve_name('nx.example.com', '127.0.0.1', dns_server.port),
+                d.lookup_reverse('1.2.3.4', '127.0.0.1', dns_server.port)] == recorded
+        assert len(dns_server.udp_log) + len(dns_server.tcp_log) == n
+        with pytest.raises(DNS.DNSError):
+            d.resolve_name('other.example.com', '127.0.0.1', dns_server.port)
@@ -48,6 +48,7 @@ import pytest
 import sys
 import os
 
+from pydnstest.cache import QueryCache
 from pydnstest.dns import DNStestDNS
 import DNS
 
@@ -161,3 +162,152 @@ class TestDNS:
 
         foo = test_DNS.resolve_name(query, server)
         assert foo == result
+
+    def test_resolve_name_parallel(self, dns_server):
+        """
+        Test resolve_name with parallel_lookups, which sends both queries at once
+        """
+        d = DNStestDNS(parallel_lookups=True)
+
+        foo = d.resolve_name('foo.example.com', '127.0.0.1', dns_server.port)
+        assert foo['answer']['typename'] == 'A'
+        assert foo['answer']['data'] == '1.2.3.4'
+
+        foo = d.resolve_name('bar.example.com', '127.0.0.1', dns_server.port)
+        assert foo['answer']['typename'] == 'CNAME'
+        assert foo['answer']['data'] == 'foo.example.com'
+
+        foo = d.resolve_name('notaname.example.com', '127.0.0.1', dns_server.port)
+        assert foo == {'status': 'NXDOMAIN'}
+        assert sorted(dns_server.udp_log[-2:]) == [('notaname.example.com', 'A'), ('notaname.example.com', 'CNAME')]
+
+    def test_cache(self, monkeypatch):
+        """
+        Test that repeated queries are answered from the cache
+        """
+        calls = []
+
+        def mockreturn(name=None, server=None, qtype=None, port=None):
+            calls.append((name, server, qtype))
+            if qtype == "CNAME":
+                return EmptyAnswer()
+            return MultipleAnswer()
+
+        monkeypatch.setattr(DNS, "Request", mockreturn)
+        d = DNStestDNS(cache=QueryCache())
+        assert d.resolve_name("foo.example.com", "ns.example.com") == {'answer': 'one'}
+        assert d.resolve_name("foo.example.com", "ns.example.com") == {'answer': 'one'}
+        assert d.resolve_name("foo.example.com", "ns2.example.com") == {'answer': 'one'}
+        assert calls == [("foo.example.com", "ns.example.com", "A"), ("foo.example.com", "ns.example.com", "CNAME"),
+                         ("foo.example.com", "ns2.example.com", "A"), ("foo.example.com", "ns2.example.com", "CNAME")]
+        assert d.cache.hits == 2
+        assert d.cache.misses == 4
+
+    def test_cache_parallel(self, dns_server):
+        """
+        Test parallel_lookups with a cache, against a StandInServer
+        """
+        d = DNStestDNS(parallel_lookups=True, cache=QueryCache())
+        d.resolve_name('bar.example.com', '127.0.0.1', dns_server.port)
+        d.query('foo.example.com', '127.0.0.1', 'A', dns_server.port)
+        foo = d.resolve_name('bar.example.com', '127.0.0.1', dns_server.port)
+        assert foo['answer']['data'] == 'foo.example.com'
+        assert len(dns_server.udp_log) == 3
+        # only the uncached CNAME query goes out
+        d.resolve_name('foo.example.com', '127.0.0.1', dns_server.port)
+        assert dns_server.udp_log[3:] == [('foo.example.com', 'CNAME')]
+
+    def test_coalesce_concurrent(self, monkeypatch):
+        """
+        Test that identical concurrent queries only send one request
+        """
+        import threading
+        import time
+        calls = []
+
+        class SlowRequest(object):
+            def __init__(self, name=None, server=None, qtype=None, port=None):
+                calls.append((name, server, qtype))
+
+            def req(self):
+                time.sleep(0.2)
+                return EmptyAnswer().req()
+
+        monkeypatch.setattr(DNS, "Request", SlowRequest)
+        d = DNStestDNS()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(d.resolve_name("foo.example.com", "ns.example.com")))
+                   for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [{'answer': 'one'}] * 8
+        assert calls == [("foo.example.com", "ns.example.com", "A")]
+        assert d.inflight.coalesced == 7
+
+    def test_socket_pool(self, dns_server):
+        """
+        Test that socket_pool sends every query over one pooled socket
+        """
+        d = DNStestDNS(socket_pool=True)
+        foo = d.resolve_name('bar.example.com', '127.0.0.1', dns_server.port)
+        assert foo['answer']['data'] == 'foo.example.com'
+        foo = d.lookup_reverse('1.2.3.4', '127.0.0.1', dns_server.port)
+        assert foo['answer']['data'] == 'foo.example.com'
+        assert len(dns_server.udp_log) == 2
+        assert len(dns_server.clients) == 1
+        d.close()
+        assert d.transport.pool._idle == {}
+
+    def test_adaptive_timeout(self, monkeypatch):
+        """
+        Test that DNS.Request is retried with the RTTEstimator's backoff
+        """
+        from pydnstest.rtt import RTTEstimator
+        timeouts = []
+
+        class LossyRequest(object):
+            def __init__(self, name=None, server=None, qtype=None, port=None, timeout=None):
+                timeouts.append(timeout)
+
+            def req(self):
+                if len(timeouts) < 3:
+                    raise DNS.TimeoutError('Timeout')
+                return EmptyAnswer().req()
+
+        monkeypatch.setattr(DNS, "Request", LossyRequest)
+        rtt = RTTEstimator(retries=2, initial_rto=0.5, max_rto=1.5)
+        d = DNStestDNS(rtt=rtt)
+        assert d.resolve_name("foo.example.com", "ns.example.com") == {'answer': 'one'}
+        assert timeouts == [0.5, 1.0, 1.5]
+        assert rtt.srtt("ns.example.com") is None
+        # the next query succeeds first time, and is sampled
+        assert d.resolve_name("bar.example.com", "ns.example.com") == {'answer': 'one'}
+        assert timeouts[3] == 0.5
+        assert rtt.srtt("ns.example.com") is not None
+        # and it gives up after the retries
+        del timeouts[:]
+        monkeypatch.setattr(LossyRequest, "req", lambda self: (_ for _ in ()).throw(DNS.TimeoutError('Timeout')))
+        with pytest.raises(DNS.TimeoutError):
+            d.resolve_name("baz.example.com", "ns.example.com")
+        assert len(timeouts) == 3
+
+    def test_rate_limit(self, monkeypatch):
+        """
+        Test that queries are paced by the limiter, per server
+        """
+        waits = []
+
+        class Limiter(object):
+            def wait(self, server, port=53, n=1):
+                waits.append((server, port, n))
+
+        def mockreturn(name=None, server=None, qtype=None, port=None):
+            return EmptyAnswer()
+
+        monkeypatch.setattr(DNS, "Request", mockreturn)
+        d = DNStestDNS(limiter=Limiter())
+        d.resolve_name("foo.example.com", "ns.example.com")
+        d.lookup_reverse("1.2.3.4", "ns2.example.com")
+        assert waits == [("ns.example.com", 53, 1), ("ns2.example.com", 53, 1)]
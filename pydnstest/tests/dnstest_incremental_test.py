@@ -0,0 +1,130 @@
+"""
+tests for incremental.py
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import os
+
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+from pydnstest.incremental import (query_name, traced_run, config_fingerprint, serial_key, snapshot_serials,
+                                   SnapshotStore)
+from pydnstest.snapshot import SnapshotSet, ZoneSnapshot
+from pydnstest.tests.dnstest_snapshot_test import example_zone
+
+
+def make_config():
+    config = DnstestConfig()
+    config.server_test = "test"
+    config.server_prod = "prod"
+    config.default_domain = ".example.com"
+    config.have_reverse_dns = False
+    return config
+
+
+def make_snapshots(serial=1):
+    snaps = SnapshotSet()
+    for server in ('test', 'prod'):
+        snaps.add(server, ZoneSnapshot('example.com', example_zone(serial=serial)))
+    return snaps
+
+
+class TestIncremental:
+
+    def test_query_name(self):
+        assert query_name(('resolve_name', 'Foo.Example.com.', 'test')) == 'foo.example.com'
+        assert query_name(('lookup_reverse', '1.2.3.4', 'test')) == '4.3.2.1.in-addr.arpa'
+
+    def test_traced_run(self):
+        chk = DNStestChecks(make_config())
+        chk.DNS.snapshots = make_snapshots()
+        res, looked_up = traced_run(chk, 'confirm_name', 'foo')
+        assert res['result'] is True
+        assert looked_up == set([('foo.example.com', 'test'), ('foo.example.com', 'prod')])
+
+    def test_config_fingerprint(self):
+        config = make_config()
+        config.snapshot_zones = ['example.com', '1.in-addr.arpa']
+        fp = config_fingerprint(config)
+        config.snapshot_zones = ['1.in-addr.arpa', 'example.com']
+        assert config_fingerprint(config) == fp
+        config.server_prod = "prod2"
+        assert config_fingerprint(config) != fp
+        fp = config_fingerprint(config)
+        config.test_zone_files = ['example.com=db.example.com']
+        assert config_fingerprint(config) != fp
+        fp = config_fingerprint(config)
+        config.prod_zone_files = ['db.prod']
+        assert config_fingerprint(config) != fp
+
+    def test_snapshot_serials(self):
+        snaps = make_snapshots(serial=7)
+        assert snapshot_serials(snaps) == {serial_key('example.com', 'test'): 7,
+                                           serial_key('example.com', 'prod'): 7}
+
+    def test_store(self, tmpdir):
+        store = SnapshotStore(str(tmpdir.join('snaps')))
+        assert store.load_zone('example.com', 'test') is None
+        assert store.load_results({}, 'fp') == {}
+        lines = {'check confirm foo': {'result': {'result': True, 'message': 'foo', 'secondary': [],
+                                                  'warnings': []},
+                                       'names': ['foo.example.com']}}
+        store.save(make_snapshots(serial=3), 'fp', lines)
+        assert not [f for f in os.listdir(str(tmpdir.join('snaps'))) if f.endswith('.tmp')]
+        z = store.load_zone('Example.com.', 'test')
+        assert z.serial == 3
+        assert z.names['foo.example.com'] == ZoneSnapshot('example.com', example_zone()).names['foo.example.com']
+        assert store.load_zone('example.com', 'test', 5353) is None
+        serials = snapshot_serials(make_snapshots(serial=3))
+        assert store.load_results(serials, 'fp') == lines
+        # results are only reused with the same configuration and serials
+        assert store.load_results(serials, 'other') == {}
+        assert store.load_results(snapshot_serials(make_snapshots(serial=2)), 'fp') == {}
+
+    def test_store_corrupt(self, tmpdir):
+        store = SnapshotStore(str(tmpdir))
+        tmpdir.join('results.json').write('{"fingerprint": ')
+        assert store.load_results({}, 'fp') == {}
+        tmpdir.join('zone_test_53_example.com.json').write('{"zone": "example.com"}')
+        assert store.load_zone('example.com', 'test') is None
@@ -41,12 +41,20 @@ import pytest
 import sys
 import os
 import shutil
+import subprocess
+import time
+import io
+import json
 import mock
+import DNS
 
 from pydnstest.checks import DNStestChecks
 from pydnstest.config import DnstestConfig
 import pydnstest.main
-from pydnstest.parser import DnstestParser
+from pydnstest.parser import DnstestParser, ChangeRecord
+from pydnstest.pipeline import LineError
+from pydnstest.timings import TimedParser
+from pydnstest.trace import current_line
 from pydnstest.version import VERSION as pydnstest_version
 
 """
@@ -88,6 +96,30 @@ class OptionsObject(object):
         self.exampleconf = False
         self.configprint = False
         self.promptconfig = False
+        self.jobs = 1
+        self.use_async = False
+        self.parallel_lookups = False
+        self.socket_pool = False
+        self.adaptive_timeout = False
+        self.retries = None
+        self.max_qps = None
+        self.snapshot_zones = None
+        self.snapshot_dir = None
+        self.test_zone_files = None
+        self.prod_zone_files = None
+        self.record_file = None
+        self.replay_file = None
+        self.no_cache = False
+        self.cache_size = None
+        self.cache_honor_ttl = False
+        self.parse_cache_size = None
+        self.parse_processes = None
+        self.timings = False
+        self.timings_file = None
+        self.metrics_file = None
+        self.metrics_port = None
+        self.metrics_host = '127.0.0.1'
+        self.trace_file = None
 
 
 class TestDNSTestMain:
@@ -341,6 +373,50 @@ class TestDNSTestMain:
         assert out == "OK: foobarbaz\n++++ All 1 tests passed. (pydnstest %s)\n" % pydnstest_version
         assert err == "WARNING: reading from STDIN. Run with '-f filename' to read tests from a file.\n"
 
+    def test_stdin_cache_stats(self, save_user_config, capfd, monkeypatch):
+        """
+        Test that main() prints query cache statistics when queries were made
+        """
+        opt = OptionsObject()
+        setattr(opt, "cache_size", 50)
+        setattr(opt, "cache_honor_ttl", True)
+
+        pydnstest.main.sys.stdin = ["foo bar baz"]
+
+        def mockreturn(line, parser, chk):
+            assert chk.DNS.cache.maxsize == 50
+            assert chk.DNS.cache.honor_ttl is True
+            chk.DNS.cache.get(('foo.example.com', 'test', 53, 'A'))
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "OK: foobarbaz\nNote - query cache: 0 hits / 1 misses (0.0%% hit rate)\n++++ All 1 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    def test_stdin_no_cache(self, save_user_config, capfd, monkeypatch):
+        """
+        Test main() with --no-cache
+        """
+        opt = OptionsObject()
+        setattr(opt, "no_cache", True)
+        pydnstest.main.sys.stdin = ["foo bar baz"]
+
+        def mockreturn(line, parser, chk):
+            assert chk.DNS.cache is None
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "OK: foobarbaz\n++++ All 1 tests passed. (pydnstest %s)\n" % pydnstest_version
+
     def test_testfile_noexist(self, save_user_config, capfd):
         """
         Test with a testfile specified by not existant.
@@ -462,6 +538,624 @@ class TestDNSTestMain:
         assert out == "OK: foobarbaz\n**NG: foofail\n++++ 1 passed / 1 FAILED. (pydnstest %s)\n" % pydnstest_version
         assert err == ""
 
+    def test_check_stdin_jobs(self, save_user_config, capfd, monkeypatch):
+        """
+        Test with --jobs; output must stay in input order
+        even when the first line finishes last.
+        """
+        def mockreturn(d, chk):
+            if d.operation == "remove":
+                time.sleep(0.05)
+                return {'result': False, 'message': 'foofail', 'secondary': [], 'warnings': []}
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "check_parsed_line", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "jobs", 4)
+        pydnstest.main.sys.stdin = ["remove foo.example.com", "", "#foo", "confirm bar.example.com"]
+
+        # write out an example config file
+        # this will be cleaned up by restore_user_config()
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == "**NG: foofail\nOK: foobarbaz\n++++ 1 passed / 1 FAILED. (pydnstest %s)\n" % pydnstest_version
+        assert err == "WARNING: reading from STDIN. Run with '-f filename' to read tests from a file.\n"
+
+    def test_verify_stdin_jobs_parse_error(self, save_user_config, capfd, monkeypatch):
+        """
+        Test --verify with --jobs; parse errors are printed in input order
+        """
+        def mockreturn(d, chk):
+            return {'result': True, 'message': d.operation, 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "verify_parsed_line", mockreturn)
+
+        opt = OptionsObject()
+        setattr(opt, "verify", True)
+        setattr(opt, "jobs", 2)
+        pydnstest.main.sys.stdin = ["confirm foo.example.com", "foo bar baz", "remove bar.example.com"]
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == "OK: confirm\nERROR: could not parse input line, SKIPPING: foo bar baz\nOK: remove\n++++ All 2 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    @pytest.mark.skipif(sys.version_info < (3, 5), reason="asyncio backend requires python 3.5+")
+    def test_check_stdin_async(self, save_user_config, capfd, monkeypatch):
+        """
+        Test main() with --async; parse errors are printed in input order
+        """
+        import pydnstest.asyncdns
+
+        def mock_run_checks_async(calls, chk, jobs=1, sleep_secs=None):
+            assert jobs == 3
+            for c in calls:
+                if c is None:
+                    yield None
+                else:
+                    yield {'result': True, 'message': c[0], 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.asyncdns, "run_checks_async", mock_run_checks_async)
+
+        opt = OptionsObject()
+        setattr(opt, "use_async", True)
+        setattr(opt, "jobs", 3)
+        pydnstest.main.sys.stdin = ["confirm foo.example.com", "foo bar baz", "remove bar.example.com"]
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n[defaults]\nhave_reverse_dns: True\ndomain: .example.com\nignore_ttl: False\n")
+
+        foo = pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert foo == None
+        assert out == "OK: confirm_name\nERROR: could not parse input line, SKIPPING: foo bar baz\nOK: check_removed_name\n++++ All 2 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    def test_async_old_python(self, save_user_config, capfd, monkeypatch):
+        """
+        Test calling main() with --async on Python < 3.5
+        """
+        opt = OptionsObject()
+        setattr(opt, "use_async", True)
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+        monkeypatch.setattr(pydnstest.main.sys, "version_info", (3, 4, 0))
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: --async requires Python 3.5 or newer.\n"
+
+    def test_jobs_invalid(self, save_user_config, capfd):
+        """
+        Test calling main() with --jobs less than 1
+        """
+        opt = OptionsObject()
+        setattr(opt, "jobs", 0)
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: --jobs must be at least 1.\n"
+
+    def test_retries_invalid(self, save_user_config, capfd):
+        """
+        Test calling main() with negative --retries
+        """
+        opt = OptionsObject()
+        setattr(opt, "adaptive_timeout", True)
+        setattr(opt, "retries", -1)
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: --retries must not be negative.\n"
+
+    def test_max_qps_invalid(self, save_user_config, capfd):
+        """
+        Test calling main() with --max-qps 0
+        """
+        opt = OptionsObject()
+        setattr(opt, "max_qps", 0.0)
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: --max-qps must be greater than 0.\n"
+
+    def test_stdin_max_qps(self, save_user_config, capfd, monkeypatch):
+        """
+        Test main() with --max-qps
+        """
+        opt = OptionsObject()
+        setattr(opt, "max_qps", 50.0)
+        pydnstest.main.sys.stdin = ["foo bar baz"]
+
+        def mockreturn(line, parser, chk):
+            assert chk.DNS.limiter.max_qps == 50.0
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "Note - will send at most 50 queries per second to each server\nOK: foobarbaz\n++++ All 1 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    def test_stdin_snapshot(self, save_user_config, capfd, monkeypatch):
+        """
+        Test main() with --snapshot-zone
+        """
+        from pydnstest.snapshot import SnapshotSet, ZoneSnapshot
+        from pydnstest.tests.dnstest_snapshot_test import example_zone
+        opt = OptionsObject()
+        setattr(opt, "snapshot_zones", ["example.com"])
+        pydnstest.main.sys.stdin = ["foo bar baz"]
+        loaded = []
+
+        def mockload(self, zone, server, port=53, timeout=None):
+            loaded.append((zone, server))
+            snap = ZoneSnapshot(zone, example_zone())
+            self.add(server, snap, port)
+            return snap
+        monkeypatch.setattr(SnapshotSet, "load", mockload)
+
+        def mockreturn(line, parser, chk):
+            assert chk.DNS.snapshots.resolve_name('foo.example.com', '1.2.3.4')['answer']['data'] == '1.2.3.4'
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert loaded == [('example.com', '1.2.3.4'), ('example.com', '1.2.3.5')]
+        assert out == "Note - loaded 5 records in zone example.com from 1.2.3.4 (serial 1)\n" \
+            "Note - loaded 5 records in zone example.com from 1.2.3.5 (serial 1)\n" \
+            "OK: foobarbaz\n++++ All 1 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    def test_snapshot_error(self, save_user_config, capfd, monkeypatch):
+        """
+        Test main() with --snapshot-zone when the transfer fails
+        """
+        from pydnstest.snapshot import SnapshotSet
+        opt = OptionsObject()
+        setattr(opt, "snapshot_zones", ["example.com"])
+
+        def mockload(self, zone, server, port=53, timeout=None):
+            raise DNS.DNSError('zone transfer of example.com from 1.2.3.4 failed: REFUSED')
+        monkeypatch.setattr(SnapshotSet, "load", mockload)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: could not transfer zone example.com from 1.2.3.4: " \
+            "zone transfer of example.com from 1.2.3.4 failed: REFUSED\n"
+
+    def test_snapshot_dir(self, save_user_config, capfd, monkeypatch, tmpdir):
+        """
+        Test main() with --snapshot-dir, run twice
+        """
+        from pydnstest.snapshot import SnapshotSet, ZoneSnapshot
+        from pydnstest.tests.dnstest_snapshot_test import example_zone
+        opt = OptionsObject()
+        setattr(opt, "snapshot_zones", ["example.com"])
+        setattr(opt, "snapshot_dir", str(tmpdir.join("snaps")))
+        refreshed = []
+
+        def mockload(self, zone, server, port=53, timeout=None):
+            snap = ZoneSnapshot(zone, example_zone())
+            self.add(server, snap, port)
+            return snap
+        monkeypatch.setattr(SnapshotSet, "load", mockload)
+
+        def mockrefresh(self, snapshot, server, port=53, timeout=None):
+            refreshed.append((snapshot.zone, server, snapshot.serial))
+            self.add(server, snapshot, port)
+            return set()
+        monkeypatch.setattr(SnapshotSet, "refresh", mockrefresh)
+
+        def mockrun(chk, method, *args):
+            assert method == 'confirm_name'
+            return ({'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []},
+                    set([('foo.example.com', '1.2.3.4'), ('foo.example.com', '1.2.3.5')]))
+        monkeypatch.setattr(pydnstest.main, "traced_run", mockrun)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.sys.stdin = ["confirm foo.example.com", "foo bar baz"]
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert refreshed == []
+        assert "OK: foobarbaz\n" in out
+        assert "Note - re-checked 1 of 1 lines; the rest were unchanged since the last run\n" in out
+
+        # the second run refreshes the stored snapshots, and reuses the result
+        def mockrun_again(chk, method, *args):
+            raise AssertionError("line should not be checked again")
+        monkeypatch.setattr(pydnstest.main, "traced_run", mockrun_again)
+        pydnstest.main.sys.stdin = ["confirm foo.example.com", "foo bar baz"]
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert refreshed == [('example.com', '1.2.3.4', 1), ('example.com', '1.2.3.5', 1)]
+        assert "Note - updated zone example.com from 1.2.3.4 to serial 1 (0 names changed)\n" in out
+        assert "OK: foobarbaz\n" in out
+        assert "ERROR: could not parse input line, SKIPPING: foo bar baz\n" in out
+        assert "Note - re-checked 0 of 1 lines; the rest were unchanged since the last run\n" in out
+
+        # a change to a zone with wildcards re-checks every line
+        def mockrefresh_wildcard(self, snapshot, server, port=53, timeout=None):
+            self.add(server, snapshot, port)
+            return None
+        monkeypatch.setattr(SnapshotSet, "refresh", mockrefresh_wildcard)
+        monkeypatch.setattr(pydnstest.main, "traced_run", mockrun)
+        pydnstest.main.sys.stdin = ["confirm foo.example.com"]
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert "Note - updated zone example.com from 1.2.3.4 to serial 1 (has wildcards; re-checking all names)\n" in out
+        assert "Note - re-checked 1 of 1 lines; the rest were unchanged since the last run\n" in out
+
+    def test_snapshot_dir_zone_file_edited(self, save_user_config, capfd, monkeypatch, tmpdir):
+        """
+        Test main() with --snapshot-dir and --test-zone-file, with the zone
+        file edited between runs
+        """
+        from pydnstest.snapshot import SnapshotSet, ZoneSnapshot
+        from pydnstest.tests.dnstest_snapshot_test import example_zone
+        test_zone = tmpdir.join('test.zone')
+        test_zone.write('$TTL 60\n@ SOA ns1 hm 2 3600 600 86400 60\nfoo A 1.2.3.4\n')
+        opt = OptionsObject()
+        setattr(opt, "snapshot_zones", ["example.com"])
+        setattr(opt, "snapshot_dir", str(tmpdir.join("snaps")))
+        setattr(opt, "test_zone_files", ["sub.example.com=%s" % test_zone])
+        checked = []
+
+        def mockload(self, zone, server, port=53, timeout=None):
+            snap = ZoneSnapshot(zone, example_zone())
+            self.add(server, snap, port)
+            return snap
+        monkeypatch.setattr(SnapshotSet, "load", mockload)
+
+        def mockrefresh(self, snapshot, server, port=53, timeout=None):
+            self.add(server, snapshot, port)
+            return set()
+        monkeypatch.setattr(SnapshotSet, "refresh", mockrefresh)
+
+        def mockrun(chk, method, *args):
+            checked.append(chk.DNS.snapshots.resolve_name('foo.sub.example.com', '1.2.3.5')['answer']['data'])
+            return ({'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []},
+                    set([('foo.sub.example.com', '1.2.3.4'), ('foo.sub.example.com', '1.2.3.5')]))
+        monkeypatch.setattr(pydnstest.main, "traced_run", mockrun)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        for i in range(2):
+            pydnstest.main.sys.stdin = ["confirm foo.sub.example.com"]
+            pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        # the unchanged file's result is reused
+        assert checked == ['1.2.3.4']
+        assert "Note - re-checked 0 of 1 lines; the rest were unchanged since the last run\n" in out
+
+        test_zone.write('$TTL 60\n@ SOA ns1 hm 10 3600 600 86400 60\nfoo A 1.2.3.9\n')
+        pydnstest.main.sys.stdin = ["confirm foo.sub.example.com"]
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert checked == ['1.2.3.4', '1.2.3.9']
+        assert "(2 records, serial 10)\n" in out
+        assert "Note - re-checked 1 of 1 lines; the rest were unchanged since the last run\n" in out
+
+    def test_snapshot_dir_no_zones(self, save_user_config, capfd):
+        """
+        Test main() with --snapshot-dir but no --snapshot-zone
+        """
+        opt = OptionsObject()
+        setattr(opt, "snapshot_dir", "snapdir")
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: --snapshot-dir requires at least one --snapshot-zone.\n"
+
+    @pytest.mark.parametrize("jobs,use_async", [(2, False), (1, True)])
+    def test_snapshot_dir_concurrent(self, save_user_config, capfd, jobs, use_async):
+        """
+        Test main() with --snapshot-dir and --jobs or --async
+        """
+        opt = OptionsObject()
+        setattr(opt, "snapshot_zones", ["example.com"])
+        setattr(opt, "snapshot_dir", "snapdir")
+        setattr(opt, "jobs", jobs)
+        setattr(opt, "use_async", use_async)
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out.endswith("ERROR: --snapshot-dir cannot be used with --jobs or --async.\n")
+
+    def test_zone_files(self, save_user_config, capfd, monkeypatch, tmpdir):
+        """
+        Test main() with --test-zone-file and --prod-zone-file
+        """
+        from pydnstest.tests.dnstest_zonefile_test import REVERSE
+        test_zone = tmpdir.join('test.zone')
+        test_zone.write('$TTL 60\n@ SOA ns1 hm 2 3600 600 86400 60\nfoo A 1.2.3.4\n')
+        prod_zone = tmpdir.join('rev.zone')
+        prod_zone.write(REVERSE)
+        opt = OptionsObject()
+        setattr(opt, "test_zone_files", ["example.com=%s" % test_zone])
+        setattr(opt, "prod_zone_files", ["3.2.1.in-addr.arpa=%s" % prod_zone])
+        pydnstest.main.sys.stdin = ["foo bar baz"]
+
+        def mockreturn(line, parser, chk):
+            assert chk.DNS.snapshots.resolve_name('foo.example.com', '1.2.3.5')['answer']['data'] == '1.2.3.4'
+            assert chk.DNS.snapshots.resolve_name('foo.example.com', '1.2.3.4') is None
+            assert chk.DNS.snapshots.lookup_reverse('1.2.3.4', '1.2.3.4')['answer']['data'] == 'foo.example.com'
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "Note - answering zone example.com for TEST from %s (2 records, serial 2)\n" \
+            "Note - answering zone 3.2.1.in-addr.arpa for PROD from %s (3 records, serial 5)\n" \
+            "OK: foobarbaz\n++++ All 1 tests passed. (pydnstest %s)\n" % (test_zone, prod_zone, pydnstest_version)
+
+    def test_zone_file_error(self, save_user_config, capfd, tmpdir):
+        """
+        Test main() with a --test-zone-file that can't be parsed
+        """
+        test_zone = tmpdir.join('test.zone')
+        test_zone.write('foo A 1.2.3.4\n')
+        opt = OptionsObject()
+        setattr(opt, "test_zone_files", [str(test_zone)])
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: %s:1: relative name foo, but no $ORIGIN or zone given\n" % test_zone
+
+    def test_record(self, save_user_config, capfd, monkeypatch, tmpdir):
+        """
+        Test main() with --record
+        """
+        opt = OptionsObject()
+        setattr(opt, "record_file", str(tmpdir.join('cassette')))
+        pydnstest.main.sys.stdin = ["foo bar baz"]
+
+        def mockreturn(line, parser, chk):
+            assert chk.DNS.cassette.replay is False
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "OK: foobarbaz\nNote - recorded 0 query results to %s\n" \
+            "++++ All 1 tests passed. (pydnstest %s)\n" % (tmpdir.join('cassette'), pydnstest_version)
+
+    def test_timings(self, save_user_config, capfd, monkeypatch, tmpdir):
+        """
+        Test main() with --timings and --timings-file
+        """
+        opt = OptionsObject()
+        setattr(opt, "timings", True)
+        setattr(opt, "timings_file", str(tmpdir.join('timings.json')))
+        pydnstest.main.sys.stdin = ["foo bar baz"]
+
+        def mockreturn(line, parser, chk):
+            assert isinstance(parser, TimedParser)
+            assert chk.DNS.timings is not None
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        lines = out.splitlines()
+        assert lines[0] == "OK: foobarbaz"
+        assert lines[1].startswith("Note - timings for ")
+        assert lines[5].startswith("Note -   format ")
+        assert lines[5].endswith("(1 lines)")
+        assert lines[6] == "++++ All 1 tests passed. (pydnstest %s)" % pydnstest_version
+        d = json.load(open(str(tmpdir.join('timings.json'))))
+        assert d['phases']['format']['lines'] == 1
+
+    def test_metrics(self, save_user_config, capfd, monkeypatch, tmpdir):
+        """
+        Test main() with --metrics-file and --metrics-port
+        """
+        opt = OptionsObject()
+        setattr(opt, "metrics_file", str(tmpdir.join('dnstest.prom')))
+        setattr(opt, "metrics_port", 0)
+        pydnstest.main.sys.stdin = ["foo bar baz"]
+
+        def mockreturn(line, parser, chk):
+            chk.DNS.metrics.observe('1.2.3.4', 'A', 0.01, 'NOERROR')
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        lines = out.splitlines()
+        assert lines[0].startswith("Note - serving query metrics on port ")
+        assert lines[1:] == ["OK: foobarbaz", "++++ All 1 tests passed. (pydnstest %s)" % pydnstest_version]
+        text = tmpdir.join('dnstest.prom').read()
+        assert 'pydnstest_queries_total{outcome="NOERROR",qtype="A",server="1.2.3.4"} 1\n' in text
+        assert text.endswith('# EOF\n')
+
+    def test_trace(self, save_user_config, capfd, monkeypatch, tmpdir):
+        """
+        Test main() with --trace
+        """
+        opt = OptionsObject()
+        setattr(opt, "trace_file", str(tmpdir.join('trace')))
+        pydnstest.main.sys.stdin = ["# comment", "", "foo bar baz"]
+
+        def mockreturn(line, parser, chk):
+            assert current_line() == 3
+            return {'result': True, 'message': 'foobarbaz', 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "run_check_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "OK: foobarbaz\nNote - traced 0 queries to %s\n" \
+            "++++ All 1 tests passed. (pydnstest %s)\n" % (tmpdir.join('trace'), pydnstest_version)
+
+    def test_parse_cache(self, save_user_config, capfd, monkeypatch):
+        """
+        Test that main() prints parse cache statistics when lines were repeated
+        """
+        opt = OptionsObject()
+        pydnstest.main.sys.stdin = ["confirm foo", "confirm  foo", "confirm bar"]
+
+        def mockreturn(d, chk):
+            return {'result': True, 'message': d.hostname, 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "check_parsed_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "OK: foo\nOK: foo\nOK: bar\nNote - parse cache: 1 hits / 2 misses (33.3%% hit rate)\n" \
+            "++++ All 3 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    def test_parse_cache_disabled(self, save_user_config, capfd, monkeypatch):
+        """
+        Test main() with --parse-cache-size 0
+        """
+        opt = OptionsObject()
+        setattr(opt, "parse_cache_size", 0)
+        pydnstest.main.sys.stdin = ["confirm foo", "confirm foo"]
+
+        def mockreturn(d, chk):
+            return {'result': True, 'message': d.hostname, 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "check_parsed_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "OK: foo\nOK: foo\n++++ All 2 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_parse_processes(self, save_user_config, capfd, monkeypatch, tmpdir, jobs):
+        """
+        Test main() with --parse-processes; results and parse errors are
+        printed in input order
+        """
+        fname = str(tmpdir.join('testfile.txt'))
+        with open(fname, 'w') as fh:
+            fh.write("confirm foo\n\n# comment\nfoo bar baz\n" + "confirm bar\n" * 50 + "remove baz\n")
+        opt = OptionsObject()
+        setattr(opt, "testfile", fname)
+        setattr(opt, "parse_processes", 2)
+        setattr(opt, "jobs", jobs)
+        # worker processes close sys.stdin as they start
+        monkeypatch.setattr(pydnstest.main.sys, "stdin", io.StringIO())
+
+        def mockreturn(d, chk):
+            return {'result': True, 'message': d.operation + ' ' + d.hostname, 'secondary': [], 'warnings': []}
+        monkeypatch.setattr(pydnstest.main, "check_parsed_line", mockreturn)
+
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+
+        pydnstest.main.main(opt)
+        out, err = capfd.readouterr()
+        assert out == "OK: confirm foo\nERROR: could not parse input line, SKIPPING: foo bar baz\n" + \
+            "OK: confirm bar\n" * 50 + "OK: remove baz\n" + \
+            "++++ All 52 tests passed. (pydnstest %s)\n" % pydnstest_version
+
+    @pytest.mark.parametrize(("procs", "testfile", "msg"), [
+        (0, 'testfile.txt', "ERROR: --parse-processes must be at least 1.\n"),
+        (2, None, "ERROR: --parse-processes requires -f / --file.\n"),
+    ])
+    def test_parse_processes_invalid(self, save_user_config, capfd, procs, testfile, msg):
+        """
+        Test main() with an invalid --parse-processes
+        """
+        opt = OptionsObject()
+        setattr(opt, "parse_processes", procs)
+        setattr(opt, "testfile", testfile)
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == msg
+
+    def test_record_and_replay(self, save_user_config, capfd):
+        """
+        Test main() with both --record and --replay
+        """
+        opt = OptionsObject()
+        setattr(opt, "record_file", "foo")
+        setattr(opt, "replay_file", "bar")
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out == "ERROR: --record and --replay cannot be used together.\n"
+
+    def test_replay_missing(self, save_user_config, capfd, tmpdir):
+        """
+        Test main() with --replay of a file that doesn't exist
+        """
+        opt = OptionsObject()
+        setattr(opt, "replay_file", str(tmpdir.join('missing')))
+        fpath = os.path.abspath("dnstest.ini")
+        self.write_conf_file(fpath, "[servers]\nprod: 1.2.3.4\ntest: 1.2.3.5\n")
+        with pytest.raises(SystemExit) as excinfo:
+            pydnstest.main.main(opt)
+        assert excinfo.value.code == 1
+        out, err = capfd.readouterr()
+        assert out.startswith("ERROR: could not read cassette %s: " % tmpdir.join('missing'))
+
     def test_options(self, monkeypatch):
         """
         Test the parse_opts option parsing method
@@ -489,6 +1183,44 @@ class TestDNSTestMain:
         sys.argv = ['pydnstest', '-c', 'configfile', '-f', 'mytestfile', '-V', '--sleep', '0.01']
         x = pydnstest.main.parse_opts()
 
+    def test_options_jobs(self, monkeypatch):
+        """
+        Test the parse_opts option parsing method, with the jobs option
+        """
+        def mockreturn(options):
+            assert options.jobs == 8
+            assert options.parallel_lookups == True
+        monkeypatch.setattr(pydnstest.main, "main", mockreturn)
+        sys.argv = ['pydnstest', '-f', 'mytestfile', '--jobs', '8', '--parallel-lookups']
+        pydnstest.main.parse_opts()
+
+    def test_options_socket_pool(self, monkeypatch):
+        """
+        Test the parse_opts option parsing method, with the socket_pool and cache options
+        """
+        def mockreturn(options):
+            assert options.socket_pool == True
+            assert options.no_cache == True
+            assert options.cache_size == 20
+            assert options.adaptive_timeout == True
+            assert options.retries == 4
+            assert options.max_qps == 12.5
+            assert options.snapshot_zones == ['example.com', '2.1.in-addr.arpa']
+            assert options.snapshot_dir == 'snapdir'
+            assert options.test_zone_files == ['db.example.com']
+            assert options.prod_zone_files == ['example.com=db.prod']
+            assert options.record_file == 'cassette'
+            assert options.metrics_port == 9100
+            assert options.metrics_host == '0.0.0.0'
+        monkeypatch.setattr(pydnstest.main, "main", mockreturn)
+        sys.argv = ['pydnstest', '-f', 'mytestfile', '--socket-pool', '--no-cache', '--cache-size', '20',
+                    '--adaptive-timeout', '--retries', '4', '--max-qps', '12.5',
+                    '--snapshot-zone', 'example.com', '--snapshot-zone', '2.1.in-addr.arpa',
+                    '--snapshot-dir', 'snapdir', '--test-zone-file', 'db.example.com',
+                    '--prod-zone-file', 'example.com=db.prod', '--record', 'cassette',
+                    '--metrics-port', '9100', '--metrics-host', '0.0.0.0']
+        pydnstest.main.parse_opts()
+
     def test_options_ignorettl(self, monkeypatch):
         """
         Test the parse_opts option parsing method, with the ignorettl option
@@ -586,12 +1318,132 @@ class TestDNSTestMain:
         """
         test --help output
         """
-        grammar_mock = mock.MagicMock()
-        grammar_mock.return_value = ["outputhere"]
-        with mock.patch('pydnstest.main.DnstestParser.get_grammar', grammar_mock):
+        with mock.patch('pydnstest.main.DnstestParser.grammar_strings', ["outputhere"]):
             with mock.patch('pydnstest.main.sys.argv', ['pydnstest', '--help']):
                 with pytest.raises(SystemExit):
                     pydnstest.main.parse_opts()
         out, err = capfd.readouterr()
         assert "Grammar:\n\noutputhere\n" in out
         assert err == ""
+
+
+class TestLineMethod:
+
+    @pytest.mark.parametrize(("line", "check", "verify", "args"), [
+        ("add foo value bar", 'check_added_name', 'verify_added_name', ('foo', 'bar')),
+        ("remove foo", 'check_removed_name', 'verify_removed_name', ('foo',)),
+        ("rename foo value 1.2.3.4 to bar", 'check_renamed_name', 'verify_renamed_name', ('foo', 'bar', '1.2.3.4')),
+        ("change foo to bar", 'check_changed_name', 'verify_changed_name', ('foo', 'bar')),
+        ("confirm foo", 'confirm_name', 'confirm_name', ('foo',)),
+    ])
+    def test_line_method(self, line, check, verify, args):
+        r = DnstestParser().parse_record(line)
+        assert pydnstest.main.line_method(r) == (check, args)
+        assert pydnstest.main.line_method(r, verify=True) == (verify, args)
+
+    def test_line_method_unknown(self):
+        assert pydnstest.main.line_method(ChangeRecord(99, 'bar')) == (None, None)
+
+    def test_check_parsed_line_record(self):
+        chk = mock.Mock()
+        chk.check_added_name.return_value = 'foo'
+        assert pydnstest.main.check_parsed_line(ChangeRecord.from_dict({'operation': 'add', 'hostname': 'a', 'value': 'b'}), chk) == 'foo'
+        chk.check_added_name.assert_called_once_with('a', 'b')
+
+
+class TestCheckLines:
+
+    def chk(self):
+        chk = mock.Mock()
+        chk.check_added_name.side_effect = lambda h, v: {'result': True, 'message': h, 'secondary': [], 'warnings': []}
+        chk.verify_removed_name.side_effect = lambda h: {'result': False, 'message': h, 'secondary': [], 'warnings': []}
+        return chk
+
+    @pytest.mark.parametrize("jobs", [1, 3])
+    def test_check_lines(self, jobs, capfd):
+        lines = ["add foo%d value bar" % i for i in range(20)] + ["foo bar baz"]
+        res = list(pydnstest.main.check_lines(iter(lines), DnstestParser(), self.chk(), jobs=jobs))
+        assert [r['message'] for r in res[:-1]] == ["foo%d" % i for i in range(20)]
+        # the error is left to the sink, rather than printed
+        assert res[-1] == LineError("ERROR: could not parse input line, SKIPPING: foo bar baz")
+        out, err = capfd.readouterr()
+        assert out == ""
+
+    @pytest.mark.parametrize("jobs", [1, 3])
+    def test_check_lines_unknown_operation(self, jobs, capfd):
+        parser = mock.Mock()
+        parser.parse_record.return_value = ChangeRecord(99, 'foo')
+        res = list(pydnstest.main.check_lines(["confirm foo"], parser, self.chk(), jobs=jobs))
+        assert res == [LineError("ERROR: unknown input operation")]
+        out, err = capfd.readouterr()
+        assert out == ""
+        # called on their own, they still print it
+        assert pydnstest.main.run_check_line("confirm foo", parser, self.chk()) is False
+        out, err = capfd.readouterr()
+        assert out == "ERROR: unknown input operation\n"
+
+    def test_check_lines_verify(self):
+        res = list(pydnstest.main.check_lines(["remove foo"], DnstestParser(), self.chk(), verify=True))
+        assert res == [{'result': False, 'message': 'foo', 'secondary': [], 'warnings': []}]
+
+    @pytest.mark.parametrize("jobs", [1, 4])
+    def test_check_lines_streaming(self, jobs):
+        read = []
+
+        def source():
+            n = 0
+            while True:
+                read.append(n)
+                yield "add foo%d value bar" % n
+                n += 1
+
+        res = pydnstest.main.check_lines(source(), DnstestParser(), self.chk(), jobs=jobs)
+        assert [next(res)['message'] for i in range(10)] == ["foo%d" % i for i in range(10)]
+        res.close()
+        assert len(read) <= 10 + 2 * jobs
+
+    def test_check_lines_sleep(self, monkeypatch):
+        slept = []
+        monkeypatch.setattr(pydnstest.main, "sleep", slept.append)
+        lines = ["add foo value bar", "foo bar baz", "add bar value baz"]
+        res = list(pydnstest.main.check_lines(lines, DnstestParser(), self.chk(), sleep_secs=0.5))
+        assert len(res) == 3
+        assert slept == [0.5, 0.5]
+
+
+class TestStartup:
+
+    def imported(self, code):
+        """
+        Run code in a new interpreter; return which heavy modules it imported
+        """
+        root = os.path.dirname(os.path.dirname(os.path.abspath(pydnstest.main.__file__)))
+        code += "; print('imported: ' + ' '.join(m for m in ('DNS', 'pyparsing', 'multiprocessing.pool', 'http.server', 'asyncio') if m in sys.modules))"
+        out = subprocess.check_output([sys.executable, '-c', 'import sys\n' + code], cwd=root)
+        return out.decode('utf-8').splitlines()[-1].split()[1:]
+
+    def test_import_main(self):
+        assert self.imported("import pydnstest.main") == []
+
+    def test_version(self):
+        assert self.imported("import pydnstest.main\n"
+                             "sys.argv = ['pydnstest', '--version']\n"
+                             "try:\n"
+                             "    pydnstest.main.parse_opts()\n"
+                             "except SystemExit:\n"
+                             "    pass\n"
+                             "sys.stdout.flush()") == []
+
+    def test_parse_line(self):
+        assert self.imported("from pydnstest.parser import DnstestParser; DnstestParser().parse_line('confirm foo')") == []
+
+    def test_run_check_line(self):
+        assert self.imported("import pydnstest.main\n"
+                             "from pydnstest.parser import DnstestParser\n"
+                             "class Checks:\n"
+                             "    def confirm_name(self, name):\n"
+                             "        return name\n"
+                             "assert pydnstest.main.run_check_line('confirm foo', DnstestParser(), Checks()) == 'foo'") == []
+        assert self.imported("import pydnstest.main\n"
+                             "from pydnstest.parser import DnstestParser\n"
+                             "assert pydnstest.main.run_check_line('foo bar baz', DnstestParser(), None) is False") == ['pyparsing']
@@ -0,0 +1,163 @@
+"""
+tests for metrics.py
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import random
+
+import pytest
+import DNS
+
+from pydnstest.dns import DNStestDNS
+from pydnstest.metrics import LatencyHistogram, QueryMetrics, MetricsServer, _index, _bounds
+
+try:
+    from urllib.request import urlopen
+except ImportError:  # python 2
+    from urllib2 import urlopen
+
+
+class TestLatencyHistogram:
+
+    def test_buckets(self):
+        # buckets are contiguous and each value falls in its own bucket
+        last = -1
+        for i in range(2000):
+            low, high = _bounds(i)
+            assert low == last + 1
+            last = high
+        for v in [0, 1, 127, 128, 129, 1000, 123456, 10 ** 9]:
+            low, high = _bounds(_index(v))
+            assert low <= v <= high
+
+    def test_quantile(self):
+        h = LatencyHistogram()
+        assert h.quantile(0.5) is None
+        r = random.Random(1)
+        values = sorted(r.uniform(0.0001, 2.0) for _ in range(10000))
+        for v in values:
+            h.record(v)
+        assert h.count == 10000
+        assert h.total == pytest.approx(sum(values))
+        for q in (0.5, 0.9, 0.99, 0.999):
+            exact = values[int(q * len(values)) - 1]
+            assert h.quantile(q) == pytest.approx(exact, rel=0.02)
+        assert h.quantile(1.0) == pytest.approx(values[-1], rel=0.001)
+
+    def test_single(self):
+        h = LatencyHistogram()
+        h.record(0.0123)
+        assert h.quantile(0.5) == 0.0123
+        assert h.quantile(0.999) == 0.0123
+
+
+class TestQueryMetrics:
+
+    def test_openmetrics(self):
+        m = QueryMetrics()
+        m.observe('1.2.3.4', 'A', 0.002, 'NOERROR')
+        m.observe('1.2.3.4', 'A', 0.02, 'NXDOMAIN')
+        m.observe('1.2.3.4', 'A', 20.0, 'NOERROR')
+        m.failed('1.2.3.4', 'A', DNS.TimeoutError('Timeout'))
+        m.failed('1.2.3.4', 'A', DNS.SocketError('refused'))
+        text = m.to_openmetrics()
+        lines = text.splitlines()
+        assert lines[0] == '# TYPE pydnstest_query_duration_seconds histogram'
+        assert 'pydnstest_query_duration_seconds_bucket{qtype="A",server="1.2.3.4",le="0.001"} 0' in lines
+        assert 'pydnstest_query_duration_seconds_bucket{qtype="A",server="1.2.3.4",le="0.0025"} 1' in lines
+        assert 'pydnstest_query_duration_seconds_bucket{qtype="A",server="1.2.3.4",le="0.025"} 2' in lines
+        assert 'pydnstest_query_duration_seconds_bucket{qtype="A",server="1.2.3.4",le="10.0"} 2' in lines
+        assert 'pydnstest_query_duration_seconds_bucket{qtype="A",server="1.2.3.4",le="+Inf"} 3' in lines
+        assert 'pydnstest_query_duration_seconds_count{qtype="A",server="1.2.3.4"} 3' in lines
+        assert 'pydnstest_query_duration_quantiles_seconds{qtype="A",server="1.2.3.4",quantile="0.5"} 0.020095' in lines
+        assert 'pydnstest_queries_total{outcome="NOERROR",qtype="A",server="1.2.3.4"} 2' in lines
+        assert 'pydnstest_queries_total{outcome="NXDOMAIN",qtype="A",server="1.2.3.4"} 1' in lines
+        assert 'pydnstest_queries_total{outcome="timeout",qtype="A",server="1.2.3.4"} 1' in lines
+        assert 'pydnstest_queries_total{outcome="error",qtype="A",server="1.2.3.4"} 1' in lines
+        assert lines[-1] == '# EOF'
+
+    def test_empty(self):
+        assert QueryMetrics().to_openmetrics().splitlines()[-1] == '# EOF'
+
+    def test_write(self, tmpdir):
+        m = QueryMetrics()
+        m.observe('1.2.3.4', 'A', 0.002, 'NOERROR')
+        path = str(tmpdir.join('dnstest.prom'))
+        m.write(path)
+        assert open(path).read() == m.to_openmetrics()
+        assert tmpdir.listdir() == [tmpdir.join('dnstest.prom')]
+
+    def test_server(self):
+        m = QueryMetrics()
+        m.observe('1.2.3.4', 'A', 0.002, 'NOERROR')
+        s = MetricsServer(m, 0)
+        try:
+            # only reachable locally by default
+            assert s.httpd.server_address[0] == '127.0.0.1'
+            resp = urlopen('http://127.0.0.1:%d/metrics' % s.port)
+            assert resp.headers['Content-Type'].startswith('application/openmetrics-text')
+            assert resp.read().decode('utf-8') == m.to_openmetrics()
+        finally:
+            s.close()
+
+    @pytest.mark.parametrize('kwargs', [{}, {'parallel_lookups': True}, {'socket_pool': True}])
+    def test_resolver(self, dns_server, kwargs):
+        m = QueryMetrics()
+        d = DNStestDNS(metrics=m, **kwargs)
+        d.resolve_name('foo.example.com', '127.0.0.1', dns_server.port)
+        d.resolve_name('nx.example.com', '127.0.0.1', dns_server.port)
+        d.close()
+        assert m.outcomes[('127.0.0.1', 'A', 'NOERROR')] == 1
+        assert m.outcomes[('127.0.0.1', 'A', 'NXDOMAIN')] == 1
+        assert m.outcomes[('127.0.0.1', 'CNAME', 'NXDOMAIN')] == 1
+        assert m.latency[('127.0.0.1', 'A')][0].count == 2
+
+    def test_resolver_timeout(self, dns_server, monkeypatch):
+        monkeypatch.setitem(DNS.defaults, 'timeout', 0.2)
+        m = QueryMetrics()
+        d = DNStestDNS(metrics=m)
+        with pytest.raises(DNS.DNSError):
+            d.query('drop.example.com', '127.0.0.1', 'A', dns_server.port)
+        assert m.outcomes == {('127.0.0.1', 'A', 'timeout'): 1}
+        assert m.latency == {}
@@ -38,13 +38,70 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import pytest
+import random
 import sys
 import os
 
-from pydnstest.parser import DnstestParser
+from pydnstest.parser import DnstestParser, ChangeRecord, ADD, RENAME, CONFIRM, _grammar
 from pyparsing import ParseException
 
 
+PARSE_CASES = [
+    ("add fooHostOne value fooHostTwo", {'operation': 'add', 'hostname': 'fooHostOne', 'value': 'fooHostTwo'}),
+    ("add foobar value 10.104.92.243", {'operation': 'add', 'hostname': 'foobar', 'value': '10.104.92.243'}),
+    ("add entry foobar with value baz", {'operation': 'add', 'hostname': 'foobar', 'value': 'baz'}),
+    ("add record foobar.example.com target blam", {'operation': 'add', 'hostname': 'foobar.example.com', 'value': 'blam'}),
+    ("add name foobar address 192.168.0.139", {'operation': 'add', 'hostname': 'foobar', 'value': '192.168.0.139'}),
+    ("add foobar.example.com with target 172.16.132.10", {'operation': 'add', 'hostname': 'foobar.example.com', 'value': '172.16.132.10'}),
+    ("add foobar.hosts.example.com value 172.16.132.10", {'operation': 'add', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
+    ("remove fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
+    ("remove record fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
+    ("remove name fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
+    ("remove entry fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
+    ("remove foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
+    ("remove record foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
+    ("remove name foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
+    ("remove entry foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
+    ("remove entry foo.bar.baz.example.com", {'operation': 'remove', 'hostname': 'foo.bar.baz.example.com'}),
+    ("rename fooHostOne with target targ to fooHostTwo", {'operation': 'rename', 'hostname': 'fooHostOne', 'newname': 'fooHostTwo', 'value': 'targ'}),
+    ("rename entry foobar foo.bar.net to baz", {'operation': 'rename', 'hostname': 'foobar', 'newname': 'baz', 'value': 'foo.bar.net'}),
+    ("rename record foobar.example.com with address 1.2.3.4 to blam", {'operation': 'rename', 'hostname': 'foobar.example.com', 'newname': 'blam', 'value': '1.2.3.4'}),
+    ("rename name foobar 1.2.3.5 to baz.example.com", {'operation': 'rename', 'hostname': 'foobar', 'newname': 'baz.example.com', 'value': '1.2.3.5'}),
+    ("rename foobar.example.com value 1.2.3.4 to baz.blam.hosts.example.com", {'operation': 'rename', 'hostname': 'foobar.example.com', 'newname': 'baz.blam.hosts.example.com', 'value': '1.2.3.4'}),
+    ("rename foobar.hosts.example.com with value baz to blam", {'operation': 'rename', 'hostname': 'foobar.hosts.example.com', 'newname': 'blam', 'value': 'baz'}),
+    ("rename foo.subdomain.example.com with value 10.188.8.76 to bar.subdomain.example.com", {'operation': 'rename', 'hostname': 'foo.subdomain.example.com', 'newname': 'bar.subdomain.example.com', 'value': '10.188.8.76'}),
+    ("change fooHostOne to fooHostTwo", {'operation': 'change', 'hostname': 'fooHostOne', 'value': 'fooHostTwo'}),
+    ("change foobar to 10.104.92.243", {'operation': 'change', 'hostname': 'foobar', 'value': '10.104.92.243'}),
+    ("change entry foobar to baz", {'operation': 'change', 'hostname': 'foobar', 'value': 'baz'}),
+    ("change record foobar.example.com to blam", {'operation': 'change', 'hostname': 'foobar.example.com', 'value': 'blam'}),
+    ("change name foobar to 192.168.0.139", {'operation': 'change', 'hostname': 'foobar', 'value': '192.168.0.139'}),
+    ("change foobar.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.example.com', 'value': '172.16.132.10'}),
+    ("change foobar.hosts.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
+    ("change entry foobar.hosts.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
+    ("change name foobar to foobar.hosts.example.com", {'operation': 'change', 'hostname': 'foobar', 'value': 'foobar.hosts.example.com'}),
+    ("change name foobar to foobar.example.com", {'operation': 'change', 'hostname': 'foobar', 'value': 'foobar.example.com'}),
+    ("confirm foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
+    ("confirm record foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
+    ("confirm entry foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
+    ("confirm name foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
+    ("confirm 1.2.3.4", None),
+    ("confirm record 1.2.3.4", None),
+    ("confirm entry 1.2.3.4", None),
+    ("confirm name 1.2.3.4", None),
+    ("confirm foo", {'operation': 'confirm', 'hostname': 'foo'}),
+    ("confirm record foo", {'operation': 'confirm', 'hostname': 'foo'}),
+    ("confirm entry foo", {'operation': 'confirm', 'hostname': 'foo'}),
+    ("confirm name foo", {'operation': 'confirm', 'hostname': 'foo'}),
+    ("confirm m.example.com", {'operation': 'confirm', 'hostname': 'm.example.com'}),
+    ("confirm foo.m.example.com", {'operation': 'confirm', 'hostname': 'foo.m.example.com'}),
+    ("confirm m", {'operation': 'confirm', 'hostname': 'm'}),
+    ("confirm m._foo.example.com", {'operation': 'confirm', 'hostname': 'm._foo.example.com'}),
+    ("confirm _bar.example.com", {'operation': 'confirm', 'hostname': '_bar.example.com'}),
+    ("add record _foobar.example.com address 1.2.3.4", {'operation': 'add', 'hostname': '_foobar.example.com', 'value': '1.2.3.4'}),
+    ("add record foobar._discover.example.com target blam", {'operation': 'add', 'hostname': 'foobar._discover.example.com', 'value': 'blam'})
+]
+
+
 class TestLanguageParsing:
     """
     Class to test the natural language parsing features of dnstest.py
@@ -57,60 +114,7 @@ class TestLanguageParsing:
     'confirm <hostname_or_fqdn>'
     """
 
-    @pytest.mark.parametrize(("line", "parsed_dict"), [
-        ("add fooHostOne value fooHostTwo", {'operation': 'add', 'hostname': 'fooHostOne', 'value': 'fooHostTwo'}),
-        ("add foobar value 10.104.92.243", {'operation': 'add', 'hostname': 'foobar', 'value': '10.104.92.243'}),
-        ("add entry foobar with value baz", {'operation': 'add', 'hostname': 'foobar', 'value': 'baz'}),
-        ("add record foobar.example.com target blam", {'operation': 'add', 'hostname': 'foobar.example.com', 'value': 'blam'}),
-        ("add name foobar address 192.168.0.139", {'operation': 'add', 'hostname': 'foobar', 'value': '192.168.0.139'}),
-        ("add foobar.example.com with target 172.16.132.10", {'operation': 'add', 'hostname': 'foobar.example.com', 'value': '172.16.132.10'}),
-        ("add foobar.hosts.example.com value 172.16.132.10", {'operation': 'add', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
-        ("remove fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
-        ("remove record fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
-        ("remove name fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
-        ("remove entry fooHostOne", {'operation': 'remove', 'hostname': 'fooHostOne'}),
-        ("remove foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
-        ("remove record foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
-        ("remove name foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
-        ("remove entry foo.example.com", {'operation': 'remove', 'hostname': 'foo.example.com'}),
-        ("remove entry foo.bar.baz.example.com", {'operation': 'remove', 'hostname': 'foo.bar.baz.example.com'}),
-        ("rename fooHostOne with target targ to fooHostTwo", {'operation': 'rename', 'hostname': 'fooHostOne', 'newname': 'fooHostTwo', 'value': 'targ'}),
-        ("rename entry foobar foo.bar.net to baz", {'operation': 'rename', 'hostname': 'foobar', 'newname': 'baz', 'value': 'foo.bar.net'}),
-        ("rename record foobar.example.com with address 1.2.3.4 to blam", {'operation': 'rename', 'hostname': 'foobar.example.com', 'newname': 'blam', 'value': '1.2.3.4'}),
-        ("rename name foobar 1.2.3.5 to baz.example.com", {'operation': 'rename', 'hostname': 'foobar', 'newname': 'baz.example.com', 'value': '1.2.3.5'}),
-        ("rename foobar.example.com value 1.2.3.4 to baz.blam.hosts.example.com", {'operation': 'rename', 'hostname': 'foobar.example.com', 'newname': 'baz.blam.hosts.example.com', 'value': '1.2.3.4'}),
-        ("rename foobar.hosts.example.com with value baz to blam", {'operation': 'rename', 'hostname': 'foobar.hosts.example.com', 'newname': 'blam', 'value': 'baz'}),
-        ("rename foo.subdomain.example.com with value 10.188.8.76 to bar.subdomain.example.com", {'operation': 'rename', 'hostname': 'foo.subdomain.example.com', 'newname': 'bar.subdomain.example.com', 'value': '10.188.8.76'}),
-        ("change fooHostOne to fooHostTwo", {'operation': 'change', 'hostname': 'fooHostOne', 'value': 'fooHostTwo'}),
-        ("change foobar to 10.104.92.243", {'operation': 'change', 'hostname': 'foobar', 'value': '10.104.92.243'}),
-        ("change entry foobar to baz", {'operation': 'change', 'hostname': 'foobar', 'value': 'baz'}),
-        ("change record foobar.example.com to blam", {'operation': 'change', 'hostname': 'foobar.example.com', 'value': 'blam'}),
-        ("change name foobar to 192.168.0.139", {'operation': 'change', 'hostname': 'foobar', 'value': '192.168.0.139'}),
-        ("change foobar.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.example.com', 'value': '172.16.132.10'}),
-        ("change foobar.hosts.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
-        ("change entry foobar.hosts.example.com to 172.16.132.10", {'operation': 'change', 'hostname': 'foobar.hosts.example.com', 'value': '172.16.132.10'}),
-        ("change name foobar to foobar.hosts.example.com", {'operation': 'change', 'hostname': 'foobar', 'value': 'foobar.hosts.example.com'}),
-        ("change name foobar to foobar.example.com", {'operation': 'change', 'hostname': 'foobar', 'value': 'foobar.example.com'}),
-        ("confirm foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
-        ("confirm record foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
-        ("confirm entry foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
-        ("confirm name foo.example.com", {'operation': 'confirm', 'hostname': 'foo.example.com'}),
-        ("confirm 1.2.3.4", None),
-        ("confirm record 1.2.3.4", None),
-        ("confirm entry 1.2.3.4", None),
-        ("confirm name 1.2.3.4", None),
-        ("confirm foo", {'operation': 'confirm', 'hostname': 'foo'}),
-        ("confirm record foo", {'operation': 'confirm', 'hostname': 'foo'}),
-        ("confirm entry foo", {'operation': 'confirm', 'hostname': 'foo'}),
-        ("confirm name foo", {'operation': 'confirm', 'hostname': 'foo'}),
-        ("confirm m.example.com", {'operation': 'confirm', 'hostname': 'm.example.com'}),
-        ("confirm foo.m.example.com", {'operation': 'confirm', 'hostname': 'foo.m.example.com'}),
-        ("confirm m", {'operation': 'confirm', 'hostname': 'm'}),
-        ("confirm m._foo.example.com", {'operation': 'confirm', 'hostname': 'm._foo.example.com'}),
-        ("confirm _bar.example.com", {'operation': 'confirm', 'hostname': '_bar.example.com'}),
-        ("add record _foobar.example.com address 1.2.3.4", {'operation': 'add', 'hostname': '_foobar.example.com', 'value': '1.2.3.4'}),
-        ("add record foobar._discover.example.com target blam", {'operation': 'add', 'hostname': 'foobar._discover.example.com', 'value': 'blam'})
-    ])
+    @pytest.mark.parametrize(("line", "parsed_dict"), PARSE_CASES)
     def test_parse_should_succeed(self, line, parsed_dict):
         foo = None
         try:
@@ -121,6 +125,64 @@ class TestLanguageParsing:
             pass
         assert foo == parsed_dict
 
+    @pytest.mark.parametrize(("line", "parsed_dict"), PARSE_CASES)
+    def test_parse_pyparsing(self, line, parsed_dict):
+        foo = None
+        try:
+            p = DnstestParser()
+            foo = p.parse_line_pyparsing(line)
+        except ParseException:
+            pass
+        assert foo == parsed_dict
+
+    @pytest.mark.parametrize("line", [
+        "confirm 1.2.3.256",
+        "confirm record",
+        "rename foo with bar to baz",
+        "rename foo with to bar",
+        "rename foo value to to bar",
+        "add record record value x",
+        "add foo_ value x",
+        "add foo with with value x",
+        "add foo valuex bar",
+        "remove 1.2.3.4x",
+        "remove name name",
+        "change to to to",
+        "  confirm \t foo  ",
+        "confirm " + "a" * 64,
+        "confirm -foo",
+        "confirm foo$",
+        "confirm a..b",
+        "addfoo bar",
+        "ADD foo value bar",
+        "",
+    ])
+    def test_parse_same_as_pyparsing(self, line):
+        p = DnstestParser()
+        results = []
+        for parse in (p.parse_line, p.parse_line_pyparsing):
+            try:
+                results.append(parse(line))
+            except ParseException:
+                results.append(None)
+        assert results[0] == results[1]
+
+    def test_parse_same_as_pyparsing_random(self):
+        words = ['add', 'remove', 'rename', 'change', 'confirm', 'record', 'entry', 'name', 'with', 'value',
+                 'address', 'target', 'to', 'foo', 'foo.example.com', '1.2.3.4', '10.0.0.256', '_x.y', 'x_',
+                 '$a', 'foo.', '1.2.3.4.5', 'a' * 64, 'with9']
+        r = random.Random(1)
+        p = DnstestParser()
+        for i in range(2000):
+            line = ' '.join([r.choice(words[:5])] + [r.choice(words) for j in range(r.randint(1, 6))])
+            results = []
+            for parse in (p.parse_line, p.parse_line_pyparsing):
+                try:
+                    results.append(parse(line))
+                except ParseException:
+                    results.append(None)
+            assert results[0] == results[1], line
+
     @pytest.mark.parametrize("line", [
         "add extraword record foobar.example.com target blam",
         "add foobar value blam extraword",
@@ -135,6 +197,13 @@ class TestLanguageParsing:
         with pytest.raises(ParseException):
             p = DnstestParser()
             p.parse_line(line)
+        with pytest.raises(ParseException):
+            p.parse_line_pyparsing(line)
+
+    def test_grammar_cached(self):
+        assert _grammar() is _grammar()
+        commands, line_parser = _grammar()
+        assert sorted(commands) == ['add', 'change', 'confirm', 'remove', 'rename']
 
     def test_get_grammar(self):
         p = DnstestParser()
@@ -146,3 +215,63 @@ class TestLanguageParsing:
                     ]
         result = p.get_grammar()
         assert result == expected
+
+
+class TestChangeRecord:
+
+    @pytest.mark.parametrize(("line", "parsed_dict"), PARSE_CASES)
+    def test_parse_record(self, line, parsed_dict):
+        p = DnstestParser()
+        if parsed_dict is None:
+            with pytest.raises(ParseException):
+                p.parse_record(line)
+            return
+        r = p.parse_record(line)
+        assert r.operation == parsed_dict['operation']
+        assert r.to_dict() == parsed_dict
+        assert ChangeRecord.from_dict(parsed_dict) == r
+
+    @pytest.mark.parametrize("line", [
+        "add extraword record foobar.example.com target blam",
+        "foo bar baz",
+        "",
+    ])
+    def test_parse_record_exception(self, line):
+        p = DnstestParser()
+        with pytest.raises(ParseException):
+            p.parse_record(line)
+
+    def test_fields(self):
+        p = DnstestParser()
+        assert p.parse_record("rename foo value 1.2.3.4 to bar") == (RENAME, 'foo', '1.2.3.4', 'bar')
+        assert p.parse_record("confirm foo") == (CONFIRM, 'foo', None, None)
+        r = p.parse_record("add foo value bar")
+        assert (r.op, r.hostname, r.value, r.newname) == (ADD, 'foo', 'bar', None)
+
+    def test_parse_fields(self):
+        p = DnstestParser()
+        f = p.parse_fields("rename foo value 1.2.3.4 to bar")
+        assert type(f) is tuple
+        assert f == (RENAME, 'foo', '1.2.3.4', 'bar')
+        with pytest.raises(ParseException):
+            p.parse_fields("foo bar baz")
+
+    def test_interned(self):
+        p = DnstestParser()
+        a = p.parse_record("add " + "foo.example.com" + " value bar")
+        b = p.parse_record("change " + "foo.example.com" + " to bar")
+        assert a.hostname is b.hostname
+        assert a.value is b.value
+
+    def test_slots(self):
+        r = ChangeRecord(ADD, 'foo', 'bar')
+        # no instance dict to add attributes to (python 2's namedtuple has
+        # a __dict__ property, so hasattr() can't tell)
+        with pytest.raises(AttributeError):
+            r.foo = 'bar'
+        with pytest.raises(AttributeError):
+            r.hostname = 'baz'
+
+    def test_from_dict_unknown(self):
+        with pytest.raises(KeyError):
+            ChangeRecord.from_dict({'operation': 'foo', 'hostname': 'bar'})
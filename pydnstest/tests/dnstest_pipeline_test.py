@@ -0,0 +1,265 @@
+"""
+tests for pydnstest.pipeline
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import io
+import random
+import sys
+from multiprocessing.pool import ThreadPool
+
+import pytest
+from pyparsing import ParseException
+
+from pydnstest.parser import DnstestParser, ChangeRecord
+from pydnstest.pipeline import (read_lines, imap_bounded, format_result, TextSink, consume, chunk_ranges,
+                                parse_file, ChunkedParser, LineError)
+from pydnstest.timings import Timings
+from pydnstest.trace import current_line, set_line
+
+OK = {'result': True, 'message': 'foo', 'secondary': ['bar'], 'warnings': ['baz']}
+NG = {'result': False, 'message': 'blam', 'secondary': [], 'warnings': []}
+
+
+class Output:
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, s):
+        self.written.append(s)
+
+
+class TestPipeline:
+
+    def test_read_lines(self):
+        src = ["  confirm foo\n", "\n", "# comment\n", "\tremove bar  \n", "   \n"]
+        assert list(read_lines(src)) == ["confirm foo", "remove bar"]
+
+    def test_read_lines_trace(self):
+        set_line(None)
+        src = ["confirm foo\n", "# comment\n", "", "remove bar\n"]
+        seen = [(line, current_line()) for line in read_lines(src, trace=True)]
+        assert seen == [("confirm foo", 1), ("remove bar", 4)]
+
+    def test_read_lines_lazy(self):
+        read = []
+
+        def src():
+            for i in range(1000):
+                read.append(i)
+                yield "confirm foo%d" % i
+
+        lines = read_lines(src())
+        assert next(lines) == "confirm foo0"
+        assert read == [0]
+
+    def test_imap_bounded(self):
+        read = []
+
+        def items():
+            for i in range(100):
+                read.append(i)
+                yield i
+
+        pool = ThreadPool(4)
+        try:
+            res = imap_bounded(pool, lambda x: x * 2, items(), 8)
+            assert [next(res) for i in range(5)] == [0, 2, 4, 6, 8]
+            # only read as far as the window past the last result
+            assert len(read) <= 5 + 8
+            assert list(res) == [i * 2 for i in range(5, 100)]
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def test_imap_bounded_exception(self):
+        def f(x):
+            if x == 3:
+                raise ValueError("foo")
+            return x
+
+        pool = ThreadPool(2)
+        try:
+            res = imap_bounded(pool, f, range(10), 4)
+            assert [next(res) for i in range(3)] == [0, 1, 2]
+            with pytest.raises(ValueError):
+                next(res)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def test_format_result(self):
+        assert format_result(OK) == ["OK: foo", "\tbar", "\tbaz"]
+        assert format_result(NG) == ["**NG: blam"]
+
+    def test_text_sink(self):
+        out = Output()
+        sink = TextSink(out)
+        sink(OK)
+        sink(LineError("ERROR: unknown input operation"))
+        sink(NG)
+        assert ''.join(out.written) == "OK: foo\n\tbar\n\tbaz\nERROR: unknown input operation\n**NG: blam\n"
+
+    def test_text_sink_stdout(self, capsys):
+        TextSink()(NG)
+        out, err = capsys.readouterr()
+        assert out == "**NG: blam\n"
+
+    def test_consume(self):
+        seen = []
+        err = LineError("ERROR: unknown input operation")
+        assert consume([OK, False, NG, err, OK], seen.append) == (2, 1)
+        assert seen == [OK, NG, err, OK]
+
+    def test_consume_timings(self):
+        t = Timings()
+        consume([OK, False, NG], lambda res: None, timings=t)
+        assert t.to_dict()['phases']['format']['lines'] == 2
+
+
+class TestChunkedParsing:
+
+    @pytest.fixture(autouse=True)
+    def stdin(self, monkeypatch):
+        # worker processes close sys.stdin as they start, which fails if
+        # another test has left it as a list of lines
+        monkeypatch.setattr(sys, 'stdin', io.StringIO())
+
+    @pytest.fixture
+    def testfile(self, tmpdir):
+        r = random.Random(1)
+        lines = []
+        for i in range(500):
+            lines.append(r.choice([
+                "add foo%d.example.com value 10.0.%d.%d" % (i, i // 256, i % 256),
+                "rename foo%d with value 1.2.3.4 to bar%d" % (i, i),
+                "  confirm   foo%d  " % i,
+                "remove foo%d bar" % i,
+                "# comment %d" % i,
+                "",
+            ]))
+        path = str(tmpdir.join('testfile.txt'))
+        with open(path, 'w') as fh:
+            fh.write("\n".join(lines))
+        return path
+
+    def serial(self, path):
+        p = DnstestParser()
+        res = []
+        with open(path) as fh:
+            for n, line in enumerate(fh, 1):
+                line = line.strip()
+                if line and line[:1] != "#":
+                    try:
+                        res.append((n, line, p.parse_record(line)))
+                    except ParseException as e:
+                        res.append((n, line, (e.loc, e.msg)))
+        return res
+
+    def test_chunk_ranges(self, testfile):
+        with open(testfile, 'rb') as fh:
+            data = fh.read()
+        ranges = chunk_ranges(testfile, 100)
+        assert len(ranges) > 10
+        assert ranges[0][0] == 0
+        assert ranges[-1][1] == len(data)
+        for (s1, e1), (s2, e2) in zip(ranges, ranges[1:]):
+            assert e1 == s2
+            assert data[e1 - 1:e1] == b"\n"
+            assert e1 - s1 >= 100
+
+    def test_chunk_ranges_empty(self, tmpdir):
+        path = str(tmpdir.join('empty'))
+        open(path, 'w').close()
+        assert chunk_ranges(path) == []
+
+    @pytest.mark.parametrize("chunk_size", [1, 100, 1024 * 1024])
+    def test_parse_file(self, testfile, chunk_size):
+        res = []
+        for n, line, r in parse_file(testfile, processes=2, chunk_size=chunk_size):
+            if isinstance(r, ParseException):
+                assert r.line == line
+                r = (r.loc, r.msg)
+            else:
+                assert isinstance(r, ChangeRecord)
+            res.append((n, line, r))
+        assert res == self.serial(testfile)
+
+    def test_chunked_parser(self, testfile):
+        p = ChunkedParser(testfile, processes=2, chunk_size=100)
+        expected = self.serial(testfile)
+        got = []
+        for line in p:
+            try:
+                got.append(p.parse_line(line))
+            except ParseException as e:
+                got.append((e.loc, e.msg))
+        assert got == [r.to_dict() if isinstance(r, ChangeRecord) else r for n, line, r in expected]
+
+    def test_chunked_parser_record(self, testfile):
+        p = ChunkedParser(testfile, processes=2, chunk_size=100)
+        expected = self.serial(testfile)
+        got = []
+        for line in p:
+            try:
+                got.append(p.parse_record(line))
+            except ParseException as e:
+                got.append((e.loc, e.msg))
+        assert got == [r for n, line, r in expected]
+
+    def test_chunked_parser_skipped(self, testfile):
+        p = ChunkedParser(testfile, processes=1)
+        lines = iter(p)
+        first = next(lines)
+        second = next(lines)
+        assert [first, second] == [line for n, line, r in self.serial(testfile)[:2]]
+        # the first line was never parsed
+        assert p.parse_line(second) == DnstestParser().parse_line(second)
+        assert p.parse_line("confirm other") == {'operation': 'confirm', 'hostname': 'other'}
+
+    def test_chunked_parser_trace(self, testfile):
+        set_line(None)
+        p = ChunkedParser(testfile, processes=2, chunk_size=100, trace=True)
+        assert [(line, current_line()) for line in p] == [(line, n) for n, line, r in self.serial(testfile)]
@@ -0,0 +1,89 @@
+"""
+tests for ratelimit.py / TokenBucket and RateLimiter
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import pytest
+
+import pydnstest.ratelimit
+from pydnstest.ratelimit import TokenBucket, RateLimiter
+
+
+class TestRateLimit:
+
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(pydnstest.ratelimit.time, 'time', lambda: now[0])
+        return now
+
+    def test_bucket(self, clock):
+        b = TokenBucket(10, burst=2)
+        assert b.reserve() == 0.0
+        assert b.reserve() == 0.0
+        # empty; later callers are given successive slots
+        assert b.reserve() == pytest.approx(0.1)
+        assert b.reserve() == pytest.approx(0.2)
+        clock[0] += 0.2
+        assert b.reserve() == pytest.approx(0.1)
+        # refills only up to burst
+        clock[0] += 10
+        assert b.reserve(2) == 0.0
+        assert b.reserve() == pytest.approx(0.1)
+
+    def test_limiter_per_server(self, clock):
+        r = RateLimiter(4)
+        assert r.delay('1.2.3.4') == 0.0
+        assert r.delay('1.2.3.4') == pytest.approx(0.25)
+        assert r.delay('1.2.3.5') == 0.0
+        assert r.delay('1.2.3.4', 5353) == 0.0
+        assert r.delay('1.2.3.5', n=2) == pytest.approx(0.5)
+
+    def test_wait(self, clock, monkeypatch):
+        slept = []
+        monkeypatch.setattr(pydnstest.ratelimit.time, 'sleep', slept.append)
+        r = RateLimiter(2)
+        r.wait('1.2.3.4')
+        r.wait('1.2.3.4')
+        assert slept == [pytest.approx(0.5)]
@@ -0,0 +1,84 @@
+"""
+tests for rtt.py / RTTEstimator
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import pytest
+
+from pydnstest.rtt import RTTEstimator
+
+
+class TestRTTEstimator:
+
+    def test_initial(self):
+        r = RTTEstimator(initial_rto=1.0, max_rto=30)
+        assert r.rto('1.2.3.4') == 1.0
+        assert r.srtt('1.2.3.4') is None
+
+    def test_sample(self):
+        r = RTTEstimator(min_rto=0.01, max_rto=30)
+        r.sample('1.2.3.4', 53, 0.1)
+        assert r.srtt('1.2.3.4') == pytest.approx(0.1)
+        # srtt + 4 * (rtt / 2)
+        assert r.rto('1.2.3.4') == pytest.approx(0.3)
+        r.sample('1.2.3.4', 53, 0.1)
+        # rttvar = 0.75 * 0.05
+        assert r.rto('1.2.3.4') == pytest.approx(0.1 + 4 * 0.0375)
+        r.sample('1.2.3.4', 53, 0.5)
+        assert r.srtt('1.2.3.4') == pytest.approx(0.15)
+        # other servers and ports are tracked separately
+        assert r.rto('1.2.3.4', 5353) == r.initial_rto
+        assert r.rto('1.2.3.5') == r.initial_rto
+
+    def test_bounds(self):
+        r = RTTEstimator(min_rto=0.05, max_rto=2)
+        r.sample('fast', 53, 0.001)
+        assert r.rto('fast') == 0.05
+        r.sample('slow', 53, 10)
+        assert r.rto('slow') == 2
+
+    def test_backoff(self):
+        r = RTTEstimator(max_rto=3)
+        assert r.backoff(1) == 2
+        assert r.backoff(2) == 3
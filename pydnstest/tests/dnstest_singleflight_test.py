@@ -0,0 +1,124 @@
+"""
+tests for singleflight.py / SingleFlight
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import threading
+import time
+
+from pydnstest.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+
+    def run_threads(self, count, target):
+        threads = [threading.Thread(target=target) for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def test_do(self):
+        sf = SingleFlight()
+        assert sf.do('a', lambda x: x * 2, 3) == 6
+        assert sf.do('a', lambda x: x * 3, 3) == 9
+        assert sf.coalesced == 0
+
+    def test_coalesce(self):
+        sf = SingleFlight()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return object()
+
+        self.run_threads(10, lambda: results.append(sf.do('a', slow)))
+        assert len(calls) == 1
+        assert len(results) == 10
+        assert all(r is results[0] for r in results)
+        assert sf.coalesced == 9
+        assert sf._calls == {}
+
+    def test_coalesce_exception(self):
+        sf = SingleFlight()
+        calls = []
+        errors = []
+
+        def fail():
+            calls.append(1)
+            time.sleep(0.2)
+            raise ValueError('foo')
+
+        def target():
+            try:
+                sf.do('a', fail)
+            except ValueError as ex:
+                errors.append(ex)
+
+        self.run_threads(5, target)
+        assert len(calls) == 1
+        assert len(errors) == 5
+        assert sf._calls == {}
+
+    def test_do_many(self):
+        sf = SingleFlight()
+        calls = []
+        results = []
+
+        def slow(keys):
+            calls.append(keys)
+            time.sleep(0.2)
+            return [k.upper() for k in keys]
+
+        t = threading.Thread(target=lambda: results.append(sf.do_many(['a'], slow)))
+        t.start()
+        time.sleep(0.05)
+        # 'a' is already in flight, so only 'b' is sent
+        assert sf.do_many(['a', 'b'], slow) == ['A', 'B']
+        t.join()
+        assert results == [['A']]
+        assert calls == [['a'], ['b']]
+        assert sf.coalesced == 1
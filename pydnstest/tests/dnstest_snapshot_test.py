@@ -0,0 +1,279 @@
+"""
+tests for snapshot.py / ZoneSnapshot and SnapshotSet
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+
+import pytest
+
+import DNS
+
+from pydnstest.dns import DNStestDNS
+from pydnstest.snapshot import ZoneSnapshot, SnapshotSet, ptr_address
+from pydnstest.transport import zone_transfer, IXFR
+
+
+def rr(name, typename, data, ttl=360):
+    return {'name': name, 'typename': typename, 'data': data, 'ttl': ttl}
+
+
+def soa(zone, serial=1):
+    return rr(zone, 'SOA', ('ns1.' + zone, 'hostmaster.' + zone, ('serial', serial), ('refresh ', 3600, '1 hours'),
+                            ('retry', 600, '10 minutes'), ('expire', 86400, '1 days'), ('minimum', 60, '1 minutes')))
+
+
+def example_zone(serial=1):
+    return [soa('example.com', serial),
+            rr('foo.example.com', 'A', '1.2.3.4'),
+            rr('foo.example.com', 'A', '1.2.3.6'),
+            rr('Bar.example.com', 'CNAME', 'foo.example.com'),
+            rr('mx.example.com', 'MX', (10, 'foo.example.com')),
+            soa('example.com', serial)]
+
+
+def reverse_zone():
+    return [soa('3.2.1.in-addr.arpa'),
+            rr('4.3.2.1.in-addr.arpa', 'PTR', 'foo.example.com'),
+            rr('5.3.2.1.in-addr.arpa', 'TXT', ['foo']),
+            soa('3.2.1.in-addr.arpa')]
+
+
+class TestSnapshot:
+
+    def test_ptr_address(self):
+        assert ptr_address('4.3.2.1.in-addr.arpa.') == '1.2.3.4'
+        assert ptr_address('3.2.1.in-addr.arpa') is None
+        assert ptr_address('foo.example.com') is None
+
+    def test_zone_snapshot(self):
+        z = ZoneSnapshot('Example.com.', example_zone(serial=5))
+        assert z.zone == 'example.com'
+        assert z.serial == 5
+        assert len(z) == 5
+        assert sorted(z.names.keys()) == ['bar.example.com', 'example.com', 'foo.example.com', 'mx.example.com']
+        assert [r['data'] for r in z.names['foo.example.com']['A']] == ['1.2.3.4', '1.2.3.6']
+        assert z.covers('foo.example.com')
+        assert z.covers('EXAMPLE.com.')
+        assert not z.covers('fooexample.com')
+        assert not z.covers('example.org')
+
+    def test_resolve_name(self):
+        s = SnapshotSet()
+        s.add('test', ZoneSnapshot('example.com', example_zone()))
+        assert s.resolve_name('foo.example.com', 'test')['answer']['data'] == '1.2.3.4'
+        assert s.resolve_name('bar.EXAMPLE.com', 'test')['answer']['data'] == 'foo.example.com'
+        assert s.resolve_name('mx.example.com', 'test') == {'status': 'NOERROR'}
+        assert s.resolve_name('nx.example.com', 'test') == {'status': 'NXDOMAIN'}
+        # other zones, servers and ports aren't covered
+        assert s.resolve_name('foo.example.org', 'test') is None
+        assert s.resolve_name('foo.example.com', 'prod') is None
+        assert s.resolve_name('foo.example.com', 'test', 5353) is None
+
+    def test_lookup_reverse(self):
+        s = SnapshotSet()
+        s.add('test', ZoneSnapshot('3.2.1.in-addr.arpa', reverse_zone()))
+        assert s.lookup_reverse('1.2.3.4', 'test')['answer']['data'] == 'foo.example.com'
+        assert s.lookup_reverse('1.2.3.5', 'test') == {'status': 'NOERROR'}
+        assert s.lookup_reverse('1.2.3.7', 'test') == {'status': 'NXDOMAIN'}
+        assert s.lookup_reverse('1.2.4.4', 'test') is None
+
+    def test_wildcards_and_empty_non_terminals(self):
+        records = example_zone()
+        records[-1:-1] = [rr('*.example.com', 'A', '1.2.3.8'),
+                          rr('a.b.c.example.com', 'A', '1.2.3.9'),
+                          rr('*.d.example.com', 'CNAME', 'foo.example.com')]
+        z = ZoneSnapshot('example.com', records)
+        assert z.lookup('b.c.example.com') == {}
+        assert z.lookup('c.example.com') == {}
+        assert z.lookup('x.example.com')['A'] == [rr('x.example.com', 'A', '1.2.3.8')]
+        assert z.lookup('x.y.example.com.')['A'] == [rr('x.y.example.com', 'A', '1.2.3.8')]
+        assert z.lookup('X.d.example.com')['CNAME'][0]['name'] == 'X.d.example.com'
+        # the closest encloser exists but has no wildcard
+        assert z.lookup('x.c.example.com') is None
+        assert z.lookup('x.foo.example.com') is None
+        assert z.lookup('*.example.com')['A'][0]['name'] == '*.example.com'
+        s = SnapshotSet()
+        s.add('test', z)
+        assert s.resolve_name('b.c.example.com', 'test') == {'status': 'NOERROR'}
+        assert s.resolve_name('new.example.com', 'test')['answer']['data'] == '1.2.3.8'
+        assert s.resolve_name('new.d.example.com', 'test')['answer']['data'] == 'foo.example.com'
+        assert s.resolve_name('new.c.example.com', 'test') == {'status': 'NXDOMAIN'}
+        # names added or removed make their ancestors (non-)empty non-terminals
+        z.remove(rr('a.b.c.example.com', 'A', '1.2.3.9'))
+        assert z.lookup('b.c.example.com')['A'][0]['data'] == '1.2.3.8'
+
+    def test_wildcard_reverse(self):
+        records = reverse_zone()
+        records[-1:-1] = [rr('*.3.2.1.in-addr.arpa', 'PTR', 'any.example.com')]
+        s = SnapshotSet()
+        s.add('test', ZoneSnapshot('3.2.1.in-addr.arpa', records))
+        assert s.lookup_reverse('1.2.3.4', 'test')['answer']['data'] == 'foo.example.com'
+        assert s.lookup_reverse('1.2.3.5', 'test') == {'status': 'NOERROR'}
+        assert s.lookup_reverse('1.2.3.9', 'test')['answer'] == rr('9.3.2.1.in-addr.arpa', 'PTR', 'any.example.com')
+
+    def test_subzone(self):
+        s = SnapshotSet()
+        s.add('test', ZoneSnapshot('example.com', example_zone()))
+        sub = [soa('sub.example.com'), rr('foo.sub.example.com', 'A', '1.2.3.9'), soa('sub.example.com')]
+        s.add('test', ZoneSnapshot('sub.example.com', sub))
+        assert s.find('foo.sub.example.com', 'test').zone == 'sub.example.com'
+        assert s.resolve_name('foo.sub.example.com', 'test')['answer']['data'] == '1.2.3.9'
+        # replacing a zone
+        s.add('test', ZoneSnapshot('example.com', example_zone(serial=2)))
+        assert [z.serial for z in s.servers[('test', 53)]] == [1, 2]
+
+    def test_zone_transfer(self, dns_server):
+        records = zone_transfer('example.com', '127.0.0.1', port=dns_server.port, timeout=2)
+        assert [r['typename'] for r in records] == ['SOA', 'CNAME', 'A', 'A', 'A', 'SOA']
+        assert records[0]['data'][2] == ('serial', 2017010101)
+        with pytest.raises(DNS.DNSError) as excinfo:
+            zone_transfer('example.org', '127.0.0.1', port=dns_server.port, timeout=2)
+        assert 'REFUSED' in str(excinfo.value)
+
+    def test_dns_from_snapshot(self, dns_server):
+        snaps = SnapshotSet()
+        snaps.load('example.com', '127.0.0.1', port=dns_server.port, timeout=2)
+        snaps.load('1.in-addr.arpa', '127.0.0.1', port=dns_server.port, timeout=2)
+        d = DNStestDNS(snapshots=snaps)
+        # the answers are the same as from the server, with no queries
+        assert d.resolve_name('bar.example.com', '127.0.0.1', dns_server.port) == \
+            DNStestDNS().resolve_name('bar.example.com', '127.0.0.1', dns_server.port)
+        # (but for rdlength: the PTR's target was compressed in the transfer)
+        a = d.lookup_reverse('1.2.3.4', '127.0.0.1', dns_server.port)['answer']
+        b = DNStestDNS().lookup_reverse('1.2.3.4', '127.0.0.1', dns_server.port)['answer']
+        assert a.pop('rdlength') < b.pop('rdlength')
+        assert a == b
+        n = len(dns_server.udp_log)
+        assert d.resolve_name('nx.example.com', '127.0.0.1', dns_server.port) == {'status': 'NXDOMAIN'}
+        assert len(dns_server.udp_log) == n
+        # names outside of the snapshots still go to the server
+        assert d.resolve_name('foo.example.org', '127.0.0.1', dns_server.port) == {'status': 'REFUSED'}
+        assert dns_server.udp_log[n:] == [('foo.example.org', 'A'), ('foo.example.org', 'CNAME')]
+
+    def test_apply_transfer(self):
+        z = ZoneSnapshot('example.com', example_zone(serial=1))
+        # already up to date
+        assert z.apply_transfer([soa('example.com', 1)]) == set()
+        assert z.serial == 1
+        # incremental: two blocks of (old SOA, deletions, new SOA, additions)
+        changed = z.apply_transfer([soa('example.com', 3),
+                                    soa('example.com', 1),
+                                    rr('foo.example.com', 'A', '1.2.3.6'),
+                                    soa('example.com', 2),
+                                    rr('baz.example.com', 'A', '1.2.3.7'),
+                                    soa('example.com', 2),
+                                    rr('bar.example.com', 'CNAME', 'foo.example.com'),
+                                    soa('example.com', 3),
+                                    soa('example.com', 3)])
+        assert changed == set(['foo.example.com', 'baz.example.com', 'bar.example.com'])
+        assert z.serial == 3
+        assert z.names['example.com']['SOA'][0]['data'][2] == ('serial', 3)
+        assert [r['data'] for r in z.names['foo.example.com']['A']] == ['1.2.3.4']
+        assert 'bar.example.com' not in z.names
+        assert z.names['baz.example.com']['A'][0]['data'] == '1.2.3.7'
+
+    def test_apply_transfer_affected(self):
+        z = ZoneSnapshot('example.com', example_zone(serial=1))
+        changed = z.apply_transfer([soa('example.com', 2),
+                                    soa('example.com', 1),
+                                    soa('example.com', 2),
+                                    rr('a.b.example.com', 'A', '1.2.3.7'),
+                                    soa('example.com', 2)])
+        assert changed == set(['a.b.example.com', 'b.example.com'])
+        # any change to a zone with wildcards may change any answer
+        changed = z.apply_transfer([soa('example.com', 3),
+                                    soa('example.com', 2),
+                                    soa('example.com', 3),
+                                    rr('*.example.com', 'A', '1.2.3.8'),
+                                    soa('example.com', 3)])
+        assert changed is None
+        changed = z.apply_transfer([soa('example.com', 4),
+                                    soa('example.com', 3),
+                                    rr('*.example.com', 'A', '1.2.3.8'),
+                                    soa('example.com', 4),
+                                    soa('example.com', 4)])
+        assert changed is None
+        assert z.apply_transfer([soa('example.com', 4)]) == set()
+
+    def test_apply_transfer_full(self):
+        z = ZoneSnapshot('example.com', example_zone(serial=1))
+        records = example_zone(serial=2)
+        records[1] = rr('foo.example.com', 'A', '1.2.3.5')
+        del records[3]
+        assert z.apply_transfer(records) == set(['foo.example.com', 'bar.example.com'])
+        assert z.serial == 2
+        assert [r['data'] for r in z.names['foo.example.com']['A']] == ['1.2.3.5', '1.2.3.6']
+
+    def test_to_dict(self):
+        z = ZoneSnapshot('example.com', example_zone(serial=4))
+        z.add(rr('4.3.2.1.in-addr.arpa', 'PTR', 'foo.example.com'))
+        z2 = ZoneSnapshot.from_dict(json.loads(json.dumps(z.to_dict())))
+        assert z2.zone == 'example.com'
+        assert z2.serial == 4
+        assert z2.soa == z.soa
+        assert len(z2) == len(z)
+        assert z2.names['foo.example.com'] == z.names['foo.example.com']
+        assert z2.ptrs == z.ptrs
+        # data of other types is only kept as a string
+        assert z2.names['mx.example.com']['MX'][0]['data'] == "(10, 'foo.example.com')"
+
+    def test_refresh(self, dns_server):
+        snaps = SnapshotSet()
+        z = snaps.load('example.com', '127.0.0.1', port=dns_server.port, timeout=2)
+        assert snaps.refresh(z, '127.0.0.1', port=dns_server.port, timeout=2) == set()
+        dns_server.update('foo.example.com', 'A', '9.8.7.6')
+        dns_server.update('bar.example.com', 'CNAME')
+        assert snaps.refresh(z, '127.0.0.1', port=dns_server.port, timeout=2) == \
+            set(['foo.example.com', 'bar.example.com'])
+        assert z.serial == 2017010103
+        assert dns_server.tcp_log[-1] == ('example.com', str(IXFR))
+        assert snaps.resolve_name('foo.example.com', '127.0.0.1', dns_server.port)['answer']['data'] == '9.8.7.6'
+        assert snaps.resolve_name('bar.example.com', '127.0.0.1', dns_server.port) == {'status': 'NXDOMAIN'}
+        # a server that no longer has the changes sends the whole zone
+        old = ZoneSnapshot('example.com', zone_transfer('example.com', '127.0.0.1', port=dns_server.port, timeout=2))
+        dns_server.changes = {}
+        dns_server.update('new.example.com', 'A', '9.8.7.5')
+        assert snaps.refresh(old, '127.0.0.1', port=dns_server.port, timeout=2) == set(['new.example.com'])
+        assert old.serial == 2017010104
@@ -45,7 +45,7 @@ import os
 from pydnstest.checks import DNStestChecks
 from pydnstest.config import DnstestConfig
 import pydnstest.main
-from pydnstest.parser import DnstestParser
+from pydnstest.parser import DnstestParser, ChangeRecord
 
 """
 This dict stores the DNS results that our DNS-mocking functions will return.
@@ -314,7 +314,7 @@ class TestDNSTest:
 
         parser = DnstestParser()
         # mock the parser function to just return None
-        parser.parse_line = self.parser_return_unknown_op
+        parser.parse_record = self.parser_return_unknown_op
         pydnstest.parser = parser
 
         chk = DNStestChecks(config)
@@ -328,7 +328,7 @@ class TestDNSTest:
         """
         Returns unknown operation
         """
-        return {'operation': 'unknown'}
+        return ChangeRecord(99, 'unknown')
 
     def test_check_parser_false(self, setup_parser_return_unknown_op, capfd):
         """
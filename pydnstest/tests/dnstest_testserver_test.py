@@ -0,0 +1,190 @@
+"""
+tests for the stand-in DNS server - testserver.py
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import sys
+import time
+
+import pytest
+
+import DNS
+
+from pydnstest.dns import DNStestDNS
+from pydnstest.rtt import RTTEstimator
+from pydnstest.transport import UDPTransport, PooledTransport, zone_transfer
+from pydnstest.tests.dnstest_zonefile_test import REVERSE
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5), reason="stand-in server requires python 3.5+")
+SOA = 'ns1.example.com hostmaster.example.com 5 3600 600 86400 60'
+
+RECORDS = {'example.com': [('SOA', SOA), ('NS', 'ns1.example.com')],
+           'foo.example.com': [('A', '1.2.3.4')],
+           'bar.example.com': [('CNAME', 'foo.example.com')],
+           'mx.example.com': [('MX', '10 foo.example.com')],
+           'big.example.com': [('A', '10.0.0.%d' % i) for i in range(40)]}
+
+
+def server(request, **kwargs):
+    from pydnstest.testserver import StandInServer
+    s = StandInServer(RECORDS, **kwargs).start()
+    request.addfinalizer(s.stop)
+    return s
+
+
+class TestStandInServer:
+
+    def test_answers(self, request):
+        s = server(request)
+        d = DNStestDNS()
+        assert d.resolve_name('foo.example.com', '127.0.0.1', s.port) == {'answer': {
+            'name': 'foo.example.com', 'type': 1, 'class': 1, 'ttl': 300, 'rdlength': 4, 'typename': 'A',
+            'classstr': 'IN', 'data': '1.2.3.4'}}
+        # an A query for a CNAME gets the CNAME
+        assert d.resolve_name('bar.example.com', '127.0.0.1', s.port)['answer']['data'] == 'foo.example.com'
+        assert d.resolve_name('mx.example.com', '127.0.0.1', s.port) == {'status': 'NOERROR'}
+        assert d.resolve_name('nx.example.com', '127.0.0.1', s.port) == {'status': 'NXDOMAIN'}
+        assert d.resolve_name('foo.example.org', '127.0.0.1', s.port) == {'status': 'REFUSED'}
+        a = d.query('nx.example.com', '127.0.0.1', 'A', s.port)
+        assert a.authority[0]['typename'] == 'SOA'
+        assert a.authority[0]['data'][2] == ('serial', 5)
+        assert d.query('mx.example.com', '127.0.0.1', 'MX', s.port).answers[0]['data'] == (10, 'foo.example.com')
+        assert s.queries == 10
+
+    def test_zone_file(self, request, tmpdir):
+        from pydnstest.testserver import StandInServer
+        p = tmpdir.join('rev.zone')
+        p.write(REVERSE)
+        s = StandInServer(zone_files=[('3.2.1.in-addr.arpa', str(p))]).start()
+        request.addfinalizer(s.stop)
+        d = DNStestDNS()
+        assert d.lookup_reverse('1.2.3.4', '127.0.0.1', s.port)['answer']['data'] == 'foo.example.com'
+        assert d.lookup_reverse('1.2.3.5', '127.0.0.1', s.port) == {'status': 'NOERROR'}
+        assert d.lookup_reverse('1.2.3.6', '127.0.0.1', s.port) == {'status': 'NXDOMAIN'}
+
+    def test_truncation(self, request):
+        s = server(request)
+        # the transports retry truncated replies over TCP
+        a = UDPTransport(timeout=2).query('big.example.com', '127.0.0.1', 'A', s.port)
+        assert a.header['tc'] == 0
+        assert len(a.answers) == 40
+        a = PooledTransport(timeout=2).query('big.example.com', '127.0.0.1', 'A', s.port)
+        assert len(a.answers) == 40
+        assert s.truncated == 2
+
+    def test_axfr(self, request):
+        s = server(request)
+        records = zone_transfer('example.com', '127.0.0.1', port=s.port, timeout=2)
+        assert [r['typename'] for r in records] == ['SOA', 'CNAME'] + ['A'] * 40 + ['NS', 'A', 'MX', 'SOA']
+        with pytest.raises(DNS.DNSError):
+            zone_transfer('example.org', '127.0.0.1', port=s.port, timeout=2)
+
+    def test_latency(self, request):
+        s = server(request, latency=0.1)
+        start = time.time()
+        DNStestDNS().resolve_name('foo.example.com', '127.0.0.1', s.port)
+        assert time.time() - start >= 0.1
+
+    def test_loss(self, request):
+        s = server(request, loss=1.0)
+        with pytest.raises(DNS.TimeoutError):
+            UDPTransport(timeout=0.2).query('foo.example.com', '127.0.0.1', 'A', s.port)
+        assert s.dropped == 1
+
+    def test_loss_retransmit(self, request):
+        s = server(request, loss=0.5, seed=3)
+        d = DNStestDNS(rtt=RTTEstimator(retries=20, initial_rto=0.05))
+        for i in range(10):
+            assert d.query('foo.example.com', '127.0.0.1', 'A', s.port).answers[0]['data'] == '1.2.3.4'
+        assert s.dropped > 0
+        assert s.queries >= 10 + s.dropped
+
+    def test_add(self, request):
+        s = server(request)
+        d = DNStestDNS()
+        assert d.resolve_name('new.example.com', '127.0.0.1', s.port) == {'status': 'NXDOMAIN'}
+        s.add('new.example.com', 'A', '1.2.3.5')
+        assert d.resolve_name('new.example.com', '127.0.0.1', s.port)['answer']['data'] == '1.2.3.5'
+
+    def test_faults(self, request):
+        s = server(request, log_queries=True)
+        s.drop.add('foo.example.com')
+        s.lose['bar.example.com'] = 1
+        s.force_truncate.add('mx.example.com')
+        t = UDPTransport(timeout=0.2)
+        with pytest.raises(DNS.TimeoutError):
+            t.query('foo.example.com', '127.0.0.1', 'A', s.port)
+        with pytest.raises(DNS.TimeoutError):
+            t.query('bar.example.com', '127.0.0.1', 'A', s.port)
+        assert t.query('bar.example.com', '127.0.0.1', 'A', s.port).answers[0]['data'] == 'foo.example.com'
+        assert t.query('mx.example.com', '127.0.0.1', 'MX', s.port).answers
+        assert s.udp_log == [('foo.example.com', 'A'), ('bar.example.com', 'A'), ('bar.example.com', 'A'),
+                             ('mx.example.com', 'MX')]
+        assert s.tcp_log == [('mx.example.com', 'MX')]
+        assert s.truncated == 1
+        assert s.dropped == 2
+        assert s.connections == 1
+
+    def test_update_ixfr(self, request):
+        s = server(request)
+        old = zone_transfer('example.com', '127.0.0.1', port=s.port, timeout=2)[0]
+        s.update('foo.example.com', 'A', '1.2.3.9')
+        s.update('mx.example.com', 'MX')
+        d = DNStestDNS()
+        assert d.resolve_name('foo.example.com', '127.0.0.1', s.port)['answer']['data'] == '1.2.3.9'
+        assert d.resolve_name('mx.example.com', '127.0.0.1', s.port) == {'status': 'NXDOMAIN'}
+        records = zone_transfer('example.com', '127.0.0.1', port=s.port, timeout=2, soa=old)
+        assert [(r['typename'], r['name']) for r in records] == [
+            ('SOA', 'example.com'), ('SOA', 'example.com'), ('A', 'foo.example.com'), ('SOA', 'example.com'),
+            ('A', 'foo.example.com'), ('SOA', 'example.com'), ('MX', 'mx.example.com'), ('SOA', 'example.com'),
+            ('SOA', 'example.com')]
+        assert records[0]['data'][2] == ('serial', 7)
+        # already up to date
+        assert len(zone_transfer('example.com', '127.0.0.1', port=s.port, timeout=2, soa=records[0])) == 1
+        # without the changes since the client's serial, the whole zone is sent
+        s.changes = {}
+        records = zone_transfer('example.com', '127.0.0.1', port=s.port, timeout=2, soa=old)
+        assert [r['typename'] for r in records].count('A') == 41
+        with pytest.raises(ValueError):
+            s.update('foo.example.org', 'A', '1.2.3.4')
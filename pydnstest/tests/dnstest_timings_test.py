@@ -0,0 +1,138 @@
+"""
+tests for timings.py
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+
+import pytest
+from pyparsing import ParseException
+
+from pydnstest.checks import DNStestChecks
+from pydnstest.config import DnstestConfig
+from pydnstest.dns import DNStestDNS
+from pydnstest.parser import DnstestParser
+from pydnstest.timings import PHASES, Timings, TimedParser
+
+
+class TestTimings:
+
+    def test_add(self):
+        t = Timings()
+        t.add('parse', 0.5)
+        t.add('parse', 1.5)
+        d = t.to_dict()
+        assert d['phases']['parse'] == {'lines': 2, 'total': 2.0, 'max': 1.5, 'mean': 1.0}
+        assert d['phases']['format'] == {'lines': 0, 'total': 0.0, 'max': 0.0, 'mean': 0.0}
+        assert sorted(d['phases']) == sorted(PHASES)
+
+    def test_check(self):
+        t = Timings()
+
+        def check(res):
+            a, b = yield [('resolve_name', 'foo', 'test'), ('resolve_name', 'foo', 'prod')]
+            c, = yield [('lookup_reverse', '1.2.3.4', 'test')]
+            res.extend([a, b, c])
+
+        res = []
+        gen = t.check(check(res))
+        assert next(gen) == [('resolve_name', 'foo', 'test'), ('resolve_name', 'foo', 'prod')]
+        assert gen.send([1, 2]) == [('lookup_reverse', '1.2.3.4', 'test')]
+        with pytest.raises(StopIteration):
+            gen.send([3])
+        assert res == [1, 2, 3]
+        d = t.to_dict()
+        assert d['phases']['query']['lines'] == 1
+        assert d['phases']['evaluate']['lines'] == 1
+        assert d['servers'] == {'test': {'lookups': 2, 'queries': 0, 'query_seconds': 0.0},
+                                'prod': {'lookups': 1, 'queries': 0, 'query_seconds': 0.0}}
+
+    def test_checks(self):
+        config = DnstestConfig()
+        config.server_test = 'test'
+        config.server_prod = 'prod'
+        config.default_domain = '.example.com'
+        chk = DNStestChecks(config)
+        chk.DNS.timings = Timings()
+        chk.DNS.resolve_name = lambda name, server, port=53: {'answer': {'name': name, 'data': '1.2.3.4',
+                                                                         'typename': 'A'}}
+        assert chk.confirm_name('foo')['result'] is True
+        d = chk.DNS.timings.to_dict()
+        assert d['phases']['evaluate']['lines'] == 1
+        assert d['servers']['test']['lookups'] == 1
+        assert d['servers']['prod']['lookups'] == 1
+
+    @pytest.mark.parametrize('kwargs', [{}, {'parallel_lookups': True}])
+    def test_sent(self, dns_server, kwargs):
+        t = Timings()
+        d = DNStestDNS(timings=t, **kwargs)
+        d.resolve_name('nx.example.com', '127.0.0.1', dns_server.port)
+        d.close()
+        s = t.to_dict()['servers']['127.0.0.1']
+        assert s['queries'] == 2
+        assert s['query_seconds'] > 0
+        # lookups are counted by the checks, not the resolver
+        assert s['lookups'] == 0
+
+    def test_timed_parser(self):
+        t = Timings()
+        parser = TimedParser(DnstestParser(), t)
+        assert parser.parse_line('confirm foo.example.com')['operation'] == 'confirm'
+        assert parser.parse_record('confirm foo.example.com').operation == 'confirm'
+        with pytest.raises(ParseException):
+            parser.parse_record('foo bar baz')
+        assert t.to_dict()['phases']['parse']['lines'] == 3
+
+    def test_report_and_write(self, tmpdir):
+        t = Timings()
+        t.add('query', 0.25)
+        t.sent('1.2.3.4', 0.25, 2)
+        t.finish()
+        lines = t.report()
+        assert lines[0] == 'timings for %.3fs run:' % t.elapsed
+        assert lines[2] == '  query         0.250s total    250.000ms/line    250.000ms max  (1 lines)'
+        assert lines[-1] == '  server 1.2.3.4: 0 lookups, 2 queries sent (0.250s)'
+        path = str(tmpdir.join('timings.json'))
+        t.write(path)
+        assert json.load(open(path)) == t.to_dict()
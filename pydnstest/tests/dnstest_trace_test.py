@@ -0,0 +1,125 @@
+"""
+tests for trace.py
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+import threading
+
+import pytest
+import DNS
+
+from pydnstest.cache import QueryCache
+from pydnstest.cassette import Cassette
+from pydnstest.dns import DNStestDNS
+from pydnstest.trace import QueryTrace, current_line, set_line, HIT, MISS, REPLAY
+
+
+def read(trace):
+    trace.close()
+    return [json.loads(line) for line in open(trace.path)]
+
+
+class TestQueryTrace:
+
+    def test_line(self):
+        set_line(5)
+        assert current_line() == 5
+        seen = []
+        t = threading.Thread(target=lambda: seen.append(current_line()))
+        t.start()
+        t.join()
+        # each thread has its own line
+        assert seen == [None]
+        set_line(None)
+
+    def test_entries(self, dns_server, tmpdir):
+        trace = QueryTrace(str(tmpdir.join('trace')))
+        d = DNStestDNS(cache=QueryCache(), trace=trace)
+        set_line(3)
+        d.resolve_name('foo.example.com', '127.0.0.1', dns_server.port)
+        set_line(4)
+        d.resolve_name('foo.example.com', '127.0.0.1', dns_server.port)
+        d.lookup_reverse('1.2.3.9', '127.0.0.1', dns_server.port)
+        set_line(None)
+        entries = read(trace)
+        assert trace.count == 3
+        assert sorted(entries[0]) == ['answers', 'cache', 'line', 'port', 'qname', 'qtype', 'rcode', 'rtt_ms',
+                                      'server', 'start']
+        assert [(e['line'], e['qname'], e['qtype'], e['rcode'], e['answers'], e['cache']) for e in entries] == [
+            (3, 'foo.example.com', 'A', 'NOERROR', 1, MISS),
+            (4, 'foo.example.com', 'A', 'NOERROR', 1, HIT),
+            (4, '9.3.2.1.in-addr.arpa', 'PTR', 'NXDOMAIN', 0, MISS)]
+        assert entries[0]['server'] == '127.0.0.1'
+        assert entries[0]['port'] == dns_server.port
+        assert entries[0]['rtt_ms'] > 0
+        assert entries[0]['start'] <= entries[1]['start']
+
+    def test_parallel(self, dns_server, tmpdir):
+        trace = QueryTrace(str(tmpdir.join('trace')))
+        d = DNStestDNS(cache=QueryCache(), parallel_lookups=True, trace=trace)
+        d.resolve_name('bar.example.com', '127.0.0.1', dns_server.port)
+        d.resolve_name('bar.example.com', '127.0.0.1', dns_server.port)
+        d.close()
+        assert [(e['qtype'], e['cache']) for e in read(trace)] == [('A', MISS), ('CNAME', MISS),
+                                                                   ('A', HIT), ('CNAME', HIT)]
+
+    def test_timeout(self, dns_server, tmpdir, monkeypatch):
+        monkeypatch.setitem(DNS.defaults, 'timeout', 0.2)
+        trace = QueryTrace(str(tmpdir.join('trace')))
+        d = DNStestDNS(trace=trace)
+        with pytest.raises(DNS.DNSError):
+            d.query('drop.example.com', '127.0.0.1', 'A', dns_server.port)
+        e, = read(trace)
+        assert (e['rcode'], e['answers'], e['cache']) == ('timeout', 0, MISS)
+
+    def test_replay(self, dns_server, tmpdir):
+        path = str(tmpdir.join('cassette'))
+        d = DNStestDNS(cassette=Cassette(path))
+        d.resolve_name('foo.example.com', '127.0.0.1', dns_server.port)
+        d.cassette.close()
+        trace = QueryTrace(str(tmpdir.join('trace')))
+        d = DNStestDNS(cassette=Cassette(path, replay=True), trace=trace)
+        d.resolve_name('foo.example.com', '127.0.0.1', dns_server.port)
+        assert [(e['qname'], e['cache']) for e in read(trace)] == [('foo.example.com', REPLAY)]
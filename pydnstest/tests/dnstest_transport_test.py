@@ -0,0 +1,188 @@
+"""
+tests for transport.py / UDPTransport
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import pytest
+import socket
+
+import DNS
+
+from pydnstest.transport import UDPTransport, PooledTransport, SocketPool, reply_id
+from pydnstest.rtt import RTTEstimator
+from pydnstest.wire import encode_query
+
+
+def closed(sock):
+    try:
+        return sock.fileno() == -1
+    except socket.error:  # python 2 raises EBADF for closed sockets
+        return True
+
+
+class TestTransport:
+    """
+    tests for transport.py, against a StandInServer
+    """
+
+    def test_reply_id(self):
+        assert reply_id(encode_query(4660, 'foo.example.com', 'A')) == 4660
+        assert reply_id(b'\x00\x01') is None
+
+    def test_query(self, dns_server):
+        t = UDPTransport(timeout=2)
+        r = t.query('foo.example.com', '127.0.0.1', 'A', dns_server.port)
+        assert r.header['status'] == 'NOERROR'
+        assert r.answers[0]['data'] == '1.2.3.4'
+        assert r.args['server'] == '127.0.0.1'
+
+    def test_query_many(self, dns_server):
+        t = UDPTransport(timeout=2)
+        res = t.query_many([('bar.example.com', 'A'), ('bar.example.com', 'CNAME'), ('nx.example.com', 'A')],
+                           '127.0.0.1', dns_server.port)
+        # like a real server, the A query for a CNAME gets the CNAME
+        assert res[0].answers[0]['typename'] == 'CNAME'
+        assert res[0].header['status'] == 'NOERROR'
+        assert res[1].answers[0]['data'] == 'foo.example.com'
+        assert res[2].header['status'] == 'NXDOMAIN'
+        assert sorted(dns_server.udp_log) == [('bar.example.com', 'A'), ('bar.example.com', 'CNAME'), ('nx.example.com', 'A')]
+
+    def test_tcp_fallback(self, dns_server):
+        t = UDPTransport(timeout=2)
+        res = t.query_many([('trunc.example.com', 'A'), ('foo.example.com', 'A')], '127.0.0.1', dns_server.port)
+        assert res[0].answers[0]['data'] == '5.6.7.8'
+        assert res[0].header['tc'] == 0
+        assert res[1].answers[0]['data'] == '1.2.3.4'
+        r = t.query('trunc.example.com', '127.0.0.1', 'A', dns_server.port)
+        assert r.answers[0]['data'] == '5.6.7.8'
+        # a new TCP connection for each query
+        assert dns_server.tcp_log == [('trunc.example.com', 'A')] * 2
+        assert dns_server.connections == 2
+
+    def test_tcp_timeout(self, dns_server):
+        t = UDPTransport(timeout=0.1)
+        dns_server.drop.add('foo.example.com')
+        with pytest.raises(DNS.TimeoutError):
+            t.query_tcp('foo.example.com', '127.0.0.1', 'A', dns_server.port)
+
+    def test_timeout(self, dns_server):
+        t = UDPTransport(timeout=0.1)
+        with pytest.raises(DNS.TimeoutError):
+            t.query('drop.example.com', '127.0.0.1', 'A', dns_server.port)
+
+    def test_pooled_reuses_socket(self, dns_server):
+        t = PooledTransport(timeout=2)
+        for name in ['foo.example.com', 'bar.example.com', 'foo.example.com']:
+            t.query(name, '127.0.0.1', 'A', dns_server.port)
+        t.query_many([('bar.example.com', 'A'), ('bar.example.com', 'CNAME')], '127.0.0.1', dns_server.port)
+        assert len(dns_server.udp_log) == 5
+        # every query came from the same source port
+        assert len(dns_server.clients) == 1
+        assert t.pool.created == 1
+        assert t.pool.reused == 3
+        t.pool.close()
+
+    def test_pooled_timeout_reuse(self, dns_server):
+        t = PooledTransport(timeout=0.1)
+        with pytest.raises(DNS.TimeoutError):
+            t.query('drop.example.com', '127.0.0.1', 'A', dns_server.port)
+        r = t.query('foo.example.com', '127.0.0.1', 'A', dns_server.port)
+        assert r.answers[0]['data'] == '1.2.3.4'
+        assert t.pool.created == 1
+        t.pool.close()
+
+    def test_pooled_tcp_fallback(self, dns_server):
+        t = PooledTransport(timeout=2)
+        res = t.query_many([('trunc.example.com', 'A'), ('foo.example.com', 'A')], '127.0.0.1', dns_server.port)
+        assert res[0].answers[0]['data'] == '5.6.7.8'
+        assert res[0].header['tc'] == 0
+        assert res[1].answers[0]['data'] == '1.2.3.4'
+        r = t.query('trunc.example.com', '127.0.0.1', 'A', dns_server.port)
+        assert r.answers[0]['data'] == '5.6.7.8'
+        # the TCP connection is kept open for the second query
+        assert dns_server.tcp_log == [('trunc.example.com', 'A')] * 2
+        assert dns_server.connections == 1
+        t.pool.close()
+
+    def test_pooled_tcp_reconnect(self, dns_server):
+        t = PooledTransport(timeout=2)
+        t.query_tcp('foo.example.com', '127.0.0.1', 'A', dns_server.port)
+        # simulate the server closing the idle connection
+        t.pool._idle[('tcp', '127.0.0.1', dns_server.port)][0].shutdown(socket.SHUT_RDWR)
+        r = t.query_tcp('foo.example.com', '127.0.0.1', 'A', dns_server.port)
+        assert r.answers[0]['data'] == '1.2.3.4'
+        assert dns_server.connections == 2
+        t.pool.close()
+
+    def test_pool_max_idle(self):
+        pool = SocketPool(max_idle=1)
+        a = pool.acquire('udp', '127.0.0.1', 53)
+        b = pool.acquire('udp', '127.0.0.1', 53)
+        pool.release('udp', '127.0.0.1', 53, a)
+        pool.release('udp', '127.0.0.1', 53, b)
+        assert pool._idle[('udp', '127.0.0.1', 53)] == [a]
+        assert closed(b)
+        assert pool.acquire('udp', '127.0.0.1', 53) is a
+        pool.close()
+        assert pool._idle == {}
+
+    def test_retransmit(self, dns_server):
+        rtt = RTTEstimator(retries=1, initial_rto=0.1)
+        t = UDPTransport(timeout=30, rtt=rtt)
+        res = t.query_many([('lossy.example.com', 'A'), ('foo.example.com', 'A')], '127.0.0.1', dns_server.port)
+        assert res[0].answers[0]['data'] == '1.2.3.5'
+        assert res[1].answers[0]['data'] == '1.2.3.4'
+        # only the lost query was sent again
+        assert sorted(dns_server.udp_log) == [('foo.example.com', 'A'), ('lossy.example.com', 'A'),
+                                              ('lossy.example.com', 'A')]
+        # and only the answer to the first send was sampled
+        assert rtt.srtt('127.0.0.1', dns_server.port) < 0.1
+
+    def test_retransmit_gives_up(self, dns_server):
+        rtt = RTTEstimator(retries=2, initial_rto=0.05, max_rto=0.1)
+        t = PooledTransport(timeout=30, rtt=rtt)
+        with pytest.raises(DNS.TimeoutError):
+            t.query('drop.example.com', '127.0.0.1', 'A', dns_server.port)
+        assert dns_server.udp_log == [('drop.example.com', 'A')] * 3
+        t.pool.close()
@@ -0,0 +1,161 @@
+"""
+tests for wire.py - the minimal DNS codec, checked against pydns
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import pytest
+
+from DNS import Lib, Type, Class
+
+from pydnstest.wire import encode_name, encode_query, decode_reply, Reply, QueryEncoder
+
+
+def packet(rcode=0, tc=0, answers=(), authority=(), qname='www.example.com', qtype=Type.A):
+    """
+    build a reply with pydns; answers/authority are lists of (method, args)
+    """
+    m = Lib.Mpacker()
+    m.addHeader(4660, 1, 0, 1, tc, 1, 1, 0, rcode, 1, len(answers), len(authority), 0)
+    m.addQuestion(qname, qtype, Class.IN)
+    for meth, args in list(answers) + list(authority):
+        getattr(m, meth)(*args)
+    return m.getbuf()
+
+
+def pydns(buf):
+    return Lib.DnsResult(Lib.Munpacker(buf), {'foo': 'bar'})
+
+
+packets = {
+    'A': packet(answers=[('addA', ('www.example.com', Class.IN, 300, '1.2.3.4')),
+                         ('addA', ('www.example.com', Class.IN, 300, '10.20.30.40'))]),
+    'CNAME_chain': packet(answers=[('addCNAME', ('www.example.com', Class.IN, 60, 'foo.example.com')),
+                                   ('addA', ('foo.example.com', Class.IN, 360, '1.2.3.4'))]),
+    'PTR': packet(qname='4.3.2.1.in-addr.arpa', qtype=Type.PTR,
+                  answers=[('addPTR', ('4.3.2.1.in-addr.arpa', Class.IN, 300, 'www.example.com'))]),
+    'NXDOMAIN': packet(rcode=3, authority=[('addSOA', ('example.com', Class.IN, 600, 'ns1.example.com',
+                                                       'hostmaster.example.com', 2017010101, 3600, 600,
+                                                       86400, 60))]),
+    'NS': packet(authority=[('addNS', ('example.com', Class.IN, 600, 'ns1.example.com'))]),
+    'truncated': packet(tc=1),
+    'idna': packet(answers=[('addCNAME', ('www.example.com', Class.IN, 60, 'xn--bcher-kva.example.com'))]),
+}
+
+
+class TestWire:
+
+    @pytest.mark.parametrize('name', sorted(packets.keys()))
+    def test_decode_same_as_pydns(self, name):
+        buf = packets[name]
+        r = decode_reply(buf, {'foo': 'bar'})
+        p = pydns(buf)
+        assert isinstance(r, Reply)
+        assert r.header == p.header
+        assert r.questions == p.questions
+        assert r.answers == p.answers
+        assert r.authority == p.authority
+        assert r.additional == p.additional
+        assert r.args == {'foo': 'bar'}
+
+    def test_decode_other_types_fallback(self):
+        buf = packet(qtype=Type.MX, answers=[('addMX', ('www.example.com', Class.IN, 300, 10, 'mx.example.com'))])
+        r = decode_reply(buf, {})
+        assert isinstance(r, Lib.DnsResult)
+        assert r.answers == pydns(buf).answers
+
+    def test_decode_short(self):
+        with pytest.raises(Lib.UnpackError):
+            decode_reply(b'\x00\x01', {})
+        with pytest.raises(Lib.UnpackError):
+            decode_reply(packets['A'][:-3], {})
+
+    def test_decode_compression_loop(self):
+        # header with one question whose name points at itself
+        buf = b'\x12\x34\x81\x80\x00\x01\x00\x00\x00\x00\x00\x00\xc0\x0c\x00\x01\x00\x01'
+        with pytest.raises(Lib.UnpackError):
+            decode_reply(buf, {})
+
+    @pytest.mark.parametrize('qtype', ['A', 'CNAME', 'PTR'])
+    def test_encode_query_same_as_pydns(self, qtype):
+        m = Lib.Mpacker()
+        m.addHeader(4660, 0, 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0)
+        m.addQuestion('www.example.com', getattr(Type, qtype), Class.IN)
+        assert encode_query(4660, 'www.example.com', qtype) == m.getbuf()
+
+    def test_encode_query_decodes(self):
+        r = decode_reply(encode_query(4660, 'foo.example.com', 'A'), {})
+        assert r.header['id'] == 4660
+        assert r.header['rd'] == 1
+        assert r.questions == [{'qname': 'foo.example.com', 'qtype': 1, 'qclass': 1, 'qtypestr': 'A', 'qclassstr': 'IN'}]
+
+    def test_encode_name(self):
+        assert encode_name('foo.example.com.') == b'\x03foo\x07example\x03com\x00'
+        assert encode_name('') == b'\x00'
+        # the idna codec rejects long labels itself, as with pydns
+        with pytest.raises((Lib.PackError, UnicodeError)):
+            encode_name('a' * 64 + '.example.com')
+
+    def test_query_encoder(self):
+        enc = QueryEncoder()
+        buf = enc.buf
+        for tid, name, qtype in [(1, 'www.example.com', 'A'), (65535, 'www.example.com', 'CNAME'),
+                                 (2, 'a.b', 'A'), (3, '4.3.2.1.in-addr.arpa', 'PTR'), (4, 'a.b', 'PTR')]:
+            q = enc.encode(tid, name, qtype)
+            assert q.tobytes() == encode_query(tid, name, qtype)
+        # always the same buffer, and each name is only encoded once
+        assert enc.buf is buf
+        assert sorted(enc.qnames.keys()) == ['4.3.2.1.in-addr.arpa', 'a.b', 'www.example.com']
+        assert sorted(enc.tails.keys()) == ['A', 'CNAME', 'PTR']
+
+    def test_query_encoder_max_names(self):
+        enc = QueryEncoder()
+        enc.max_names = 2
+        for name in ['a.example.com', 'b.example.com', 'c.example.com']:
+            enc.encode(1, name, 'A')
+        assert list(enc.qnames.keys()) == ['c.example.com']
+
+    def test_query_encoder_name_too_long(self):
+        enc = QueryEncoder()
+        with pytest.raises(Lib.PackError):
+            enc.encode(1, '.'.join(['a' * 60] * 5), 'A')
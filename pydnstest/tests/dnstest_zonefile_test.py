@@ -0,0 +1,280 @@
+"""
+tests for zonefile.py
+
+This class is just a light wrapper around the DNS module.
+These tests really only exist to make sure that DNS doesn't
+change or break its API without us noticing.
+
+BE WARNED that the DNS lookups used here *may* fail if the author's
+hosting setup changes drastically.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import os
+import sys
+
+import pytest
+
+from pydnstest.dns import DNStestDNS
+from pydnstest.snapshot import SnapshotSet
+from pydnstest.zonefile import ZoneFileIndex, ZoneFileError, default_index_path, parse_zone_file, parse_ttl
+
+ZONE = """$ORIGIN example.com.
+$TTL 1h
+@   IN  SOA ns1 hostmaster (
+        2017010101 ; serial
+        3600 600 1w 60 )
+    IN  NS  ns1
+ns1     A   1.2.3.1
+foo 300 IN A 1.2.3.4
+        IN A 1.2.3.6
+Bar     CNAME Foo
+multi   PTR foo.example.com.
+        PTR bar.example.com.
+        PTR ns1.example.org.
+mx      MX 10 foo.example.com.
+txt     TXT "hello; world" "x"
+$INCLUDE inc.zone
+"""
+
+REVERSE = """$TTL 300
+@ SOA ns1.example.com. hostmaster.example.com. 5 3600 600 86400 60
+4 PTR foo.example.com.
+5 TXT "no ptr"
+"""
+
+WILD = """$ORIGIN example.com.
+$TTL 60
+@       SOA ns1 hostmaster 1 3600 600 86400 60
+*.wild  A 1.2.3.7
+        TXT "wild"
+a.b.c   A 1.2.3.8
+*.c     CNAME Foo.example.com.
+"""
+
+
+@pytest.fixture
+def zonefile(tmpdir):
+    tmpdir.join('inc.zone').write('inc A 1.2.3.10\n')
+    p = tmpdir.join('db.example.com')
+    p.write(ZONE)
+    return str(p)
+
+
+class TestZoneFile:
+
+    def test_parse_ttl(self):
+        assert parse_ttl('3600') == 3600
+        assert parse_ttl('1h30m') == 5400
+        assert parse_ttl('1W') == 604800
+        with pytest.raises(ValueError):
+            parse_ttl('1x')
+
+    def test_parse_zone_file(self, zonefile):
+        assert list(parse_zone_file(zonefile)) == [
+            ('example.com', 3600, 'SOA', 'ns1.example.com hostmaster.example.com 2017010101 3600 600 604800 60'),
+            ('example.com', 3600, 'NS', 'ns1.example.com'),
+            ('ns1.example.com', 3600, 'A', '1.2.3.1'),
+            ('foo.example.com', 300, 'A', '1.2.3.4'),
+            ('foo.example.com', 3600, 'A', '1.2.3.6'),
+            ('Bar.example.com', 3600, 'CNAME', 'Foo.example.com'),
+            ('multi.example.com', 3600, 'PTR', 'foo.example.com'),
+            ('multi.example.com', 3600, 'PTR', 'bar.example.com'),
+            ('multi.example.com', 3600, 'PTR', 'ns1.example.org'),
+            ('mx.example.com', 3600, 'MX', '10 foo.example.com'),
+            ('txt.example.com', 3600, 'TXT', '"hello; world" "x"'),
+            ('inc.example.com', 3600, 'A', '1.2.3.10'),
+        ]
+
+    def test_parse_errors(self, tmpdir):
+        p = tmpdir.join('bad.zone')
+        for contents, msg in (('foo A 1.2.3.4\n', ':1: relative name foo, but no $ORIGIN or zone given'),
+                              ('$ORIGIN example.com.\nfoo A 1.2.3.4\n', ':2: record without a TTL, and no $TTL'),
+                              ('$TTL 60\n$ORIGIN example.com.\n@ SOA ns1 hm (1 2 3\n', ':3: unbalanced parentheses'),
+                              ('$TTL 60\n$ORIGIN example.com.\n@ SOA ns1 hm 1 2 3\n',
+                               ':3: invalid SOA record: too few fields'),
+                              ('$GENERATE 1-2 foo$ A 1.2.3.$\n', ':1: unsupported directive $GENERATE')):
+            p.write(contents)
+            with pytest.raises(ZoneFileError) as excinfo:
+                list(parse_zone_file(str(p)))
+            assert str(excinfo.value) == str(p) + msg
+        with pytest.raises(ZoneFileError):
+            list(parse_zone_file(str(tmpdir.join('missing'))))
+
+    def test_index(self, zonefile):
+        z = ZoneFileIndex(zonefile)
+        assert z.index_path == default_index_path(zonefile)
+        # nothing is written next to the zone file
+        assert os.path.dirname(z.index_path) != os.path.dirname(zonefile)
+        assert os.path.exists(z.index_path)
+        assert z.zone == 'example.com'
+        assert z.serial == 2017010101
+        assert len(z) == 12
+        assert z.covers('foo.example.com.')
+        assert not z.covers('example.org')
+        # named as asked, as in a server's reply
+        assert z.lookup('FOO.example.com.') == {'A': [
+            {'name': 'FOO.example.com', 'type': 1, 'class': 1, 'classstr': 'IN', 'ttl': 300,
+             'typename': 'A', 'rdlength': 4, 'data': '1.2.3.4'},
+            {'name': 'FOO.example.com', 'type': 1, 'class': 1, 'classstr': 'IN', 'ttl': 3600,
+             'typename': 'A', 'rdlength': 4, 'data': '1.2.3.6'}]}
+        # data keeps its case; RDLENGTH is of the compressed name
+        assert z.lookup('bar.example.com')['CNAME'][0]['data'] == 'Foo.example.com'
+        assert z.lookup('bar.example.com')['CNAME'][0]['rdlength'] == 6
+        assert [r['rdlength'] for r in z.lookup('multi.example.com')['PTR']] == [6, 6, 17]
+        assert sorted(z.lookup('example.com').keys()) == ['NS', 'SOA']
+        assert z.lookup('nx.example.com') is None
+        z.close()
+
+    def test_index_reused_and_rebuilt(self, zonefile, tmpdir):
+        index_path = default_index_path(zonefile)
+        ZoneFileIndex(zonefile).close()
+        mtime = os.path.getmtime(index_path)
+        z = ZoneFileIndex(zonefile)
+        assert os.path.getmtime(index_path) == mtime
+        z.close()
+        # changing an included file rebuilds it
+        tmpdir.join('inc.zone').write('inc A 1.2.3.11\nnew A 1.2.3.12\n')
+        z = ZoneFileIndex(zonefile)
+        assert z.lookup('inc.example.com')['A'][0]['data'] == '1.2.3.11'
+        assert len(z) == 13
+        z.close()
+        # as does a corrupt index
+        with open(index_path, 'wb') as fh:
+            fh.write(b'garbage')
+        z = ZoneFileIndex(zonefile)
+        assert z.lookup('new.example.com')['A'][0]['data'] == '1.2.3.12'
+        z.close()
+
+    def test_index_stats_sources_only(self, zonefile, monkeypatch):
+        ZoneFileIndex(zonefile).close()
+        opened = []
+
+        def mockopen(path, *args, **kwargs):
+            opened.append(path)
+            return open(path, *args, **kwargs)
+        monkeypatch.setattr('pydnstest.zonefile.open', mockopen, raising=False)
+        z = ZoneFileIndex(zonefile)
+        assert opened == [default_index_path(zonefile)]
+        z.close()
+
+    @pytest.mark.skipif(sys.version_info < (3, 5), reason="stand-in server requires python 3.5+")
+    def test_matches_server(self, zonefile, tmpdir, request):
+        from pydnstest.testserver import StandInServer
+        p = tmpdir.join('rev.zone')
+        p.write(REVERSE)
+        s = StandInServer(zone_files=[zonefile, ('3.2.1.in-addr.arpa', str(p))]).start()
+        request.addfinalizer(s.stop)
+        snaps = SnapshotSet()
+        snaps.add('test', ZoneFileIndex(zonefile))
+        snaps.add('test', ZoneFileIndex(str(p), zone='3.2.1.in-addr.arpa'))
+        d = DNStestDNS()
+        for name in ('foo.example.com', 'Bar.example.com', 'bar.EXAMPLE.com', 'inc.example.com', 'nx.example.com'):
+            assert snaps.resolve_name(name, 'test') == d.resolve_name(name, '127.0.0.1', s.port)
+        for addr in ('1.2.3.4', '1.2.3.5', '1.2.3.6'):
+            assert snaps.lookup_reverse(addr, 'test') == d.lookup_reverse(addr, '127.0.0.1', s.port)
+        for name in ('multi.example.com', 'MULTI.example.COM'):
+            assert snaps.find(name, 'test').lookup(name)['PTR'] == d.query(name, '127.0.0.1', 'PTR', s.port).answers
+
+    def test_wildcards_and_empty_non_terminals(self, tmpdir):
+        p = tmpdir.join('wild.zone')
+        p.write(WILD)
+        z = ZoneFileIndex(str(p), index_path=str(tmpdir.join('wild.idx')))
+        assert len(z) == 5
+        # empty non-terminals exist, with no records
+        assert z.lookup('b.c.example.com') == {}
+        assert z.lookup('C.example.com.') == {}
+        assert z.lookup('wild.example.com') == {}
+        # names below the closest encloser match its wildcard, named as asked
+        assert z.lookup('Foo.wild.example.com') == {
+            'A': [{'name': 'Foo.wild.example.com', 'type': 1, 'class': 1, 'classstr': 'IN', 'ttl': 60,
+                   'typename': 'A', 'rdlength': 4, 'data': '1.2.3.7'}],
+            'TXT': [{'name': 'Foo.wild.example.com', 'type': 16, 'class': 1, 'classstr': 'IN', 'ttl': 60,
+                     'typename': 'TXT', 'rdlength': 6, 'data': '"wild"'}]}
+        assert z.lookup('x.y.wild.example.com')['A'][0]['data'] == '1.2.3.7'
+        assert z.lookup('x.c.example.com')['CNAME'][0]['data'] == 'Foo.example.com'
+        # b.c exists, so it's the closest encloser of x.b.c, and it has no wildcard
+        assert z.lookup('x.b.c.example.com') is None
+        assert z.lookup('nx.example.com') is None
+        snaps = SnapshotSet()
+        snaps.add('test', z)
+        assert snaps.resolve_name('foo.wild.example.com', 'test')['answer']['data'] == '1.2.3.7'
+        assert snaps.resolve_name('b.c.example.com', 'test') == {'status': 'NOERROR'}
+        assert snaps.resolve_name('c.example.com', 'test') == {'status': 'NOERROR'}
+        assert snaps.resolve_name('x.b.c.example.com', 'test') == {'status': 'NXDOMAIN'}
+        z.close()
+
+    def test_many_names(self, tmpdir):
+        p = tmpdir.join('big.zone')
+        lines = ['$ORIGIN example.com.', '$TTL 60', '@ SOA ns1 hm 1 2 3 4 5']
+        lines.extend('host%d A 10.%d.%d.%d' % (i, i >> 16, (i >> 8) & 255, i & 255) for i in range(5000))
+        p.write('\n'.join(lines) + '\n')
+        z = ZoneFileIndex(str(p), index_path=str(tmpdir.join('big.idx')))
+        for i in range(5000):
+            assert z.lookup('host%d.example.com' % i)['A'][0]['data'] == '10.%d.%d.%d' % (
+                i >> 16, (i >> 8) & 255, i & 255)
+        assert z.lookup('host5000.example.com') is None
+        z.close()
+
+    def test_zone_given(self, tmpdir):
+        p = tmpdir.join('rev.zone')
+        p.write(REVERSE)
+        z = ZoneFileIndex(str(p), zone='3.2.1.in-addr.arpa')
+        assert z.zone == '3.2.1.in-addr.arpa'
+        assert z.ptr_records('1.2.3.4')[0]['data'] == 'foo.example.com'
+        assert z.ptr_records('1.2.3.5') == []
+        z.close()
+        # a different zone for the same file rebuilds the index
+        z = ZoneFileIndex(str(p), zone='2.1.in-addr.arpa')
+        assert z.lookup('4.2.1.in-addr.arpa')['PTR'][0]['data'] == 'foo.example.com'
+        z.close()
+
+    def test_dns_from_zone_file(self, zonefile, tmpdir):
+        p = tmpdir.join('rev.zone')
+        p.write(REVERSE)
+        snaps = SnapshotSet()
+        snaps.add('test', ZoneFileIndex(zonefile))
+        snaps.add('test', ZoneFileIndex(str(p), zone='3.2.1.in-addr.arpa'))
+        d = DNStestDNS(snapshots=snaps)
+        assert d.resolve_name('foo.example.com', 'test')['answer']['data'] == '1.2.3.4'
+        assert d.resolve_name('bar.example.com', 'test')['answer']['typename'] == 'CNAME'
+        assert d.resolve_name('mx.example.com', 'test') == {'status': 'NOERROR'}
+        assert d.resolve_name('nx.example.com', 'test') == {'status': 'NXDOMAIN'}
+        assert d.lookup_reverse('1.2.3.4', 'test')['answer']['data'] == 'foo.example.com'
+        assert d.lookup_reverse('1.2.3.5', 'test') == {'status': 'NOERROR'}
+        assert d.lookup_reverse('1.2.3.6', 'test') == {'status': 'NXDOMAIN'}
+        assert snaps.resolve_name('foo.example.com', 'prod') is None
@@ -0,0 +1,545 @@
+"""
+In-process stand-in authoritative DNS server, for testing and benchmarking pydnstest
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import asyncio
+import errno
+import optparse
+import random
+import struct
+import threading
+
+from DNS import Lib, Type, Class
+
+from pydnstest.transport import IXFR
+from pydnstest.zonefile import parse_zone_file
+
+# largest reply sent over UDP before it's truncated (RFC 1035)
+UDP_MAX = 512
+
+# records per message of a zone transfer
+AXFR_CHUNK = 500
+
+# record types _add_record() can pack; others are served as if absent
+PACKABLE = ('A', 'CNAME', 'PTR', 'NS', 'MX', 'SOA', 'TXT')
+
+
+def _lower(name):
+    return name.lower().rstrip('.')
+
+
+def _add_record(m, name, typename, ttl, data):
+    """
+    Add a record of one of the PACKABLE types, with data in master file
+    text form (as returned by pydnstest.zonefile.parse_zone_file()), to a
+    Lib.Mpacker
+    """
+    if typename == 'MX':
+        pref, exchange = data.split(None, 1)
+        m.addMX(name, Class.IN, ttl, int(pref), exchange)
+    elif typename == 'SOA':
+        f = data.split()
+        m.addSOA(name, Class.IN, ttl, f[0], f[1], *[int(x) for x in f[2:7]])
+    elif typename == 'TXT':
+        m.addTXT(name, Class.IN, ttl, [s.strip('"') for s in data.split('" "')])
+    else:
+        getattr(m, 'add' + typename)(name, Class.IN, ttl, data)
+
+
+class StandInServer(object):
+    """
+    Authoritative DNS server answering over UDP and TCP from an event loop
+    on its own thread, for exercising the real resolver code (sockets,
+    concurrency, retransmission, rate limiting) without a real server.
+
+    Names are served from records given as a dict and/or BIND zone files.
+    Queries for names in a zone (any name with a SOA record) that has no
+    records get NXDOMAIN, names with no records of the queried type get an
+    empty NOERROR reply, and an A query for a name with a CNAME gets the
+    CNAME, as from a real authoritative server; names outside all of the
+    zones are REFUSED. AXFR over TCP is supported, and so is IXFR (RFC 1995)
+    for the changes made with ``update()``.
+
+    Every reply can be delayed by ``latency`` seconds (plus up to ``jitter``
+    more), and each UDP query is dropped with probability ``loss``. UDP
+    replies larger than 512 bytes are truncated (TC), so that the client
+    retries over TCP.
+
+    For tests, particular names can be made to misbehave: queries for names
+    in ``drop`` are never answered, the next ``lose[name]`` UDP queries for
+    a name are ignored, and UDP replies for names in ``force_truncate`` are
+    always truncated.
+    """
+
+    def __init__(self, records=None, zone_files=(), host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 loss=0.0, ttl=300, seed=None, log_queries=False):
+        """
+        @param records dict of name -> list of (typename, data) records, with
+          data as in a master file (i.e. '1.2.3.4' or 'foo.example.com'; for
+          SOA 'mname rname serial refresh retry expire minimum')
+        @param zone_files list of zone file paths, or (zone, path) pairs for
+          files without a $ORIGIN
+        @param host address to listen on
+        @param port port to listen on for UDP and TCP; 0 picks a free one
+          (see the port attribute once started)
+        @param latency seconds to wait before sending each reply
+        @param jitter up to this many more seconds (uniformly distributed)
+        @param loss probability of ignoring each UDP query
+        @param ttl TTL of the records from ``records``
+        @param seed seed for the random number generator used for jitter and loss
+        @param log_queries keep the (name, type name) of each query received
+          over UDP in ``udp_log`` and over TCP in ``tcp_log``, and the
+          address of each UDP client in ``clients``
+        """
+        # name -> typename -> list of (ttl, data)
+        self.names = {}
+        # zone -> SOA (ttl, data)
+        self.zones = {}
+        for name, rrs in (records or {}).items():
+            for typename, data in rrs:
+                self.add(name, typename, data, ttl)
+        for zf in zone_files:
+            zone, path = zf if isinstance(zf, tuple) else (None, zf)
+            for name, rttl, typename, data in parse_zone_file(path, origin=zone):
+                self.add(name, typename, data, rttl)
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.queries = 0
+        self.dropped = 0
+        self.truncated = 0
+        self.connections = 0
+        self.drop = set()
+        self.lose = {}
+        self.force_truncate = set()
+        self.udp_log = [] if log_queries else None
+        self.tcp_log = [] if log_queries else None
+        self.clients = set() if log_queries else None
+        # zone -> list of (old SOA, new SOA, deleted records, added records)
+        # made by update(), with SOAs as (ttl, data) and records as
+        # (name, typename, ttl, data)
+        self.changes = {}
+        # (qname, qtype) -> encoded reply, minus the 2-byte ID
+        self._replies = {}
+        self._loop = None
+        self._thread = None
+        self._servers = []
+        # StreamWriters of the open TCP connections
+        self._conns = set()
+
+    def add(self, name, typename, data, ttl=300):
+        """
+        Add a record; with a SOA record, name becomes a zone
+        """
+        name = _lower(name)
+        if typename not in PACKABLE:
+            return
+        self.names.setdefault(name, {}).setdefault(typename, []).append((ttl, data))
+        if typename == 'SOA':
+            self.zones[name] = (ttl, data)
+        self._replies = {}
+
+    def update(self, name, typename, data=None, ttl=300):
+        """
+        Replace the typename records of name (which must be in a zone) with
+        one with data, or with data None delete them, and increment the
+        zone's SOA serial, so that IXFR queries get the change
+        """
+        name = _lower(name)
+        zone = self.zone_of(name)
+        if zone is None:
+            raise ValueError('%s is not in any zone' % name)
+        types = self.names.setdefault(name, {})
+        deleted = [(name, typename, t, d) for t, d in types.pop(typename, [])]
+        added = []
+        if data is not None:
+            types[typename] = [(ttl, data)]
+            added.append((name, typename, ttl, data))
+        if not types:
+            del self.names[name]
+        old = self.zones[zone]
+        f = old[1].split()
+        f[2] = str(int(f[2]) + 1)
+        new = (old[0], ' '.join(f))
+        self.zones[zone] = new
+        self.names[zone]['SOA'] = [new]
+        self.changes.setdefault(zone, []).append((old, new, deleted, added))
+        self._replies = {}
+
+    def zone_of(self, name):
+        """
+        Return the (most specific) zone that name is in, or None
+        """
+        while True:
+            if name in self.zones:
+                return name
+            if '.' not in name:
+                return None
+            name = name.split('.', 1)[1]
+
+    def _inspect(self, data, addr=None):
+        """
+        Log a query received over UDP from addr (or over TCP, with addr
+        None) if log_queries was given, and apply the drop, lose and
+        force_truncate faults to it. Returns None if it's to be ignored,
+        otherwise whether the UDP reply has to be truncated.
+        """
+        u = Lib.Munpacker(data)
+        u.getHeader()
+        qname, qtype, qclass = u.getQuestion()
+        if self.udp_log is not None:
+            if addr is None:
+                self.tcp_log.append((qname, Type.typestr(qtype)))
+            else:
+                self.udp_log.append((qname, Type.typestr(qtype)))
+                self.clients.add(addr)
+        name = _lower(qname)
+        if name in self.drop:
+            return None
+        if addr is not None and self.lose.get(name):
+            self.lose[name] -= 1
+            return None
+        return addr is not None and name in self.force_truncate
+
+    def reply(self, data):
+        """
+        Return the reply to a query packet
+        """
+        u = Lib.Munpacker(data)
+        tid = u.getHeader()[0]
+        qname, qtype, qclass = u.getQuestion()
+        key = (qname, qtype)
+        body = self._replies.get(key)
+        if body is None:
+            body = self._replies[key] = self._answer(qname, qtype)[2:]
+        return struct.pack('!H', tid) + body
+
+    def _answer(self, qname, qtype):
+        name = _lower(qname)
+        zone = self.zone_of(name)
+        types = self.names.get(name, {})
+        typename = Type.typestr(qtype)
+        answers = []
+        if typename in types:
+            answers = [(typename, ttl, data) for ttl, data in types[typename]]
+        elif 'CNAME' in types:
+            answers = [('CNAME', ttl, data) for ttl, data in types['CNAME']]
+        if zone is None and not types:
+            rcode = 5
+        elif not types:
+            rcode = 3
+        else:
+            rcode = 0
+        m = Lib.Mpacker()
+        authority = 1 if zone is not None and not answers else 0
+        m.addHeader(0, 1, 0, 1, 0, 0, 0, 0, rcode, 1, len(answers), authority, 0)
+        m.addQuestion(qname, qtype, Class.IN)
+        for t, ttl, data in answers:
+            _add_record(m, qname, t, ttl, data)
+        if authority:
+            ttl, data = self.zones[zone]
+            _add_record(m, zone, 'SOA', ttl, data)
+        return m.getbuf()
+
+    def _qtype(self, data):
+        u = Lib.Munpacker(data)
+        u.getHeader()
+        return u.getQuestion()[1]
+
+    def truncate(self, reply):
+        """
+        Return a reply cut down to its header and question, with TC set
+        """
+        u = Lib.Munpacker(reply)
+        u.getHeader()
+        u.getQuestion()
+        flags = struct.unpack('!H', reply[2:4])[0] | 0x0200
+        return reply[:2] + struct.pack('!HHHHH', flags, 1, 0, 0, 0) + reply[12:u.offset]
+
+    def axfr(self, data):
+        """
+        Return the list of reply messages for an AXFR query
+        """
+        u = Lib.Munpacker(data)
+        tid = u.getHeader()[0]
+        qname, qtype, qclass = u.getQuestion()
+        zone = _lower(qname)
+        if zone not in self.zones:
+            m = Lib.Mpacker()
+            m.addHeader(tid, 1, 0, 1, 0, 0, 0, 0, 5, 1, 0, 0, 0)
+            m.addQuestion(qname, qtype, Class.IN)
+            return [m.getbuf()]
+        soa = (zone, 'SOA') + self.zones[zone]
+        records = [soa]
+        for name in sorted(self.names):
+            if self.zone_of(name) != zone:
+                continue
+            for typename, rrs in sorted(self.names[name].items()):
+                if typename != 'SOA':
+                    records.extend((name, typename, ttl, data) for ttl, data in rrs)
+        records.append(soa)
+        return self._transfer(tid, qname, qtype, records)
+
+    def ixfr(self, data):
+        """
+        Return the list of reply messages for an IXFR query: the changes
+        since the client's serial, or the whole zone as for AXFR if they
+        aren't all known
+        """
+        u = Lib.Munpacker(data)
+        tid = u.getHeader()[0]
+        qname, qtype, qclass = u.getQuestion()
+        zone = _lower(qname)
+        if zone not in self.zones:
+            return self.axfr(data)
+        u.getRRheader()
+        serial = u.getSOAdata()[2][1]
+        soa = (zone, 'SOA') + self.zones[zone]
+        changes = self.changes.get(zone, [])
+        starts = [i for i, c in enumerate(changes) if int(c[0][1].split()[2]) == serial]
+        if int(soa[3].split()[2]) == serial:
+            # already up to date
+            records = [soa]
+        elif starts:
+            records = [soa]
+            for old, new, deleted, added in changes[starts[0]:]:
+                records.append((zone, 'SOA') + old)
+                records.extend(deleted)
+                records.append((zone, 'SOA') + new)
+                records.extend(added)
+            records.append(soa)
+        else:
+            return self.axfr(data)
+        return self._transfer(tid, qname, qtype, records)
+
+    def _transfer(self, tid, qname, qtype, records):
+        """
+        Return the list of reply messages of a zone transfer of records
+        """
+        messages = []
+        for i in range(0, len(records), AXFR_CHUNK):
+            chunk = records[i:i + AXFR_CHUNK]
+            m = Lib.Mpacker()
+            m.addHeader(tid, 1, 0, 1, 0, 0, 0, 0, 0, 1, len(chunk), 0, 0)
+            m.addQuestion(qname, qtype, Class.IN)
+            for r in chunk:
+                _add_record(m, *r)
+            messages.append(m.getbuf())
+        return messages
+
+    def _delay(self):
+        d = self.latency
+        if self.jitter:
+            d += self.random.uniform(0, self.jitter)
+        return d
+
+    def _later(self, func, *args):
+        d = self._delay()
+        if d > 0:
+            self._loop.call_later(d, func, *args)
+        else:
+            func(*args)
+
+    def start(self):
+        """
+        Start serving on a new thread; returns once the sockets are bound
+        """
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self._bind())
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            self._loop.run_forever()
+            for s in self._servers:
+                s.close()
+            # closing the TCP connections ends their handlers
+            for w in list(self._conns):
+                w.close()
+            all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+            tasks = all_tasks(self._loop)
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    async def _bind(self):
+        server = self
+        loop = self._loop
+
+        class UDP(asyncio.DatagramProtocol):
+
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def datagram_received(self, data, addr):
+                server.queries += 1
+                if server.loss and server.random.random() < server.loss:
+                    server.dropped += 1
+                    return
+                truncate = False
+                try:
+                    if server._inspecting():
+                        truncate = server._inspect(data, addr)
+                        if truncate is None:
+                            server.dropped += 1
+                            return
+                    r = server.reply(data)
+                except Exception:
+                    return
+                if truncate or len(r) > UDP_MAX:
+                    server.truncated += 1
+                    r = server.truncate(r)
+                server._later(self.transport.sendto, r, addr)
+
+        # with port 0, the free UDP port picked may already be in use for
+        # TCP (say, by a client connection); then try another one
+        for attempt in range(20):
+            transport, _ = await loop.create_datagram_endpoint(UDP, local_addr=(self.host, self.port))
+            port = transport.get_extra_info('sockname')[1]
+            try:
+                tcp = await asyncio.start_server(self._serve_tcp, self.host, port)
+            except OSError as e:
+                transport.close()
+                if self.port != 0 or e.errno != errno.EADDRINUSE:
+                    raise
+                continue
+            break
+        else:
+            raise OSError(errno.EADDRINUSE, 'no free port for both UDP and TCP')
+        self.port = port
+        self._servers.extend([transport, tcp])
+
+    def _inspecting(self):
+        """
+        Whether queries need to be looked at by _inspect()
+        """
+        return self.udp_log is not None or self.drop or self.lose or self.force_truncate
+
+    async def _serve_tcp(self, reader, writer):
+        self._conns.add(writer)
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readexactly(2)
+                data = await reader.readexactly(struct.unpack('!H', header)[0])
+                self.queries += 1
+                if self._inspecting() and self._inspect(data) is None:
+                    self.dropped += 1
+                    continue
+                # QTYPE is the second-to-last 16 bits of a query; an IXFR
+                # query has a SOA record after its question
+                if struct.unpack('!H', data[-4:-2])[0] == Type.AXFR:
+                    replies = self.axfr(data)
+                elif self._qtype(data) == IXFR:
+                    replies = self.ixfr(data)
+                else:
+                    replies = [self.reply(data)]
+                d = self._delay()
+                if d > 0:
+                    await asyncio.sleep(d)
+                for r in replies:
+                    writer.write(struct.pack('!H', len(r)) + r)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._conns.discard(writer)
+            writer.close()
+
+    def stop(self):
+        """
+        Stop serving and close the sockets
+        """
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    """
+    Run a StandInServer from the command line, until interrupted
+    """
+    p = optparse.OptionParser(usage='python -m pydnstest.testserver [options] [ZONE=]FILE [...]')
+    p.add_option('--host', dest='host', default='127.0.0.1', help='address to listen on (default 127.0.0.1)')
+    p.add_option('--port', dest='port', type='int', default=5353, help='port to listen on (default 5353)')
+    p.add_option('--latency', dest='latency', type='float', default=0.0,
+                 help='seconds to wait before each reply')
+    p.add_option('--jitter', dest='jitter', type='float', default=0.0,
+                 help='up to this many more seconds to wait before each reply')
+    p.add_option('--loss', dest='loss', type='float', default=0.0,
+                 help='fraction (0 to 1) of UDP queries to ignore')
+    options, args = p.parse_args(argv)
+    if not args:
+        p.error('at least one zone file is required')
+    files = [tuple(a.split('=', 1)) if '=' in a else a for a in args]
+    server = StandInServer(zone_files=files, host=options.host, port=options.port, latency=options.latency,
+                           jitter=options.jitter, loss=options.loss)
+    server.start()
+    print("serving %d zones on %s port %d" % (len(server.zones), server.host, server.port))
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Per-phase timing of dnstest runs (parse, query, evaluate, format)
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+import threading
+import time
+
+#: the phases each input line goes through, in order
+PHASES = ('parse', 'query', 'evaluate', 'format')
+
+
+class Timings(object):
+    """
+    Thread-safe totals of the time spent in each phase of a run, and of
+    the lookups and queries made against each DNS server.
+
+    - parse: DnstestParser.parse_record()
+    - query: waiting for the answers to a check's lookups (from the
+      servers, the query cache, zone snapshots or a cassette). With
+      --jobs or --async, lines wait concurrently, so this can add up to
+      more than the run took.
+    - evaluate: the check logic itself, comparing the answers
+    - format: printing each line's result
+
+    Each phase is timed once per line; nothing is timed at all unless a
+    Timings instance is passed in.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.elapsed = None
+        # phase -> [lines, total seconds, max seconds]
+        self.phases = dict((p, [0, 0.0, 0.0]) for p in PHASES)
+        # server -> [lookups, queries sent, seconds waiting on queries sent]
+        self.servers = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        """
+        Add one line's time in phase
+        """
+        with self._lock:
+            p = self.phases[phase]
+            p[0] += 1
+            p[1] += seconds
+            if seconds > p[2]:
+                p[2] = seconds
+
+    def _server(self, server):
+        s = self.servers.get(server)
+        if s is None:
+            s = self.servers[server] = [0, 0, 0.0]
+        return s
+
+    def sent(self, server, seconds, count=1):
+        """
+        Record count queries sent to server together, taking seconds
+        """
+        with self._lock:
+            s = self._server(server)
+            s[1] += count
+            s[2] += seconds
+
+    def check(self, gen):
+        """
+        Wrap the generator of a check (see DNStestChecks.steps()), timing
+        the check's own code as the evaluate phase and the time until each
+        list of queries it yields is answered as the query phase, and
+        counting the lookups made against each server
+        """
+        evaluate = query = 0.0
+        answers = None
+        while True:
+            start = time.time()
+            try:
+                queries = gen.send(answers)
+            except StopIteration:
+                evaluate += time.time() - start
+                break
+            sent = time.time()
+            evaluate += sent - start
+            with self._lock:
+                for q in queries:
+                    self._server(q[2])[0] += 1
+            answers = yield queries
+            query += time.time() - sent
+        self.add('evaluate', evaluate)
+        self.add('query', query)
+
+    def finish(self):
+        """
+        Note the end of the run
+        """
+        self.elapsed = time.time() - self.start
+
+    def to_dict(self):
+        """
+        Return the timings as a dict, for export as JSON
+        """
+        elapsed = self.elapsed
+        if elapsed is None:
+            elapsed = time.time() - self.start
+        with self._lock:
+            phases = {}
+            for name in PHASES:
+                lines, total, most = self.phases[name]
+                phases[name] = {'lines': lines, 'total': total, 'max': most,
+                                'mean': total / lines if lines else 0.0}
+            servers = {}
+            for name, (lookups, queries, seconds) in self.servers.items():
+                servers[name] = {'lookups': lookups, 'queries': queries, 'query_seconds': seconds}
+        return {'elapsed': elapsed, 'phases': phases, 'servers': servers}
+
+    def report(self):
+        """
+        Return a list of lines summarizing the timings
+        """
+        d = self.to_dict()
+        lines = ["timings for %.3fs run:" % d['elapsed']]
+        for name in PHASES:
+            p = d['phases'][name]
+            lines.append("  %-8s %10.3fs total  %9.3fms/line  %9.3fms max  (%d lines)" % (
+                name, p['total'], p['mean'] * 1000, p['max'] * 1000, p['lines']))
+        for name in sorted(d['servers']):
+            s = d['servers'][name]
+            lines.append("  server %s: %d lookups, %d queries sent (%.3fs)" % (
+                name, s['lookups'], s['queries'], s['query_seconds']))
+        return lines
+
+    def write(self, path):
+        """
+        Write the timings to path as JSON
+        """
+        with open(path, 'w') as fh:
+            json.dump(self.to_dict(), fh, indent=2, sort_keys=True)
+            fh.write('\n')
+
+
+class TimedParser(object):
+    """
+    Wraps a DnstestParser, timing each parse_record() call as the parse phase
+    """
+
+    def __init__(self, parser, timings):
+        self.parser = parser
+        self.timings = timings
+
+    def parse_record(self, line):
+        start = time.time()
+        try:
+            return self.parser.parse_record(line)
+        finally:
+            self.timings.add('parse', time.time() - start)
+
+    def parse_line(self, line):
+        return self.parse_record(line).to_dict()
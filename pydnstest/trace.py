@@ -0,0 +1,171 @@
+"""
+JSON-lines trace of every DNS query made during a dnstest run
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+import threading
+import time
+
+try:
+    from queue import Queue
+except ImportError:  # python 2
+    from Queue import Queue
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # python < 3.7
+    ContextVar = None
+
+if ContextVar is not None:
+    # asyncio tasks each get a copy of the context they were created in
+    _line = ContextVar('pydnstest_line', default=None)
+
+    def set_line(n):
+        """
+        Set the input line number that queries made from here on (in this
+        thread, or asyncio task) are traced as being for
+        """
+        _line.set(n)
+
+    def current_line():
+        """
+        Return the input line number set with set_line(), or None
+        """
+        return _line.get()
+else:
+    _local = threading.local()
+
+    def set_line(n):
+        """
+        Set the input line number that queries made from here on (in this
+        thread) are traced as being for
+        """
+        _local.line = n
+
+    def current_line():
+        """
+        Return the input line number set with set_line(), or None
+        """
+        return getattr(_local, 'line', None)
+
+#: the "cache" field of a query answered by the query cache
+HIT = 'hit'
+
+#: the "cache" field of a query sent to the server (or waiting on the same
+#: query already in flight)
+MISS = 'miss'
+
+#: the "cache" field of a query answered by a --replay cassette
+REPLAY = 'replay'
+
+_STOP = object()
+
+
+class QueryTrace(object):
+    """
+    Writes one JSON object per line to a file for every DNS query made,
+    with the fields:
+
+    - line: input line number the query was made for (see set_line()), or null
+    - server, port, qname, qtype: the query
+    - start: when the query was made (seconds since the epoch)
+    - rtt_ms: milliseconds until it was answered (or failed)
+    - rcode: the response status (i.e. NOERROR, NXDOMAIN), or 'timeout' or
+      'error' if the query failed
+    - answers: number of answer records
+    - cache: HIT, MISS or REPLAY
+
+    Entries are encoded and written by a background thread, so tracing
+    adds only a queue put to each query; they are in the order the
+    queries were answered.
+    """
+
+    def __init__(self, path):
+        """
+        @param path file to write the trace to (truncated)
+        """
+        self.path = path
+        self.count = 0
+        self._fh = open(path, 'w')
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._write)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def query(self, key, start, result, cache, error=None):
+        """
+        Trace a query
+
+        @param key (name, server, port, qtype) of the query
+        @param start time.time() when the query was made
+        @param result the pydns DnsResult, or None if it failed
+        @param cache HIT, MISS or REPLAY
+        @param error the exception the query raised, if it failed
+        """
+        self._queue.put((current_line(), key, start, time.time(), result, cache, error))
+
+    def _entry(self, item):
+        line, (name, server, port, qtype), start, end, result, cache, error = item
+        if result is not None:
+            rcode, answers = result.header['status'], len(result.answers)
+        else:
+            import DNS
+            rcode = 'timeout' if isinstance(error, DNS.TimeoutError) else 'error'
+            answers = 0
+        return {'line': line, 'server': server, 'port': port, 'qname': name, 'qtype': qtype,
+                'start': round(start, 6), 'rtt_ms': round((end - start) * 1000, 3),
+                'rcode': rcode, 'answers': answers, 'cache': cache}
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            self._fh.write(json.dumps(self._entry(item), sort_keys=True) + '\n')
+            self.count += 1
+        self._fh.close()
+
+    def close(self):
+        """
+        Write out any queued entries and close the file
+        """
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,472 @@
+"""
+Low-level DNS query transport for pydnstest
+
+Sends queries over sockets directly rather than through DNS.Request, so
+that several questions to one server can be in flight at the same time.
+Packets are still built and decoded with pydns, so the results are the
+same DnsResult objects that DNS.Request returns.
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import socket
+import select
+import threading
+import time
+from random import SystemRandom
+
+import DNS
+from DNS import Lib, Class
+
+from pydnstest.wire import QueryEncoder, encode_query, decode_reply
+
+# transaction IDs should be unpredictable, as in pydns
+_random = SystemRandom()
+
+# pydns' DNS.Type has no IXFR
+IXFR = 251
+
+
+def new_query_id(in_use=()):
+    """
+    Return a random 16-bit transaction ID that is not in in_use
+    """
+    tid = _random.randint(0, 65535)
+    while tid in in_use:
+        tid = _random.randint(0, 65535)
+    return tid
+
+
+def reply_id(reply):
+    """
+    Return the transaction ID of a wire-format reply, or None if it's too
+    short to be a DNS message
+    """
+    if len(reply) < 12:
+        return None
+    return Lib.unpack16bit(reply[:2])
+
+
+def _new_socket(server, socktype):
+    """
+    Return a new socket of socktype for talking to server (IPv4 or IPv6)
+    """
+    if server.count(':'):
+        return socket.socket(socket.AF_INET6, socktype)
+    return socket.socket(socket.AF_INET, socktype)
+
+
+def _decode(reply, name, qtype, server, port, start):
+    """
+    Decode a wire-format reply to the query for name/qtype sent to
+    server:port at start into a pydns DnsResult (or equivalent
+    pydnstest.wire.Reply)
+    """
+    args = {'name': name, 'qtype': qtype, 'server': server, 'port': port,
+            'elapsed': (time.time() - start) * 1000}
+    return decode_reply(reply, args)
+
+
+class UDPTransport(object):
+    """
+    Sends queries over UDP, one socket per call, retrying truncated replies
+    over a new TCP connection.
+    """
+
+    def __init__(self, timeout=None, rtt=None):
+        """
+        @param timeout seconds to wait for replies (default: pydns' default)
+        @param rtt optional pydnstest.rtt.RTTEstimator; if given, its
+          per-server timeouts and retransmissions are used instead of timeout
+        """
+        if timeout is None:
+            timeout = DNS.defaults['timeout']
+        self.timeout = timeout
+        self.rtt = rtt
+        # per-thread QueryEncoder
+        self._local = threading.local()
+
+    def _encoder(self):
+        """
+        Return this thread's QueryEncoder
+        """
+        enc = getattr(self._local, 'encoder', None)
+        if enc is None:
+            enc = self._local.encoder = QueryEncoder()
+        return enc
+
+    def query(self, name, server, qtype, port=53):
+        """
+        Send a single query, returning the pydns DnsResult for the reply
+        """
+        return self.query_many([(name, qtype)], server, port)[0]
+
+    def query_many(self, questions, server, port=53):
+        """
+        Send one query for each (name, qtype) in questions to the server at
+        the same time, and return a list of the DnsResults for the replies
+        in the same order.
+        """
+        sock = _new_socket(server, socket.SOCK_DGRAM)
+        try:
+            sock.connect((server, port))
+            results = self._query_udp(sock, questions, server, port)
+        except socket.error as e:
+            raise DNS.SocketError(e)
+        finally:
+            sock.close()
+        return self._retry_truncated(results, questions, server, port)
+
+    def _retry_truncated(self, results, questions, server, port):
+        """
+        Replace each truncated (TC) reply in results with the reply to the
+        same question sent over TCP
+        """
+        for i, r in enumerate(results):
+            if r.header['tc']:
+                results[i] = self.query_tcp(questions[i][0], server, questions[i][1], port)
+        return results
+
+    def query_tcp(self, name, server, qtype, port=53):
+        """
+        Send a single query over a new TCP connection, returning the pydns
+        DnsResult
+        """
+        sock = _new_socket(server, socket.SOCK_STREAM)
+        start = time.time()
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect((server, port))
+            reply = self._exchange_tcp(sock, name, qtype, start + self.timeout)
+        except socket.timeout:
+            raise DNS.TimeoutError('Timeout')
+        except socket.error as e:
+            raise DNS.SocketError(e)
+        finally:
+            sock.close()
+        return _decode(reply, name, qtype, server, port, start)
+
+    def _exchange_tcp(self, sock, name, qtype, deadline):
+        """
+        Send a query on a connected TCP socket and return the wire-format
+        reply to it, skipping any stale replies to earlier queries
+        """
+        tid = new_query_id()
+        query = self._encoder().encode(tid, name, qtype)
+        sock.sendall(Lib.pack16bit(len(query)) + query.tobytes())
+        reply = None
+        while reply_id(reply or b'') != tid:
+            count = Lib.unpack16bit(_recv_exactly(sock, 2, deadline))
+            reply = _recv_exactly(sock, count, deadline)
+        return reply
+
+    def _query_udp(self, sock, questions, server, port):
+        """
+        Send the questions on a connected UDP socket and collect the replies,
+        retransmitting unanswered ones if there's an RTTEstimator
+        """
+        start = time.time()
+        pending = {}
+        enc = self._encoder()
+        for i, (name, qtype) in enumerate(questions):
+            tid = new_query_id(pending)
+            pending[tid] = i
+            sock.send(enc.encode(tid, name, qtype))
+        results = [None] * len(questions)
+        if self.rtt is None:
+            timeout, retries = self.timeout, 0
+        else:
+            timeout, retries = self.rtt.rto(server, port), self.rtt.retries
+        attempt = 0
+        deadline = start + timeout
+        while pending:
+            r, w, e = select.select([sock], [], [], max(0, deadline - time.time()))
+            if not r:
+                if attempt >= retries:
+                    raise DNS.TimeoutError('Timeout')
+                attempt += 1
+                timeout = self.rtt.backoff(timeout)
+                deadline = time.time() + timeout
+                # same IDs, so that a late reply to the first send still counts
+                for tid, i in pending.items():
+                    sock.send(enc.encode(tid, questions[i][0], questions[i][1]))
+                continue
+            reply = sock.recv(65535)
+            i = pending.pop(reply_id(reply), None)
+            if i is None:
+                # stale reply to an earlier query on this socket, or bogus
+                continue
+            if attempt == 0 and self.rtt is not None:
+                self.rtt.sample(server, port, time.time() - start)
+            name, qtype = questions[i]
+            results[i] = _decode(reply, name, qtype, server, port, start)
+        return results
+
+
+def _recv_exactly(sock, count, deadline):
+    """
+    Read exactly count bytes from a TCP socket before the deadline
+    """
+    buf = b''
+    while len(buf) < count:
+        sock.settimeout(max(0.001, deadline - time.time()))
+        try:
+            data = sock.recv(count - len(buf))
+        except socket.timeout:
+            raise DNS.TimeoutError('Timeout')
+        if not data:
+            raise DNS.SocketError('connection closed by server')
+        buf += data
+    return buf
+
+
+class SocketPool(object):
+    """
+    Thread-safe pool of connected sockets, per (protocol, server, port).
+    UDP sockets and TCP connections are handed out to one caller at a time
+    and kept open for reuse when released, instead of being opened and closed
+    for every query.
+    """
+
+    def __init__(self, max_idle=8, connect_timeout=None):
+        """
+        @param max_idle maximum number of idle sockets to keep per
+          (protocol, server, port); extras are closed when released
+        @param connect_timeout seconds to wait for TCP connections
+          (default: pydns' default timeout)
+        """
+        if connect_timeout is None:
+            connect_timeout = DNS.defaults['timeout']
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+        self.created = 0
+        self.reused = 0
+        # (protocol, server, port) -> list of idle sockets
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, protocol, server, port):
+        """
+        Return a connected socket for protocol ('udp' or 'tcp') to
+        server:port, reusing an idle one if there is one
+        """
+        key = (protocol, server, port)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop()
+            self.created += 1
+        if protocol == 'tcp':
+            sock = _new_socket(server, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            sock.settimeout(self.connect_timeout)
+        else:
+            sock = _new_socket(server, socket.SOCK_DGRAM)
+        try:
+            sock.connect((server, port))
+        except socket.error:
+            sock.close()
+            raise
+        return sock
+
+    def release(self, protocol, server, port, sock):
+        """
+        Return a socket obtained from acquire() to the pool
+        """
+        with self._lock:
+            idle = self._idle.setdefault((protocol, server, port), [])
+            if len(idle) < self.max_idle:
+                idle.append(sock)
+                return
+        sock.close()
+
+    def discard(self, sock):
+        """
+        Close a socket obtained from acquire() that is no longer usable
+        """
+        sock.close()
+
+    def close(self):
+        """
+        Close all idle sockets
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for socks in idle.values():
+            for sock in socks:
+                sock.close()
+
+
+class PooledTransport(UDPTransport):
+    """
+    Sends queries over UDP using sockets from a SocketPool, retrying
+    truncated replies over a pooled (kept-alive) TCP connection.
+    """
+
+    def __init__(self, pool=None, timeout=None, rtt=None):
+        """
+        @param pool SocketPool to take sockets from (default: a new one)
+        @param timeout seconds to wait for replies (default: pydns' default)
+        @param rtt optional pydnstest.rtt.RTTEstimator (see UDPTransport)
+        """
+        super(PooledTransport, self).__init__(timeout=timeout, rtt=rtt)
+        if pool is None:
+            pool = SocketPool()
+        self.pool = pool
+
+    def query_many(self, questions, server, port=53):
+        """
+        Send one query for each (name, qtype) in questions to the server at
+        the same time, and return a list of the DnsResults for the replies
+        in the same order.
+        """
+        try:
+            sock = self.pool.acquire('udp', server, port)
+        except socket.error as e:
+            raise DNS.SocketError(e)
+        try:
+            results = self._query_udp(sock, questions, server, port)
+        except DNS.TimeoutError:
+            # late replies are told apart by transaction ID, so the socket
+            # can still be reused
+            self.pool.release('udp', server, port, sock)
+            raise
+        except socket.error as e:
+            self.pool.discard(sock)
+            raise DNS.SocketError(e)
+        self.pool.release('udp', server, port, sock)
+        return self._retry_truncated(results, questions, server, port)
+
+    def query_tcp(self, name, server, qtype, port=53):
+        """
+        Send a single query over a pooled TCP connection, returning the
+        pydns DnsResult. A reused connection that the server has since
+        closed is replaced with a new one.
+        """
+        for attempt in (1, 2):
+            try:
+                sock = self.pool.acquire('tcp', server, port)
+            except socket.error as e:
+                raise DNS.SocketError(e)
+            start = time.time()
+            try:
+                reply = self._exchange_tcp(sock, name, qtype, start + self.timeout)
+            except (socket.error, DNS.SocketError) as e:
+                self.pool.discard(sock)
+                if attempt == 1:
+                    continue
+                raise DNS.SocketError(e)
+            except DNS.TimeoutError:
+                # an answer may still arrive later and confuse the next query
+                self.pool.discard(sock)
+                raise
+            self.pool.release('tcp', server, port, sock)
+            return _decode(reply, name, qtype, server, port, start)
+
+
+def zone_transfer(zone, server, port=53, timeout=None, soa=None):
+    """
+    Transfer a zone over TCP, returning the list of record dicts (as in a
+    pydns DnsResult's answers) from all of the reply messages.
+
+    Without soa, this is a full transfer (AXFR): the zone's SOA record, all
+    other records, and the SOA again.
+
+    With soa (the SOA record dict of a version we already have), this is an
+    incremental transfer (IXFR, RFC 1995). The reply is either just the
+    current SOA (no changes), a full transfer as above, or the current SOA
+    followed by (old SOA, deleted records, new SOA, added records) blocks
+    and the current SOA again.
+    """
+    if timeout is None:
+        timeout = DNS.defaults['timeout']
+    tid = new_query_id()
+    if soa is None:
+        qtype = 'AXFR'
+        query = encode_query(tid, zone, qtype)
+    else:
+        qtype = 'IXFR'
+        m = Lib.Mpacker()
+        m.addHeader(tid, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1, 0)
+        m.addQuestion(zone, IXFR, Class.IN)
+        d = soa['data']
+        m.addSOA(soa['name'], Class.IN, soa['ttl'], d[0], d[1], d[2][1], d[3][1], d[4][1], d[5][1], d[6][1])
+        query = m.getbuf()
+    sock = _new_socket(server, socket.SOCK_STREAM)
+    start = time.time()
+    deadline = start + timeout
+    records = []
+    try:
+        sock.settimeout(timeout)
+        sock.connect((server, port))
+        sock.sendall(Lib.pack16bit(len(query)) + query)
+        while True:
+            count = Lib.unpack16bit(_recv_exactly(sock, 2, deadline))
+            reply = _recv_exactly(sock, count, deadline)
+            if reply_id(reply) != tid:
+                continue
+            r = _decode(reply, zone, qtype, server, port, start)
+            if r.header['status'] != 'NOERROR':
+                raise DNS.DNSError('zone transfer of %s from %s failed: %s' % (zone, server, r.header['status']))
+            records.extend(r.answers)
+            if not records or records[0]['typename'] != 'SOA':
+                raise DNS.DNSError('zone transfer of %s from %s did not start with SOA' % (zone, server))
+            if _transfer_done(records, soa):
+                return records
+    except socket.error as e:
+        raise DNS.SocketError(e)
+    finally:
+        sock.close()
+
+
+def _transfer_done(records, soa):
+    """
+    Whether the records received so far are a complete transfer
+    """
+    serial = records[0]['data'][2][1]
+    if len(records) == 1:
+        # IXFR reply when we're already up to date
+        return soa is not None and soa['data'][2][1] == serial
+    last = records[-1]
+    if last['typename'] != 'SOA' or last['data'][2][1] != serial:
+        return False
+    if soa is None or records[1]['typename'] != 'SOA':
+        # full transfer; ends with the SOA again
+        return True
+    # incremental; the SOAs in between come in (old, new) pairs, so the
+    # closing SOA makes the total even
+    return len([rr for rr in records if rr['typename'] == 'SOA']) % 2 == 0
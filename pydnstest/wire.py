@@ -0,0 +1,290 @@
+"""
+Minimal wire-format DNS message codec for dnstest.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import struct
+import sys
+
+import DNS
+from DNS import Lib, Type, Class, Opcode, Status
+
+_header = struct.Struct('!HHHHHH')
+_rr = struct.Struct('!HHIH')
+_u8 = struct.Struct('!B')
+_u16 = struct.Struct('!H')
+_a = struct.Struct('!BBBB')
+_soa = struct.Struct('!IIIII')
+
+# record types decode_reply() handles itself; anything else in a reply is
+# handed to pydns so that results are always identical to its DnsResult
+_rdata_types = (Type.A, Type.CNAME, Type.PTR, Type.NS, Type.SOA)
+
+
+def _label_encoding():
+    if DNS.LABEL_UTF8:
+        return 'utf8'
+    return DNS.LABEL_ENCODING
+
+
+# pydns for python 2 encodes labels when packing, but leaves the ones it
+# unpacks as (byte) strings
+_DECODE_LABELS = sys.version_info[0] >= 3
+
+
+def encode_name(name):
+    """
+    Return the wire-format (uncompressed) encoding of a domain name
+    """
+    enc = _label_encoding()
+    out = bytearray()
+    for label in name.split('.'):
+        if not label:
+            continue
+        b = label.encode(enc)
+        if len(b) > 63:
+            raise Lib.PackError('label too long')
+        out.append(len(b))
+        out += b
+    out.append(0)
+    return bytes(out)
+
+
+def _question_tail(qtype):
+    """
+    Return the encoded QTYPE and QCLASS (IN) that follow the QNAME
+    """
+    return _u16.pack(getattr(Type, qtype)) + _u16.pack(Class.IN)
+
+
+def encode_query(tid, name, qtype):
+    """
+    Return the wire-format query packet for name/qtype (i.e. 'A'),
+    class IN, recursion desired, with transaction ID tid
+    """
+    return _header.pack(tid, 0x0100, 1, 0, 0, 0) + encode_name(name) + _question_tail(qtype)
+
+
+class QueryEncoder(object):
+    """
+    Builds query packets (class IN, recursion desired) in one reusable
+    buffer. The header is encoded once; each query only writes its
+    transaction ID, the (cached) encoded QNAME and the QTYPE/QCLASS
+    template for its qtype. Not thread-safe; use one per thread.
+    """
+
+    # header + longest legal name + QTYPE/QCLASS
+    max_size = 12 + 255 + 4
+    # how many encoded names to keep
+    max_names = 10000
+
+    def __init__(self):
+        self.buf = bytearray(self.max_size)
+        self.view = memoryview(self.buf)
+        _header.pack_into(self.buf, 0, 0, 0x0100, 1, 0, 0, 0)
+        # qtype -> encoded QTYPE/QCLASS
+        self.tails = {}
+        # name -> encoded QNAME
+        self.qnames = {}
+
+    def encode(self, tid, name, qtype):
+        """
+        Return the query packet for name/qtype with transaction ID tid, as a
+        memoryview that is only valid until the next call
+        """
+        qname = self.qnames.get(name)
+        if qname is None:
+            qname = encode_name(name)
+            if len(qname) > 255:
+                raise Lib.PackError('name too long')
+            if len(self.qnames) >= self.max_names:
+                self.qnames.clear()
+            self.qnames[name] = qname
+        tail = self.tails.get(qtype)
+        if tail is None:
+            tail = self.tails[qtype] = _question_tail(qtype)
+        end = 12 + len(qname)
+        _u16.pack_into(self.buf, 0, tid)
+        self.buf[12:end] = qname
+        self.buf[end:end + 4] = tail
+        return self.view[:end + 4]
+
+
+class Reply(object):
+    """
+    Decoded DNS reply, with the same attributes and contents as a pydns
+    DnsResult (header, questions, answers, authority, additional, args).
+    """
+
+    def __init__(self, header, questions, answers, authority, additional, args):
+        self.header = header
+        self.questions = questions
+        self.answers = answers
+        self.authority = authority
+        self.additional = additional
+        self.args = args
+
+
+class _Decoder(object):
+    """
+    Decodes names and records directly out of one reply buffer
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.view = memoryview(buf)
+        self.enc = _label_encoding()
+        # offset -> decoded name, since compression points back at the
+        # same few names over and over
+        self.names = {}
+
+    def label(self, start, length):
+        raw = self.view[start:start + length].tobytes()
+        if not _DECODE_LABELS:
+            return raw
+        if self.enc == 'idna':
+            # IDNA only changes non-ASCII and xn-- labels; skip the codec
+            # for the rest
+            try:
+                s = raw.decode('ascii')
+                if not s[:4].lower() == 'xn--':
+                    return s
+            except UnicodeDecodeError:
+                pass
+        return raw.decode(self.enc)
+
+    def name(self, offset):
+        """
+        Return (name, offset just past it) for the name at offset
+        """
+        start = offset
+        labels = []
+        end = None
+        hops = 0
+        while True:
+            if offset in self.names:
+                labels.append(self.names[offset])
+                break
+            length = _u8.unpack_from(self.buf, offset)[0]
+            if length & 0xC0 == 0xC0:
+                if end is None:
+                    end = offset + 2
+                hops += 1
+                if hops > 64:
+                    raise Lib.UnpackError('compression loop')
+                offset = _u16.unpack_from(self.buf, offset)[0] & 0x3FFF
+                continue
+            if length == 0:
+                offset += 1
+                break
+            if offset + 1 + length > len(self.buf):
+                raise Lib.UnpackError('not enough data left')
+            labels.append(self.label(offset + 1, length))
+            offset += 1 + length
+        if end is None:
+            end = offset
+        name = '.'.join(labels)
+        self.names[start] = name
+        return name, end
+
+    def rr(self, offset):
+        """
+        Return (record dict, offset of the next record) for the resource
+        record at offset, or (None, None) if it isn't one of _rdata_types
+        """
+        name, offset = self.name(offset)
+        if offset + 10 > len(self.buf):
+            raise Lib.UnpackError('not enough data left')
+        rtype, klass, ttl, rdlength = _rr.unpack_from(self.buf, offset)
+        if rtype not in _rdata_types:
+            return None, None
+        offset += 10
+        rdend = offset + rdlength
+        if rdend > len(self.buf):
+            raise Lib.UnpackError('not enough data left')
+        if rtype == Type.A:
+            data = '%d.%d.%d.%d' % _a.unpack_from(self.buf, offset)
+        elif rtype == Type.SOA:
+            mname, o = self.name(offset)
+            rname, o = self.name(o)
+            serial, refresh, retry, expire, minimum = _soa.unpack_from(self.buf, o)
+            data = (mname, rname, ('serial', serial), ('refresh ',) + Lib.prettyTime(refresh),
+                    ('retry',) + Lib.prettyTime(retry), ('expire',) + Lib.prettyTime(expire),
+                    ('minimum',) + Lib.prettyTime(minimum))
+        else:
+            # CNAME, PTR, NS
+            data = self.name(offset)[0]
+        return ({'name': name, 'type': rtype, 'class': klass, 'ttl': ttl, 'rdlength': rdlength,
+                 'typename': Type.typestr(rtype), 'classstr': Class.classstr(klass), 'data': data},
+                rdend)
+
+
+def decode_reply(buf, args):
+    """
+    Decode a wire-format reply into a Reply (or, if it contains record
+    types other than A, CNAME, PTR, NS and SOA, a pydns DnsResult)
+
+    @param args dict of request arguments to attach to the result
+    """
+    if len(buf) < 12:
+        raise Lib.UnpackError('not enough data left')
+    tid, flags, qdcount, ancount, nscount, arcount = _header.unpack_from(buf, 0)
+    header = {'id': tid, 'qr': (flags >> 15) & 1, 'opcode': (flags >> 11) & 0xF,
+              'aa': (flags >> 10) & 1, 'tc': (flags >> 9) & 1, 'rd': (flags >> 8) & 1,
+              'ra': (flags >> 7) & 1, 'z': (flags >> 4) & 7, 'rcode': flags & 0xF,
+              'qdcount': qdcount, 'ancount': ancount, 'nscount': nscount, 'arcount': arcount}
+    header['opcodestr'] = Opcode.opcodestr(header['opcode'])
+    header['status'] = Status.statusstr(header['rcode'])
+    d = _Decoder(buf)
+    offset = 12
+    questions = []
+    for i in range(qdcount):
+        qname, offset = d.name(offset)
+        qtype, qclass = struct.unpack_from('!HH', buf, offset)
+        offset += 4
+        questions.append({'qname': qname, 'qtype': qtype, 'qclass': qclass,
+                          'qtypestr': Type.typestr(qtype), 'qclassstr': Class.classstr(qclass)})
+    sections = []
+    for count in (ancount, nscount, arcount):
+        records = []
+        for i in range(count):
+            r, offset = d.rr(offset)
+            if r is None:
+                return Lib.DnsResult(Lib.Munpacker(buf), args)
+            records.append(r)
+        sections.append(records)
+    return Reply(header, questions, sections[0], sections[1], sections[2], args)
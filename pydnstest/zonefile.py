@@ -0,0 +1,577 @@
+"""
+Offline resolver backend answering from BIND master (zone) files for pydnstest
+
+The latest version of this package is available at:
+<https://github.com/jantman/pydnstest>
+
+##################################################################################
+Copyright 2013-2017 Jason Antman <jason@jasonantman.com>
+
+    This file is part of pydnstest.
+
+    pydnstest is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    pydnstest is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with Foobar.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/pydnstest> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+
+from DNS import Type
+
+from pydnstest.dns import reverse_name
+
+# index file layout (all little-endian):
+#   header: magic, length of the JSON metadata, number of hash buckets, number of records
+#   JSON metadata: zone, serial, the (path, size, mtime) of each source file
+#     and the (lower-case) names of the zone's wildcards
+#   hash table: one (crc32 of lower-case name, offset of name's node or 0 if empty) entry per bucket
+#   nodes: name length, lower-case name, record count, then (type, ttl, data length, data) per record;
+#     empty non-terminals have nodes with no records
+_MAGIC = b'PDTZIDX3'
+_HEADER = struct.Struct('<8sIIQ')
+_ENTRY = struct.Struct('<IQ')
+_U16 = struct.Struct('<H')
+_RECORD = struct.Struct('<HIH')
+
+# seconds per BIND TTL unit suffix
+_TTL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+_CLASSES = ('IN', 'CH', 'HS', 'CS')
+
+# record types whose data is a single domain name
+_NAME_TYPES = ('CNAME', 'PTR', 'NS', 'DNAME')
+
+
+class ZoneFileError(ValueError):
+    """
+    Raised for zone files that can't be read or parsed
+    """
+    pass
+
+
+def _lower(name):
+    return name.lower().rstrip('.')
+
+
+def parse_ttl(s):
+    """
+    Parse a TTL in seconds, or with BIND unit suffixes (i.e. '1h30m')
+    """
+    if s.isdigit():
+        return int(s)
+    total = 0
+    num = ''
+    for c in s.lower():
+        if c.isdigit():
+            num += c
+        elif c in _TTL_UNITS and num:
+            total += int(num) * _TTL_UNITS[c]
+            num = ''
+        else:
+            raise ValueError('invalid TTL: %s' % s)
+    if num:
+        total += int(num)
+    return total
+
+
+def _is_ttl(s):
+    try:
+        parse_ttl(s)
+    except ValueError:
+        return False
+    return True
+
+
+def _tokenize(fh, fname):
+    """
+    Generator of (line number, tokens, starts with whitespace) for each
+    logical line of a master file, joining lines in parentheses and
+    dropping comments
+    """
+    tokens = []
+    indented = False
+    start = 0
+    depth = 0
+    for lineno, line in enumerate(fh, 1):
+        if depth == 0:
+            tokens = []
+            indented = line[:1] in (' ', '\t')
+            start = lineno
+        i = 0
+        n = len(line)
+        while i < n:
+            c = line[i]
+            if c == ';':
+                break
+            if c in ' \t\r\n':
+                i += 1
+            elif c == '(':
+                depth += 1
+                i += 1
+            elif c == ')':
+                if depth == 0:
+                    raise ZoneFileError('%s:%d: unbalanced parentheses' % (fname, lineno))
+                depth -= 1
+                i += 1
+            elif c == '"':
+                j = line.find('"', i + 1)
+                while j != -1 and line[j - 1] == '\\':
+                    j = line.find('"', j + 1)
+                if j == -1:
+                    raise ZoneFileError('%s:%d: unterminated string' % (fname, lineno))
+                tokens.append(line[i:j + 1])
+                i = j + 1
+            else:
+                j = i
+                while j < n and line[j] not in ' \t\r\n;()"':
+                    j += 1
+                tokens.append(line[i:j])
+                i = j
+        if depth == 0 and tokens:
+            yield start, tokens, indented
+    if depth != 0:
+        raise ZoneFileError('%s:%d: unbalanced parentheses' % (fname, start))
+
+
+def _absolute(name, origin):
+    """
+    Return an absolute name (without the trailing dot, and in the case it
+    was written in) for a name from a master file
+    """
+    if name.endswith('.'):
+        return name.rstrip('.')
+    if not origin:
+        raise ValueError('relative name %s, but no $ORIGIN or zone given' % name)
+    if name == '@':
+        return origin
+    return name + '.' + origin
+
+
+def _rdata(typename, fields, origin):
+    """
+    Return the data of a record as pydns returns it for A, CNAME and PTR
+    records; other types are kept as their (space-separated) master file
+    text, with any domain names made absolute
+    """
+    if typename == 'A':
+        return fields[0]
+    if typename in _NAME_TYPES:
+        return _absolute(fields[0], origin)
+    if typename == 'MX':
+        return '%s %s' % (fields[0], _absolute(fields[1], origin))
+    if typename == 'SOA':
+        if len(fields) != 7:
+            raise IndexError(typename)
+        return ' '.join([_absolute(fields[0], origin), _absolute(fields[1], origin)] +
+                        [str(parse_ttl(f)) for f in fields[2:7]])
+    return ' '.join(fields)
+
+
+def parse_zone_file(path, origin=None, default_ttl=None, sources=None):
+    """
+    Generator of (name, ttl, typename, data) tuples for each record in a
+    BIND master file, following $ORIGIN, $TTL and $INCLUDE directives.
+    Names are absolute and without the trailing dot, in the case they were
+    written in. Raises ZoneFileError for anything it can't parse.
+
+    @param origin the zone's origin, if the file doesn't set it with $ORIGIN
+    @param default_ttl TTL for records without one, if the file doesn't set
+      it with $TTL
+    @param sources if given, a list that the path of this file and every
+      file it $INCLUDEs is appended to as it's read
+    """
+    origin = origin.rstrip('.') if origin else ''
+    ttl = default_ttl
+    owner = None
+    if sources is not None:
+        sources.append(path)
+    try:
+        fh = open(path)
+    except (IOError, OSError) as e:
+        raise ZoneFileError('could not read zone file %s: %s' % (path, e))
+    with fh:
+        for lineno, tokens, indented in _tokenize(fh, path):
+            where = '%s:%d' % (path, lineno)
+            if tokens[0].upper() == '$ORIGIN':
+                origin = _absolute(tokens[1], origin)
+                continue
+            if tokens[0].upper() == '$TTL':
+                ttl = parse_ttl(tokens[1])
+                continue
+            if tokens[0].upper() == '$INCLUDE':
+                inc = tokens[1]
+                if not os.path.isabs(inc):
+                    inc = os.path.join(os.path.dirname(path), inc)
+                inc_origin = _absolute(tokens[2], origin) if len(tokens) > 2 else origin
+                for rec in parse_zone_file(inc, origin=inc_origin, default_ttl=ttl, sources=sources):
+                    yield rec
+                continue
+            if tokens[0].startswith('$'):
+                raise ZoneFileError('%s: unsupported directive %s' % (where, tokens[0]))
+            if not indented:
+                try:
+                    owner = _absolute(tokens.pop(0), origin)
+                except ValueError as e:
+                    raise ZoneFileError('%s: %s' % (where, e))
+            if owner is None:
+                raise ZoneFileError('%s: record without an owner name' % where)
+            # [ttl] [class] type, or [class] [ttl] type
+            rttl = None
+            while tokens and (tokens[0].upper() in _CLASSES or (rttl is None and _is_ttl(tokens[0]))):
+                t = tokens.pop(0)
+                if t.upper() not in _CLASSES:
+                    rttl = parse_ttl(t)
+            if not tokens:
+                raise ZoneFileError('%s: record without a type' % where)
+            typename = tokens.pop(0).upper()
+            try:
+                data = _rdata(typename, tokens, origin)
+            except IndexError:
+                raise ZoneFileError('%s: invalid %s record: too few fields' % (where, typename))
+            except ValueError as e:
+                raise ZoneFileError('%s: invalid %s record: %s' % (where, typename, e))
+            if rttl is None:
+                rttl = ttl
+            if rttl is None:
+                if typename != 'SOA':
+                    raise ZoneFileError('%s: record without a TTL, and no $TTL' % where)
+                # RFC 1035: the SOA minimum is the default TTL
+                rttl = ttl = int(data.split()[6])
+            yield (owner, rttl, typename, data)
+
+
+def _type_code(typename):
+    code = getattr(Type, typename, None)
+    if code is None and typename.startswith('TYPE') and typename[4:].isdigit():
+        code = int(typename[4:])
+    if code is None:
+        raise ZoneFileError('unknown record type %s' % typename)
+    return code
+
+
+_typenames = {}
+
+
+def _typestr(code):
+    t = _typenames.get(code)
+    if t is None:
+        t = _typenames[code] = Type.typestr(code)
+    return t
+
+
+def _compress(name, seen):
+    """
+    Compress a domain name as a server does in a reply: its longest suffix
+    that is already in the message is replaced by a pointer to it (matched
+    without regard to case, as with pydns and BIND). Returns the name's
+    length on the wire and the name as a resolver decodes it, i.e. with
+    the pointed-to suffix in the case it was first written in.
+
+    @param seen dict of (lower-case) name -> name as written, for every
+      name in the message so far and all of their suffixes; name's
+      suffixes are added to it
+    """
+    labels = name.split('.') if name else []
+    for i in range(len(labels)):
+        suffix = '.'.join(labels[i:])
+        if suffix.lower() in seen:
+            return (sum(len(label.encode('utf-8')) + 1 for label in labels[:i]) + 2,
+                    '.'.join(labels[:i] + [seen[suffix.lower()]]))
+        seen[suffix.lower()] = suffix
+    return sum(len(label.encode('utf-8')) + 1 for label in labels) + 1, name
+
+
+def _reply_data(typename, data, seen):
+    """
+    Return the (RDLENGTH, data) of a record in a server's reply (see
+    _compress()) for the types whose data the checks look at; other types
+    keep their data text, and its length
+    """
+    if typename == 'A':
+        return 4, data
+    if typename in _NAME_TYPES:
+        return _compress(data, seen)
+    if typename == 'MX':
+        return 2 + _compress(data.split()[1], seen)[0], data
+    return len(data.encode('utf-8')), data
+
+
+def _stat_sources(paths):
+    """
+    Return the [path, size, mtime] of each zone file path, to tell when an
+    index is out of date
+    """
+    found = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+        except OSError:
+            found.append([p, -1, -1])
+            continue
+        found.append([p, st.st_size, st.st_mtime])
+    return found
+
+
+def build_index(path, index_path, zone=None):
+    """
+    Parse a zone file and write its on-disk index to index_path
+    """
+    nodes = {}
+    nrecords = 0
+    soa = None
+    sources = []
+    for name, ttl, typename, data in parse_zone_file(path, origin=zone, sources=sources):
+        nodes.setdefault(name.lower(), []).append((_type_code(typename), ttl, data.encode('utf-8')))
+        nrecords += 1
+        if typename == 'SOA' and soa is None:
+            soa = (name, data)
+    if soa is None:
+        raise ZoneFileError('zone file %s has no SOA record' % path)
+    if zone is None:
+        zone = soa[0]
+    zone = _lower(zone)
+    # empty non-terminals, i.e. names in the zone with no records but with
+    # names below them, exist (RFC 4592), so they get nodes too
+    for name in list(nodes):
+        while name.endswith('.' + zone):
+            name = name.split('.', 1)[1]
+            if name in nodes:
+                break
+            nodes[name] = []
+    wildcards = sorted(n for n in nodes if n.startswith('*.'))
+    meta = json.dumps({'zone': zone, 'serial': int(soa[1].split()[2]),
+                       'sources': _stat_sources(sources), 'wildcards': wildcards}).encode('utf-8')
+    # keep the table at most half full, so probe sequences stay short
+    nbuckets = 8
+    while nbuckets < len(nodes) * 2:
+        nbuckets *= 2
+    mask = nbuckets - 1
+    table = bytearray(nbuckets * _ENTRY.size)
+    body = []
+    offset = _HEADER.size + len(meta) + len(table)
+    for name, records in nodes.items():
+        key = name.encode('utf-8')
+        h = zlib.crc32(key) & 0xffffffff
+        i = h & mask
+        while _ENTRY.unpack_from(table, i * _ENTRY.size)[1] != 0:
+            i = (i + 1) & mask
+        _ENTRY.pack_into(table, i * _ENTRY.size, h, offset)
+        node = [_U16.pack(len(key)), key, _U16.pack(len(records))]
+        for code, ttl, data in records:
+            node.append(_RECORD.pack(code, ttl, len(data)))
+            node.append(data)
+        node = b''.join(node)
+        body.append(node)
+        offset += len(node)
+    # write then rename, so an interrupted build can't leave a partial index
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(_HEADER.pack(_MAGIC, len(meta), nbuckets, nrecords))
+            fh.write(meta)
+            fh.write(table)
+            for node in body:
+                fh.write(node)
+        os.rename(tmp, index_path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def default_index_path(path):
+    """
+    Where to keep the index for a zone file: in the temporary directory,
+    named for the zone file's absolute path, so that nothing is ever
+    written next to the zone file (i.e. into a live BIND directory)
+    """
+    path = os.path.abspath(path)
+    digest = '%08x' % (zlib.crc32(path.encode('utf-8')) & 0xffffffff)
+    return os.path.join(tempfile.gettempdir(), 'pydnstest-%s-%s.pdtidx' % (os.path.basename(path), digest))
+
+
+class ZoneFileIndex(object):
+    """
+    A zone read from a BIND master file, through a memory-mapped on-disk
+    index (name hash -> records) that is built on first use and rebuilt
+    whenever the zone file changes. Lookups only decode the records for
+    the name asked about, so even huge zones are never loaded into Python
+    objects.
+
+    Usable wherever a pydnstest.snapshot.ZoneSnapshot is, i.e. added to a
+    SnapshotSet for the test or prod server.
+    """
+
+    def __init__(self, path, zone=None, index_path=None):
+        """
+        @param path path to the zone file
+        @param zone the zone's origin, if the file doesn't set it with $ORIGIN
+        @param index_path where to keep the index (see default_index_path())
+        """
+        self.path = path
+        if index_path is None:
+            index_path = default_index_path(path)
+        self.index_path = index_path
+        if not self._open(zone):
+            build_index(path, index_path, zone=zone)
+            if not self._open(zone):
+                raise ZoneFileError('could not read index %s for zone file %s' % (index_path, path))
+
+    def _open(self, zone):
+        """
+        Map the index file, returning False if it's missing or out of date
+        """
+        try:
+            fh = open(self.index_path, 'rb')
+        except (IOError, OSError):
+            return False
+        with fh:
+            try:
+                m = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error):
+                return False
+        try:
+            magic, meta_len, nbuckets, nrecords = _HEADER.unpack_from(m, 0)
+            meta = json.loads(m[_HEADER.size:_HEADER.size + meta_len].decode('utf-8'))
+        except (struct.error, ValueError):
+            magic = None
+        if magic != _MAGIC or not meta['sources'] or meta['sources'][0][0] != self.path or \
+                meta['sources'] != _stat_sources([s[0] for s in meta['sources']]) or \
+                (zone is not None and meta['zone'] != _lower(zone)):
+            m.close()
+            return False
+        self._map = m
+        self._table = _HEADER.size + meta_len
+        self._mask = nbuckets - 1
+        self._count = nrecords
+        self.zone = meta['zone']
+        self.serial = meta['serial']
+        self._wildcards = frozenset(meta['wildcards'])
+        return True
+
+    def _node(self, name):
+        """
+        Return the offset of the record count for a (lower-case) name, or None
+        """
+        m = self._map
+        key = name.encode('utf-8')
+        h = zlib.crc32(key) & 0xffffffff
+        i = h & self._mask
+        while True:
+            eh, off = _ENTRY.unpack_from(m, self._table + i * _ENTRY.size)
+            if off == 0:
+                return None
+            if eh == h:
+                end = off + 2 + _U16.unpack_from(m, off)[0]
+                if m[off + 2:end] == key:
+                    return end
+            i = (i + 1) & self._mask
+
+    def _wildcard_node(self, name):
+        """
+        Return the offset of the record count for the wildcard that a
+        (lower-case) name with no node of its own matches, or None: the
+        '*.' name of its closest encloser, i.e. its nearest ancestor that
+        exists (RFC 4592)
+        """
+        while name.endswith('.' + self.zone):
+            name = name.split('.', 1)[1]
+            if self._node(name) is not None:
+                if '*.' + name not in self._wildcards:
+                    return None
+                return self._node('*.' + name)
+        return None
+
+    def lookup(self, name):
+        """
+        Return a dict of typename -> list of record dicts for a name, or
+        None if it doesn't exist. The dicts are as in the answers of a
+        pydns DnsResult for a query of that name and type: named as asked,
+        with the RDLENGTH and data of a server's compressed reply (see
+        _compress()), so names in the data keep the case they were written
+        in the zone file, except for any suffix they share with the name
+        asked.
+
+        As with pydnstest.snapshot.ZoneSnapshot.lookup(), an empty
+        non-terminal returns an empty dict, and a name matching a wildcard
+        returns the wildcard's records, named as asked.
+        """
+        name = name.rstrip('.')
+        key = name.lower()
+        off = self._node(key)
+        if off is None and self._wildcards:
+            off = self._wildcard_node(key)
+        if off is None:
+            return None
+        m = self._map
+        count = _U16.unpack_from(m, off)[0]
+        off += 2
+        types = {}
+        # the names in the reply to a query of each type so far, for compression
+        seen = {}
+        for _ in range(count):
+            code, ttl, length = _RECORD.unpack_from(m, off)
+            off += _RECORD.size
+            data = m[off:off + length].decode('utf-8')
+            off += length
+            typename = _typestr(code)
+            if typename not in seen:
+                seen[typename] = {}
+                _compress(name, seen[typename])
+            rdlength, data = _reply_data(typename, data, seen[typename])
+            rr = {'name': name, 'type': code, 'class': 1, 'classstr': 'IN', 'ttl': ttl,
+                  'typename': typename, 'rdlength': rdlength, 'data': data}
+            if typename in types:
+                types[typename].append(rr)
+            else:
+                types[typename] = [rr]
+        return types
+
+    def ptr_records(self, addr):
+        """
+        Return the PTR record dicts for an IPv4 address
+        """
+        types = self.lookup(reverse_name(addr))
+        if types is None:
+            return []
+        return types.get('PTR', [])
+
+    def covers(self, name):
+        """
+        Whether name is in this zone
+        """
+        name = _lower(name)
+        return name == self.zone or name.endswith('.' + self.zone)
+
+    def close(self):
+        self._map.close()
+
+    def __len__(self):
+        return self._count